@@ -0,0 +1,124 @@
+"""Shared setup for the benchmark scripts
+
+The scripts import the server module against DATABASE_URL, which must point
+at a scratch PostgreSQL database: they create users, write cached timelines
+and truncate the cache tables. Background threads are turned off so the
+timings only cover the code under test.
+"""
+
+import gc
+import logging
+import os
+import random
+import string
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKGROUND_DEFAULTS = {
+    'FETCH_WORKER_THREADS': '0',
+    'REAPER_ENABLED': 'false',
+    'RATE_LIMIT_ENABLED': 'false',
+    'INVALIDATION_BUS_ENABLED': 'false',
+    'SHARE_GRAPH_RELOAD_INTERVAL': '0',
+}
+
+
+def load_server(**env):
+    """Import server.py with background threads off; keyword arguments set extra environment"""
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('Set DATABASE_URL to a scratch PostgreSQL database')
+    for key, value in BACKGROUND_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    os.environ.update(env)
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    return server
+
+
+def make_words(rng, count=5000):
+    return [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(count)]
+
+
+def synthetic_tweet(rng, words, tweet_id, author=None):
+    """A cache dict shaped like NormalizedTweet.as_dict(), with random text so compression is realistic"""
+    author = author or rng.choice(words)
+    media = [f'https://pbs.twimg.com/media/{tweet_id}_{i}.jpg' for i in range(rng.choice((0, 0, 0, 1, 2)))]
+    return {
+        'username': author,
+        'name': author.title(),
+        'verified': rng.random() < 0.2,
+        'profile_image_url': f'https://pbs.twimg.com/profile_images/{abs(hash(author)) % 10 ** 9}/photo_normal.jpg',
+        'text': ' '.join(rng.choices(words, k=rng.randint(8, 40))),
+        'tweet_id': str(tweet_id),
+        'created_at': f'2026-10-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+00:00',
+        'url': f'https://twitter.com/{author}/status/{tweet_id}',
+        'media': media,
+        'like_count': rng.randint(0, 50000),
+        'retweet_count': rng.randint(0, 5000),
+        'reply_count': rng.randint(0, 900),
+        'views': str(rng.randint(0, 10 ** 6)),
+    }
+
+
+def tweet_pool(seed, size, first_id=1800000000000000000):
+    rng = random.Random(seed)
+    words = make_words(rng)
+    authors = rng.sample(words, 500)
+    return [synthetic_tweet(rng, words, first_id + i, rng.choice(authors)) for i in range(size)]
+
+
+def create_users(server, prefix, count):
+    """Create or reuse `count` active users named <prefix><n>, return their ids in order"""
+    names = [f'{prefix}{i}' for i in range(count)]
+
+    def insert(cursor):
+        cursor.execute("""
+            INSERT INTO users (username, password_hash, email)
+            SELECT n, 'x', n || '@bench.invalid' FROM unnest(%s::text[]) AS n
+            ON CONFLICT (username) DO UPDATE SET is_active = TRUE
+            RETURNING id, username
+        """, (names,))
+        ids = dict((username, user_id) for user_id, username in cursor.fetchall())
+        return [ids[name] for name in names]
+
+    return server.handle_database_operation(insert)
+
+
+def truncate_cache(server):
+    server.handle_database_operation(
+        lambda cursor: cursor.execute('TRUNCATE user_tweets, timeline_tweets, tweets')
+    )
+
+
+def vacuum(server, *tables):
+    import psycopg
+    with psycopg.connect(server.get_database_url(), autocommit=True) as conn:
+        conn.execute(f"VACUUM ANALYZE {', '.join(tables)}")
+
+
+def best_of(fn, runs, number=1):
+    """Best time in seconds of `runs` repetitions of `number` calls, with GC off"""
+    gc.disable()
+    try:
+        best = float('inf')
+        for _ in range(runs):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            best = min(best, (time.perf_counter() - started) / number)
+        return best
+    finally:
+        gc.enable()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def latency_summary(samples):
+    return (f"p50 {percentile(samples, 0.5) * 1000:.2f} ms, p95 {percentile(samples, 0.95) * 1000:.2f} ms, "
+            f"p99 {percentile(samples, 0.99) * 1000:.2f} ms")
@@ -0,0 +1,91 @@
+"""Bytes stored, encode and decode time of the compact timeline codec vs JSONB
+
+Encodes synthetic 100-tweet timelines as JSONB text and with TimelineCodec
+in both of its formats (zstd + msgpack, and the zlib + JSON fallback), then
+stores each in PostgreSQL to report the on-disk column size after TOAST
+compression. Also runs the codec from several threads at once to check that
+the shared codec is thread safe.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_codec.py
+"""
+
+import argparse
+import random
+import threading
+
+from _common import best_of, load_server, tweet_pool
+
+
+def stored_sizes(server, values):
+    """pg_column_size of each value after storing it in a temporary table"""
+    def query(cursor):
+        cursor.execute('CREATE TEMP TABLE bench_codec (id INT, jsonb_value JSONB, bytea_value BYTEA) ON COMMIT DROP')
+        for i, value in enumerate(values):
+            column = 'bytea_value' if isinstance(value, bytes) else 'jsonb_value'
+            cursor.execute(f'INSERT INTO bench_codec (id, {column}) VALUES (%s, %s)', (i, value))
+        # Sizes read back after the insert reflect TOAST compression
+        cursor.execute('SELECT COALESCE(pg_column_size(jsonb_value), pg_column_size(bytea_value)) '
+                       'FROM bench_codec ORDER BY id')
+        return [row[0] for row in cursor.fetchall()]
+    return server.handle_database_operation(query)
+
+
+def check_threads(codec, timelines, threads=8, rounds=200):
+    errors = []
+
+    def work():
+        try:
+            for i in range(rounds):
+                tweets = timelines[i % len(timelines)]
+                assert codec.decode(codec.encode(tweets)) == tweets
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timelines', type=int, default=20)
+    parser.add_argument('--timeline', type=int, default=100)
+    args = parser.parse_args()
+
+    server = load_server()
+    rng = random.Random(3)
+    pool = tweet_pool(2, 20000)
+    timelines = [rng.sample(pool, args.timeline) for _ in range(args.timelines)]
+
+    zstd = server.TimelineCodec()
+    zlib_json = server.TimelineCodec()
+    zlib_json.format = server.TimelineCodec.FORMAT_ZLIB_JSON
+    if zstd.format != server.TimelineCodec.FORMAT_ZSTD_MSGPACK:
+        print("zstandard/msgpack not installed, both compact rows use the zlib + JSON fallback")
+
+    variants = [
+        ('jsonb', lambda tweets: server.Jsonb(tweets), server.json_encode, server.json_decode),
+        ('zstd+msgpack', None, zstd.encode, zstd.decode),
+        ('zlib+json', None, zlib_json.encode, zlib_json.decode),
+    ]
+    print(f"{args.timelines} timelines of {args.timeline} tweets, averages per timeline")
+    for name, adapt, encode, decode in variants:
+        encoded = [encode(tweets) for tweets in timelines]
+        assert all(decode(data) == tweets for data, tweets in zip(encoded, timelines))
+        raw = sum(len(data) for data in encoded) / len(encoded)
+        stored = stored_sizes(server, [adapt(tweets) if adapt else data
+                                       for tweets, data in zip(timelines, encoded)])
+        encode_time = best_of(lambda: [encode(tweets) for tweets in timelines], 20) / len(timelines)
+        decode_time = best_of(lambda: [decode(data) for data in encoded], 20) / len(timelines)
+        print(f"{name:>13}: {raw / 1024:6.1f} KB encoded, {sum(stored) / len(stored) / 1024:6.1f} KB stored, "
+              f"encode {encode_time * 1000:.2f} ms, decode {decode_time * 1000:.2f} ms")
+
+    errors = check_threads(zstd, timelines)
+    print(f"8 threads sharing one codec: {'ok' if not errors else f'{len(errors)} errors: {errors[0]!r}'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""JSON encode and decode time of the app's helpers vs the stdlib
+
+Serializes a fetch-feed response of 100 synthetic tweets through
+app.json.response(), the path jsonify() takes, in both compact and debug
+(indented) mode, and checks both providers produce the same JSON. Then
+times the JSONB dumper and loader psycopg uses after set_json_dumps() and
+set_json_loads(), and a `SELECT %s::jsonb` round trip of the timeline,
+each against a connection configured with json.dumps and json.loads.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_json.py
+"""
+
+import argparse
+import json
+from datetime import datetime
+
+import psycopg
+from flask.json.provider import DefaultJSONProvider
+from psycopg.adapt import PyFormat
+from psycopg.pq import Format
+from psycopg.types.json import Jsonb, set_json_dumps, set_json_loads
+
+from _common import best_of, load_server, tweet_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tweets', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    server = load_server()
+    app = server.app
+    print(f"orjson installed: {server.orjson is not None}")
+    payload = {
+        'tweets': tweet_pool(5, args.tweets),
+        'fetched_at': datetime.utcnow(),
+        'cached': True,
+        'source_user': 'bench_owner',
+        'count': args.tweets,
+        'version': 1234,
+        'delta': False,
+    }
+    providers = (('flask default', DefaultJSONProvider(app)), ('FastJSONProvider', app.json))
+
+    with app.test_request_context():
+        for compact in (True, False):
+            mode = 'compact' if compact else 'indent=2'
+            bodies = []
+            for label, provider in providers:
+                provider.compact = compact
+                body = provider.response(payload).get_data()
+                bodies.append(body)
+                seconds = best_of(lambda: provider.response(payload).get_data(), args.runs)
+                print(f"{mode:>8} {label:>16}: {seconds * 1000:.3f} ms, {len(body) / 1024:.1f} KB")
+            assert json.loads(bodies[0]) == json.loads(bodies[1]), f'{mode} output differs'
+        print("outputs: same JSON from both providers")
+
+    tweets = payload['tweets']
+    text = json.dumps(tweets, separators=(',', ':')).encode('utf-8')
+    for label, dumps, loads in (('stdlib json', lambda obj: json.dumps(obj, separators=(',', ':')), json.loads),
+                                ('json_encode/decode', server.json_encode, server.json_decode)):
+        encode = best_of(lambda: dumps(tweets), args.runs)
+        decode = best_of(lambda: loads(text), args.runs)
+        assert loads(text) == tweets
+        print(f"{label:>18}: encode {encode * 1000:.3f} ms, decode {decode * 1000:.3f} ms")
+
+    for label, configure in (('stdlib jsonb', use_stdlib_json), ('app jsonb', lambda conn: None)):
+        with psycopg.connect(server.get_database_url()) as conn:
+            configure(conn)
+            dumper = conn.adapters.get_dumper(Jsonb, PyFormat.TEXT)(Jsonb, conn)
+            oid = conn.adapters.types['jsonb'].oid
+            loader = conn.adapters.get_loader(oid, Format.TEXT)(oid, conn)
+            dumped = bytes(dumper.dump(Jsonb(tweets)))
+            assert loader.load(dumped) == tweets
+            dump = best_of(lambda: dumper.dump(Jsonb(tweets)), args.runs)
+            load = best_of(lambda: loader.load(dumped), args.runs)
+
+            def round_trip():
+                return conn.execute('SELECT %s::jsonb', (Jsonb(tweets),)).fetchone()[0]
+            assert round_trip() == tweets
+            trip = best_of(round_trip, args.runs)
+        print(f"{label:>18}: dump {dump * 1000:.3f} ms, load {load * 1000:.3f} ms, "
+              f"SELECT round trip {trip * 1000:.3f} ms")
+
+
+def use_stdlib_json(conn):
+    """Baseline: psycopg's JSONB adaptation with the stdlib, on this connection only"""
+    set_json_dumps(json.dumps, conn)
+    set_json_loads(json.loads, conn)
+
+
+if __name__ == '__main__':
+    main()
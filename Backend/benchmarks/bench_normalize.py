@@ -0,0 +1,132 @@
+"""Tweet normalization stage vs the inline loop it replaced
+
+Builds twikit-like tweets (photos, videos, GIFs, plain text, t.co links and
+the missing attributes twikit leaves out) and checks that normalize_tweets
+produces exactly what the old per-tweet loop in fetch_tweets_for_user did.
+Then it times both on one batch and compares record and dict sizes.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_normalize.py
+"""
+
+import argparse
+import random
+import re
+import sys
+from types import SimpleNamespace
+
+from _common import best_of, load_server, make_words
+
+
+def legacy_normalize(tweets):
+    """The inline loop fetch_tweets_for_user ran before normalize_tweets existed"""
+    tweet_data = []
+    for tweet in tweets:
+        user = tweet.user
+        media_urls = []
+
+        if tweet.media:
+            for media in tweet.media:
+                if media.type == "photo":
+                    url = getattr(media, "media_url_https", None) or getattr(media, "media_url", None)
+                    if url:
+                        media_urls.append(url)
+                elif media.type in ("video", "animated_gif") and hasattr(media, "streams"):
+                    streams = media.streams or []
+                    if streams:
+                        best = streams[-1]
+                        if best.url:
+                            media_urls.append(best.url)
+
+        profile_image_url = getattr(user, "profile_image_url_https", None) or getattr(user, "profile_image_url", None)
+        cleaned_text = re.sub(r"https://t\.co/\w+", "", tweet.full_text).strip()
+
+        tweet_data.append({
+            "username": tweet.user.screen_name,
+            "name": tweet.user.name,
+            "verified": tweet.user.is_blue_verified,
+            "profile_image_url": profile_image_url,
+            "text": cleaned_text,
+            "tweet_id": getattr(tweet, "id", None),
+            "created_at": str(tweet.created_at),
+            "url": f"https://twitter.com/{tweet.user.screen_name}/status/{tweet.id}",
+            "media": media_urls,
+            "like_count": getattr(tweet, "favorite_count", 0),
+            "retweet_count": getattr(tweet, "retweet_count", 0),
+            "reply_count": getattr(tweet, "reply_count", 0),
+            "views": getattr(tweet, "view_count", 0)
+        })
+    return tweet_data
+
+
+def fake_media(rng, tweet_id, index):
+    kind = rng.choice(("photo", "photo", "video", "animated_gif", "unknown"))
+    if kind == "photo":
+        if rng.random() < 0.2:
+            return SimpleNamespace(type=kind, media_url=f"http://pbs.twimg.com/media/{tweet_id}_{index}.jpg")
+        return SimpleNamespace(type=kind, media_url_https=f"https://pbs.twimg.com/media/{tweet_id}_{index}.jpg")
+    if kind == "unknown":
+        return SimpleNamespace(type="unknown")
+    streams = [SimpleNamespace(url=f"https://video.twimg.com/{tweet_id}_{index}_{q}.mp4") for q in range(rng.randint(0, 3))]
+    if streams and rng.random() < 0.1:
+        streams[-1].url = None
+    return SimpleNamespace(type=kind, streams=streams if rng.random() < 0.9 else None)
+
+
+def fake_tweets(seed, count):
+    rng = random.Random(seed)
+    words = make_words(rng, 2000)
+    tweets = []
+    for i in range(count):
+        tweet_id = str(1700000000000000000 + i)
+        screen_name = rng.choice(words)
+        user = SimpleNamespace(screen_name=screen_name, name=screen_name.title(), is_blue_verified=rng.random() < 0.3)
+        if rng.random() < 0.9:
+            user.profile_image_url_https = f"https://pbs.twimg.com/profile_images/{i}/a_normal.jpg"
+        else:
+            user.profile_image_url = f"http://pbs.twimg.com/profile_images/{i}/a_normal.jpg"
+        text = ' '.join(rng.choices(words, k=rng.randint(3, 40)))
+        for _ in range(rng.randint(0, 2)):
+            text += f" https://t.co/{''.join(rng.choices(words[0] + words[1] + '0123456789', k=10))}"
+        tweet = SimpleNamespace(
+            id=tweet_id, user=user, full_text=f"  {text} ",
+            created_at=f"Mon Oct {rng.randint(10, 28)} 12:{rng.randint(10, 59)}:00 +0000 2026",
+            media=[fake_media(rng, tweet_id, m) for m in range(rng.choice((0, 0, 0, 1, 2, 4)))] or None,
+        )
+        # twikit leaves counters unset on some tweet shapes
+        for attribute, top in (('favorite_count', 50000), ('retweet_count', 5000),
+                               ('reply_count', 900), ('view_count', 10 ** 6)):
+            if rng.random() < 0.95:
+                setattr(tweet, attribute, rng.randint(0, top))
+        tweets.append(tweet)
+    return tweets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tweets', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=60)
+    args = parser.parse_args()
+
+    server = load_server()
+    tweets = fake_tweets(37, args.tweets)
+
+    expected = legacy_normalize(tweets)
+    actual = [record.as_dict() for record in server.normalize_tweets(tweets)]
+    mismatches = [i for i, (old, new) in enumerate(zip(expected, actual)) if old != new]
+    if len(expected) != len(actual) or mismatches:
+        sys.exit(f"normalize_tweets differs from the old loop on {len(mismatches)} tweets, first {mismatches[:5]}")
+    print(f"equivalence: {len(actual)} tweets identical to the old loop")
+
+    legacy = best_of(lambda: legacy_normalize(tweets), args.runs)
+    records = best_of(lambda: server.normalize_tweets(tweets), args.runs)
+    dicts = best_of(lambda: [record.as_dict() for record in server.normalize_tweets(tweets)], args.runs)
+    print(f"old inline loop:          {legacy * 1000:.1f} ms")
+    print(f"normalize_tweets records: {records * 1000:.1f} ms")
+    print(f"records as cache dicts:   {dicts * 1000:.1f} ms")
+
+    record = server.normalize_tweets(tweets[:1])[0]
+    print(f"record size: {sys.getsizeof(record)} B, dict size: {sys.getsizeof(record.as_dict())} B")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Per-request database time of a cached feed fetch with and without prepared statements
+
+Runs the script once per DB_PREPARED_STATEMENTS setting in a child process,
+since the setting is read at import and applied when pool connections are
+opened. Each child serves cached /api/fetch-feed requests through the Flask
+test client and reads the db and db-wait phases back from Server-Timing.
+It also checks that a connection with prepared statements disabled ends up
+with none, even after psycopg's automatic prepare threshold.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_prepared.py
+"""
+
+import argparse
+import os
+import random
+import secrets
+import subprocess
+import sys
+
+from _common import create_users, latency_summary, load_server, tweet_pool
+
+
+def server_timing(response):
+    phases = {}
+    for entry in response.headers['Server-Timing'].split(', '):
+        name, duration = entry.split(';dur=')
+        phases[name] = float(duration) / 1000
+    return phases
+
+
+def prepared_statement_count(server):
+    """Prepared statements on a fresh pool-configured connection after repeated hot queries"""
+    import psycopg
+    with psycopg.connect(server.get_database_url()) as conn:
+        server.configure_connection(conn)
+        with conn.cursor() as cursor:
+            for _ in range(10):
+                server.execute_hot(cursor, 'health_check').fetchone()
+            cursor.execute('SELECT count(*) FROM pg_prepared_statements')
+            return cursor.fetchone()[0]
+
+
+def run_child(args):
+    server = load_server()
+    rng = random.Random(31)
+    owners = create_users(server, 'bench_prep_owner_', args.owners)
+    viewers = create_users(server, 'bench_prep_viewer_', args.owners)
+    pool = tweet_pool(4, 5000)
+
+    def setup(cursor):
+        for i, (owner_id, viewer_id) in enumerate(zip(owners, viewers)):
+            cursor.execute('INSERT INTO feed_shares (owner_id, shared_with_id) VALUES (%s, %s) ON CONFLICT DO NOTHING',
+                           (owner_id, viewer_id))
+            cursor.execute('INSERT INTO feed_fetches (user_id, fetch_from_id) VALUES (%s, %s) ON CONFLICT DO NOTHING',
+                           (viewer_id, owner_id))
+            server.save_user_cookies(cursor, f'bench_prep_owner_{i}', {'auth_token': 'x', 'ct0': 'y'})
+            server.tweet_store.store_timeline(cursor, viewer_id, owner_id, rng.sample(pool, args.timeline))
+    server.handle_database_operation(setup)
+
+    client = server.app.test_client()
+    pairs = []
+    for i in range(args.owners):
+        headers = {
+            'Authorization': f'Bearer {server.generate_jwt_token(f"bench_prep_viewer_{i}")}',
+            'X-Trace-Request': '1',
+            'X-Admin-Token': server.ADMIN_TOKEN,
+        }
+        pairs.append((f'bench_prep_owner_{i}', headers))
+
+    db, db_wait = [], []
+    for i in range(args.warmup + args.requests):
+        owner, headers = rng.choice(pairs)
+        response = client.post(f'/api/fetch-feed/{owner}', headers=headers)
+        assert response.status_code == 200, response.get_json()
+        if i >= args.warmup:
+            phases = server_timing(response)
+            db.append(phases['db'])
+            db_wait.append(phases['db-wait'])
+
+    label = 'prepared' if server.DB_PREPARED_STATEMENTS else 'unprepared'
+    print(f"{label:>10}: db {latency_summary(db)}, mean {sum(db) / len(db) * 1000:.3f} ms")
+    print(f"{'':>10}  db-wait {latency_summary(db_wait)}")
+    print(f"{'':>10}  prepared statements on a configured connection: {prepared_statement_count(server)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--owners', type=int, default=50)
+    parser.add_argument('--timeline', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--warmup', type=int, default=300)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    for enabled in ('true', 'false'):
+        env = dict(os.environ, DB_PREPARED_STATEMENTS=enabled, ADMIN_TOKEN=secrets.token_hex(16))
+        subprocess.run([sys.executable, __file__, '--child', *sys.argv[1:]], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
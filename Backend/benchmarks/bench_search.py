@@ -0,0 +1,139 @@
+"""Search latency over a cached corpus of hundreds of thousands of tweets
+
+Loads --tweets distinct tweets into the normalized layout, one cached
+timeline per feed owner, with word frequencies following a Zipf
+distribution so common terms match a large share of the corpus. Then it
+serves /api/search through the Flask test client for viewers who can
+search a few owners or every owner. For each query it reports the total
+request latency and the database time from the response's took_ms, and
+on the default corpus exits non-zero when a query's database p50 is over
+its target in P50_TARGETS_MS.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_search.py
+"""
+
+import argparse
+import itertools
+import random
+import sys
+import time
+
+from _common import (create_users, latency_summary, load_server, make_words, percentile, synthetic_tweet,
+                     truncate_cache, vacuum)
+
+DEFAULT_TWEETS = 300000
+DEFAULT_OWNERS = 600
+
+# Database p50 bounds in ms on the default corpus, about 1.5x what the
+# GIN-first plan measured. Small scopes search 10 owners, 'all' every owner.
+P50_TARGETS_MS = {
+    'small': {label: 25 for label in ('most common word', 'common word', 'rare word', 'two words', 'phrase',
+                                      'no match')},
+    'all': {
+        'most common word': 300,
+        'common word': 150,
+        'rare word': 15,
+        'two words': 35,
+        'phrase': 225,
+        'no match': 15,
+    },
+}
+
+
+def zipf_corpus(rng, size, first_id=1900000000000000000):
+    words = make_words(rng, 20000)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    tweets = []
+    for i in range(size):
+        tweet = synthetic_tweet(rng, words, first_id + i)
+        tweet['text'] = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(8, 40)))
+        tweets.append(tweet)
+    return words, tweets
+
+
+def load_corpus(server, owners, crawler_id, tweets):
+    truncate_cache(server)
+    per_owner = len(tweets) // len(owners)
+    started = time.perf_counter()
+    for i, owner_id in enumerate(owners):
+        timeline = tweets[i * per_owner:(i + 1) * per_owner]
+        server.handle_database_operation(
+            lambda cursor: server.tweet_store.store_timeline(cursor, crawler_id, owner_id, timeline)
+        )
+    vacuum(server, 'user_tweets', 'timeline_tweets', 'tweets')
+    return time.perf_counter() - started
+
+
+def grant(server, viewer_id, owner_ids):
+    def insert(cursor):
+        cursor.execute('DELETE FROM feed_fetches WHERE user_id = %s', (viewer_id,))
+        cursor.execute("""
+            INSERT INTO feed_fetches (user_id, fetch_from_id)
+            SELECT %s, o FROM unnest(%s::int[]) AS o
+        """, (viewer_id, owner_ids))
+    server.handle_database_operation(insert)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tweets', type=int, default=DEFAULT_TWEETS)
+    parser.add_argument('--owners', type=int, default=DEFAULT_OWNERS)
+    parser.add_argument('--small-scope', type=int, default=10, help='owners the small-scope viewer can search')
+    parser.add_argument('--repeat', type=int, default=50, help='requests per query and scope')
+    args = parser.parse_args()
+
+    server = load_server(TWEET_STORAGE='normalized')
+    rng = random.Random(36)
+    words, tweets = zipf_corpus(rng, args.tweets)
+    owners = create_users(server, 'bench_search_owner_', args.owners)
+    crawler_id, small_id, large_id = create_users(server, 'bench_search_viewer_', 3)
+
+    ingest = load_corpus(server, owners, crawler_id, tweets)
+    print(f"loaded {args.tweets} tweets into {args.owners} timelines in {ingest:.1f}s")
+
+    grant(server, small_id, rng.sample(owners, args.small_scope))
+    grant(server, large_id, owners)
+    server.share_graph.load()
+
+    queries = {
+        'most common word': words[0],
+        'common word': words[20],
+        'rare word': words[5000],
+        'two words': f'{words[3]} {words[40]}',
+        'phrase': f'"{words[0]} {words[1]}"',
+        'no match': 'zzzzzzzzzz',
+    }
+    client = server.app.test_client()
+    scopes = (('bench_search_viewer_1', f'{args.small_scope} owners', 'small'),
+              ('bench_search_viewer_2', f'{args.owners} owners', 'all'))
+    check_targets = args.tweets == DEFAULT_TWEETS and args.owners == DEFAULT_OWNERS
+    missed = []
+    for username, scope, target_class in scopes:
+        headers = {'Authorization': f'Bearer {server.generate_jwt_token(username)}'}
+        print(f"\nscope: {scope}")
+        for label, query in queries.items():
+            total, database = [], []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.get('/api/search', query_string={'q': query}, headers=headers)
+                total.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.get_json()
+                database.append(response.get_json()['took_ms'] / 1000)
+            count = response.get_json()['count']
+            print(f"  {label:>16} ({count:>2} results): total {latency_summary(total)}")
+            print(f"  {'':>16}               db    {latency_summary(database)}")
+            target = P50_TARGETS_MS[target_class][label]
+            p50_ms = percentile(database, 0.5) * 1000
+            if check_targets and p50_ms > target:
+                missed.append(f"{scope} {label}: db p50 {p50_ms:.2f} ms over {target} ms")
+
+    if not check_targets:
+        print("\nlatency targets apply to the default corpus only, not checked")
+    elif missed:
+        sys.exit('search latency targets missed:\n  ' + '\n  '.join(missed))
+    else:
+        print("\nall search latency targets met")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Sharing with and revoking from many users: one request per user vs the batch endpoints
+
+Creates an owner and --users targets, then through the Flask test client
+times --users single /api/share-feed and /api/unshare-feed/<username>
+requests against one /api/share-feed/batch and /api/unshare-feed/batch
+request for the same users. After each phase it checks feed_shares and
+feed_fetches hold exactly the expected rows, so both paths do the same work.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_share_batch.py
+"""
+
+import argparse
+import statistics
+import time
+
+from _common import create_users, load_server
+
+
+def share_rows(server, owner_id):
+    def count(cursor):
+        cursor.execute("""
+            SELECT (SELECT count(*) FROM feed_shares WHERE owner_id = %s),
+                   (SELECT count(*) FROM feed_fetches WHERE fetch_from_id = %s)
+        """, (owner_id, owner_id))
+        return cursor.fetchone()
+    return server.handle_database_operation(count)
+
+
+def timed(requests):
+    started = time.perf_counter()
+    for request in requests:
+        response = request()
+        assert response.status_code < 300, response.get_json()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    server = load_server()
+    owner_id, = create_users(server, 'bench_batch_owner_', 1)
+    create_users(server, 'bench_batch_target_', args.users)
+    targets = [f'bench_batch_target_{i}' for i in range(args.users)]
+
+    def reset(cursor):
+        cursor.execute('DELETE FROM feed_shares WHERE owner_id = %s', (owner_id,))
+        cursor.execute('DELETE FROM feed_fetches WHERE fetch_from_id = %s', (owner_id,))
+    server.handle_database_operation(reset)
+    server.share_graph.load()
+
+    client = server.app.test_client()
+    headers = {'Authorization': f'Bearer {server.generate_jwt_token("bench_batch_owner_0")}'}
+    phases = {
+        'share, one request per user': [
+            lambda username=username: client.post('/api/share-feed', json={'share_with': username}, headers=headers)
+            for username in targets
+        ],
+        'unshare, one request per user': [
+            lambda username=username: client.delete(f'/api/unshare-feed/{username}', headers=headers)
+            for username in targets
+        ],
+        'share, one batch request': [
+            lambda: client.post('/api/share-feed/batch', json={'usernames': targets}, headers=headers)
+        ],
+        'unshare, one batch request': [
+            lambda: client.post('/api/unshare-feed/batch', json={'usernames': targets}, headers=headers)
+        ],
+    }
+
+    timings = {label: [] for label in phases}
+    for _ in range(args.runs):
+        for label, requests in phases.items():
+            timings[label].append(timed(requests))
+            expected = (0, 0) if label.startswith('unshare') else (args.users, args.users)
+            assert share_rows(server, owner_id) == expected, f'{label}: unexpected share rows'
+    assert server.share_graph.verify() == {}
+
+    print(f"{args.users} users, median of {args.runs} runs")
+    for label, seconds in timings.items():
+        median = statistics.median(seconds)
+        print(f"  {label:>30}: {median * 1000:8.1f} ms, {median / args.users * 10 ** 6:7.1f} us per user")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Storage size and read latency of the normalized timeline layout vs the JSONB blob layout
+
+Builds the same synthetic dataset under each layout: owners whose 100-tweet
+timelines are drawn from a shared pool of tweets, cached once per viewer.
+Reports total on-disk size of the cache tables (heap, TOAST and indexes),
+ingest time and load_timeline latency.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_storage.py
+"""
+
+import argparse
+import random
+import time
+
+from _common import create_users, latency_summary, load_server, truncate_cache, tweet_pool, vacuum
+
+CACHE_TABLES = ('user_tweets', 'timeline_tweets', 'tweets')
+
+
+def table_sizes(server):
+    def query(cursor):
+        cursor.execute("""
+            SELECT relname, pg_relation_size(oid), pg_total_relation_size(reltoastrelid), pg_indexes_size(oid)
+            FROM pg_class
+            WHERE relname = ANY(%s) AND relkind = 'r'
+        """, (list(CACHE_TABLES),))
+        return {name: (heap, toast or 0, indexes) for name, heap, toast, indexes in cursor.fetchall()}
+    return server.handle_database_operation(query)
+
+
+def run_layout(server, layout, timelines, reads, rng):
+    store = server.TweetStore(layout)
+    truncate_cache(server)
+
+    started = time.perf_counter()
+    for viewer_id, owner_id, tweets in timelines:
+        server.handle_database_operation(
+            lambda cursor: store.store_timeline(cursor, viewer_id, owner_id, tweets)
+        )
+    ingest = time.perf_counter() - started
+    vacuum(server, *CACHE_TABLES)
+    sizes = table_sizes(server)
+
+    samples = []
+    for _ in range(reads):
+        viewer_id, owner_id, tweets = rng.choice(timelines)
+        started = time.perf_counter()
+        loaded = server.handle_database_operation(
+            lambda cursor: store.load_timeline(cursor, viewer_id, owner_id)
+        )
+        samples.append(time.perf_counter() - started)
+        assert len(loaded[0]) == len(tweets)
+
+    total = sum(sum(parts) for parts in sizes.values())
+    detail = ', '.join(f"{name} {sum(parts) / 1e6:.1f} MB (heap {parts[0] / 1e6:.1f}, toast {parts[1] / 1e6:.1f}, "
+                       f"indexes {parts[2] / 1e6:.1f})" for name, parts in sizes.items())
+    print(f"{layout:>10}: {total / 1e6:.1f} MB ({detail})")
+    print(f"{'':>10}  ingest {ingest:.1f}s ({ingest / len(timelines) * 1000:.2f} ms per timeline)")
+    print(f"{'':>10}  load_timeline {latency_summary(samples)}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--owners', type=int, default=200)
+    parser.add_argument('--viewers', type=int, default=5, help='viewers caching each owner timeline')
+    parser.add_argument('--pool', type=int, default=20000, help='distinct tweets timelines draw from')
+    parser.add_argument('--timeline', type=int, default=100)
+    parser.add_argument('--reads', type=int, default=2000)
+    args = parser.parse_args()
+
+    server = load_server()
+    rng = random.Random(7)
+    pool = tweet_pool(1, args.pool)
+    owners = create_users(server, 'bench_owner_', args.owners)
+    viewers = create_users(server, 'bench_viewer_', args.owners * args.viewers)
+
+    timelines = []
+    for i, owner_id in enumerate(owners):
+        tweets = rng.sample(pool, args.timeline)
+        for viewer_id in viewers[i * args.viewers:(i + 1) * args.viewers]:
+            timelines.append((viewer_id, owner_id, tweets))
+    print(f"{len(timelines)} cached timelines of {args.timeline} tweets from a pool of {args.pool}")
+
+    blob = run_layout(server, 'jsonb', timelines, args.reads, rng)
+    normalized = run_layout(server, 'normalized', timelines, args.reads, rng)
+    print(f"jsonb / normalized size: {blob / normalized:.2f}x")
+    truncate_cache(server)
+
+
+if __name__ == '__main__':
+    main()
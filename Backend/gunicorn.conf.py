@@ -0,0 +1,19 @@
+"""gunicorn settings for the VisionX backend
+
+    gunicorn -c gunicorn.conf.py server:app
+
+A worker drains its fetch threads as soon as it receives SIGTERM instead of
+after its last request, and gets enough graceful_timeout for the drain and
+the hand-off of cancelled crawls.
+"""
+
+import os
+
+graceful_timeout = int(float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', 20))) + 10
+
+
+def post_worker_init(worker):
+    # Runs in the worker's main thread after gunicorn installed its own signal
+    # handlers, which install_shutdown_handler chains to
+    import server
+    server.install_shutdown_handler()
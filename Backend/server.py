@@ -1,9 +1,11 @@
 # Debugged and Enhanced Flask Chrome Extension Backend API
 # This version includes comprehensive error handling, logging, and security improvements
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_request_context, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import psycopg
+from psycopg.types.json import Jsonb, set_json_dumps, set_json_loads
 from psycopg_pool import ConnectionPool, PoolTimeout
 import bcrypt
 import jwt
@@ -13,15 +15,47 @@ import logging
 import re
 from datetime import datetime, timedelta
 import secrets
+import socket
+import sys
 from urllib.parse import urlparse
 from functools import wraps
 import time
 import json
 import asyncio
-import json
+import math
 import tempfile
+import zlib
+import atexit
+import signal
+import base64
+import hashlib
+import hmac
+import mmap
+import urllib.error
+import urllib.request
+from collections import Counter, OrderedDict
+from itertools import islice
 from twikit import Client
-from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Optional, used by the compact timeline codec when installed
+    import zstandard
+    import msgpack
+except ImportError:
+    zstandard = None
+    msgpack = None
+
+try:
+    # Optional, faster JSON for API responses and JSONB columns
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Unix only, lets gunicorn workers take turns trimming the media cache
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 app = Flask(__name__)
@@ -33,16 +67,241 @@ CORS(app, supports_credentials=True)
 SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 app.config['SECRET_KEY'] = SECRET_KEY
 
-# Thread pool for async operations
-tweet_executor = ThreadPoolExecutor(max_workers=5)
+# Timeline cache layout: 'normalized' stores each tweet once plus ordered
+# timeline membership rows, 'jsonb' keeps the legacy per-timeline blob and
+# 'compact' stores a compressed columnar encoding in a bytea column
+TWEET_STORAGE = os.environ.get('TWEET_STORAGE', 'normalized').lower()
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Expired cache reaper: rows per DELETE, pause between batches and seconds between passes
+REAPER_ENABLED = os.environ.get('REAPER_ENABLED', 'true').lower() == 'true'
+REAPER_BATCH_SIZE = int(os.environ.get('REAPER_BATCH_SIZE', 500))
+REAPER_BATCH_PAUSE = float(os.environ.get('REAPER_BATCH_PAUSE', 0.2))
+REAPER_INTERVAL = float(os.environ.get('REAPER_INTERVAL', 300))
+
+# Rate limiting: 'memory' counts per process, 'postgres' shares counters across workers
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory').lower()
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS', 'false').lower() == 'true'
+
+# Cross-worker cache invalidation over PostgreSQL LISTEN/NOTIFY
+INVALIDATION_BUS_ENABLED = os.environ.get('INVALIDATION_BUS_ENABLED', 'true').lower() == 'true'
+INVALIDATION_CHANNEL = 'visionx_invalidation'
+# Without the bus other workers' share changes only reach the share graph on a periodic reload
+SHARE_GRAPH_RELOAD_INTERVAL = float(os.environ.get('SHARE_GRAPH_RELOAD_INTERVAL', 30))
+
+# Server-side prepared statements for HOT_QUERIES, disable behind transaction-pooling proxies
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+
+# Optional read replica: max tolerated replay lag, primary pin after a write and lag probe interval
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+
+# Fetch job queue: worker threads per process, idle poll interval, seconds
+# without a heartbeat before a running job is recovered, attempts before failing
+# and how long fetch-feed waits for its job
+FETCH_WORKER_THREADS = int(os.environ.get('FETCH_WORKER_THREADS', 5))
+FETCH_POLL_INTERVAL = float(os.environ.get('FETCH_POLL_INTERVAL', 1))
+FETCH_JOB_STALE_AFTER = float(os.environ.get('FETCH_JOB_STALE_AFTER', 120))
+FETCH_JOB_MAX_ATTEMPTS = int(os.environ.get('FETCH_JOB_MAX_ATTEMPTS', 3))
+FETCH_WAIT_TIMEOUT = float(os.environ.get('FETCH_WAIT_TIMEOUT', 300))
+# With the invalidation bus on, fetch-feed waits for the job's finish event and
+# polls only as a fallback, backing off up to this many seconds between polls
+FETCH_WAIT_MAX_POLL = 15
+
+# Fair scheduling: running jobs allowed per requester and per feed owner, the
+# window over which recent usage lowers a requester's turn, and per-requester
+# weights (FETCH_REQUESTER_WEIGHTS=alice=4,bob=2, everyone else 1). A weight-2
+# requester gets twice the running jobs and twice the recent share.
+FETCH_MAX_PER_REQUESTER = int(os.environ.get('FETCH_MAX_PER_REQUESTER', 2))
+FETCH_MAX_PER_OWNER = int(os.environ.get('FETCH_MAX_PER_OWNER', 1))
+FETCH_FAIRNESS_WINDOW = float(os.environ.get('FETCH_FAIRNESS_WINDOW', 600))
+FETCH_REQUESTER_WEIGHTS = {
+    username.strip(): float(weight)
+    for username, weight in (
+        item.split('=') for item in os.environ.get('FETCH_REQUESTER_WEIGHTS', '').split(',') if item.strip()
+    )
+}
+FETCH_PRIORITY_INTERACTIVE = 0
+FETCH_PRIORITY_BACKGROUND = 1
+
+# Most usernames in one batch share or unshare request, which also keeps the
+# batch's NOTIFY payload well under PostgreSQL's 8000 byte limit
+SHARE_BATCH_MAX = 500
+
+# Request deadlines in seconds: the default budget, per-endpoint overrides and
+# the crawl budget for background fetch jobs. Interactive fetch jobs get what
+# is left of the request budget minus FETCH_DEADLINE_MARGIN for storing and
+# reading back the timeline; the request waits for the job until only
+# FETCH_READBACK_MARGIN is left, so a job that hits its deadline is still seen.
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 15))
+REQUEST_DEADLINES = {
+    'health_check': 5,
+    'verify_token': 5,
+    'fetch_user_feed': FETCH_WAIT_TIMEOUT,
+    'cleanup_expired_tweets': 300,
+    'verify_share_graph': 60,
+    'media_proxy': 30,
+}
+FETCH_JOB_DEADLINE = float(os.environ.get('FETCH_JOB_DEADLINE', 240))
+FETCH_DEADLINE_MARGIN = 5
+FETCH_READBACK_MARGIN = 1
+
+# Graceful shutdown: seconds in-flight crawls get to finish, then seconds for
+# cancelled crawls to save partial results. Keep the sum under the process
+# manager's kill timeout (gunicorn's graceful_timeout defaults to 30).
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', 20))
+SHUTDOWN_HANDOFF_TIMEOUT = 5
+
+# Media proxy: off by default. When enabled, fetch-feed responses point
+# profile images and media at /api/media, which fetches each URL from the
+# origin once and serves it from a bounded on-disk cache.
+MEDIA_PROXY_ENABLED = os.environ.get('MEDIA_PROXY_ENABLED', 'false').lower() == 'true'
+MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR', 'media_cache')
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+MEDIA_MAX_OBJECT_BYTES = int(os.environ.get('MEDIA_MAX_OBJECT_BYTES', 32 * 1024 * 1024))
+MEDIA_ALLOWED_HOSTS = frozenset(
+    os.environ.get('MEDIA_ALLOWED_HOSTS', 'pbs.twimg.com,video.twimg.com,abs.twimg.com').split(',')
+)
+MEDIA_FETCH_TIMEOUT = 10
+MEDIA_CHUNK_SIZE = 256 * 1024
+MEDIA_CACHE_LOW_WATERMARK = 0.9  # eviction trims to this share of max_bytes
+MEDIA_CACHE_SCAN_FRACTION = 0.01  # share of max_bytes a worker writes between scans
+MEDIA_TMP_MAX_AGE = 3600  # older temp files were left by a crash, not a fetch in progress
+
+def pool_class_config(workload, default):
+    """Read DB_POOL_<WORKLOAD>=min,max,timeout, e.g. DB_POOL_AUTH=2,4,2"""
+    value = os.environ.get(f'DB_POOL_{workload.upper()}', default)
+    min_size, max_size, timeout = value.split(',')
+    return int(min_size), int(max_size), float(timeout)
+
+# Bulkheaded connection pools: (min_size, max_size, checkout timeout) per
+# workload class, so crawls writing large timelines and maintenance deletes
+# cannot take the connections that login, verify and health checks need.
+# 'list' serves every other request, 'cache_write' the fetch workers and
+# 'maintenance' background threads.
+DB_POOL_CLASSES = {
+    'auth': pool_class_config('auth', '2,4,2'),
+    'list': pool_class_config('list', '2,8,5'),
+    'cache_write': pool_class_config('cache_write', '1,6,15'),
+    'maintenance': pool_class_config('maintenance', '1,2,30'),
+}
+ENDPOINT_WORKLOADS = {
+    'register': 'auth',
+    'login': 'auth',
+    'logout': 'auth',
+    'verify_token': 'auth',
+    'get_profile': 'auth',
+    'health_check': 'auth',
+    'cleanup_expired_tweets': 'maintenance',
+    'verify_share_graph': 'maintenance',
+}
+
+# t.co links are stripped from tweet text during normalization
+TCO_LINK_PATTERN = re.compile(r"https://t\.co/\w+")
+VIDEO_MEDIA_TYPES = frozenset(("video", "animated_gif"))
+
+class NormalizedTweet:
+    """Compact record for one tweet as stored in the timeline cache"""
+
+    __slots__ = ('username', 'name', 'verified', 'profile_image_url', 'text', 'tweet_id',
+                 'created_at', 'url', 'media', 'like_count', 'retweet_count', 'reply_count', 'views')
+
+    def __init__(self, username, name, verified, profile_image_url, text, tweet_id,
+                 created_at, url, media, like_count, retweet_count, reply_count, views):
+        self.username = username
+        self.name = name
+        self.verified = verified
+        self.profile_image_url = profile_image_url
+        self.text = text
+        self.tweet_id = tweet_id
+        self.created_at = created_at
+        self.url = url
+        self.media = media
+        self.like_count = like_count
+        self.retweet_count = retweet_count
+        self.reply_count = reply_count
+        self.views = views
+
+    def as_dict(self):
+        return {
+            "username": self.username,
+            "name": self.name,
+            "verified": self.verified,
+            "profile_image_url": self.profile_image_url,
+            "text": self.text,
+            "tweet_id": self.tweet_id,
+            "created_at": self.created_at,
+            "url": self.url,
+            "media": self.media,
+            "like_count": self.like_count,
+            "retweet_count": self.retweet_count,
+            "reply_count": self.reply_count,
+            "views": self.views
+        }
+
+def extract_media_urls(media_items):
+    """Best URL per photo, and the last (highest quality) stream per video or GIF"""
+    media_urls = []
+    for media in media_items:
+        media_type = media.type
+        if media_type == "photo":
+            url = getattr(media, "media_url_https", None) or getattr(media, "media_url", None)
+            if url:
+                media_urls.append(url)
+        elif media_type in VIDEO_MEDIA_TYPES:
+            streams = getattr(media, "streams", None)
+            if streams and streams[-1].url:
+                media_urls.append(streams[-1].url)
+    return media_urls
+
+def normalize_tweets(tweets):
+    """Normalize a batch of twikit tweets into NormalizedTweet records"""
+    strip_links = TCO_LINK_PATTERN.sub
+    records = []
+    append = records.append
+    for tweet in tweets:
+        user = tweet.user
+        screen_name = user.screen_name
+        tweet_id = getattr(tweet, "id", None)
+        media = tweet.media
+        append(NormalizedTweet(
+            screen_name,
+            user.name,
+            user.is_blue_verified,
+            getattr(user, "profile_image_url_https", None) or getattr(user, "profile_image_url", None),
+            strip_links("", tweet.full_text).strip(),
+            tweet_id,
+            str(tweet.created_at),
+            f"https://twitter.com/{screen_name}/status/{tweet_id}",
+            extract_media_urls(media) if media else [],
+            getattr(tweet, "favorite_count", 0),
+            getattr(tweet, "retweet_count", 0),
+            getattr(tweet, "reply_count", 0),
+            getattr(tweet, "view_count", 0)
+        ))
+    return records
+
+class CrawlProgress:
+    """Tweets collected so far and the cursor of the next timeline page
+
+    Shared with the caller so a cancelled crawl can save what it fetched and
+    a later crawl can continue from the cursor.
+    """
+
+    __slots__ = ('tweets', 'cursor')
+
+    def __init__(self, tweets=None, cursor=None):
+        self.tweets = tweets if tweets is not None else []
+        self.cursor = cursor
 
 class TweetFetcher:
-    def __init__(self):
-        self.active_fetches = {}  # Track ongoing fetches
-        self.fetch_lock = threading.Lock()
-    
-    async def fetch_tweets_for_user(self, cookies_dict, user_id, fetch_from_id):
-        """Fetch tweets using twikit with user-specific cookies"""
+    async def fetch_tweets_for_user(self, cookies_dict, user_id, fetch_from_id, progress=None):
+        """Fetch tweets using twikit with user-specific cookies, continuing from progress if given"""
         try:
             client = Client()
             
@@ -55,49 +314,16 @@ class TweetFetcher:
                 # Load cookies from temporary file
                 client.load_cookies(path=temp_cookie_path)
                 
-                tweet_data = []
-                tweets = await client.get_timeline(count=20)
+                if progress is None:
+                    progress = CrawlProgress()
+                tweet_data = progress.tweets
+                tweets = await client.get_timeline(count=20, cursor=progress.cursor)
                 
                 while tweets and len(tweet_data) < 100:
-                    for tweet in tweets:
-                        user = tweet.user
-                        media_urls = []
-                        
-                        # Handle media (same logic as main.py)
-                        if tweet.media:
-                            for media in tweet.media:
-                                if media.type == "photo":
-                                    url = getattr(media, "media_url_https", None) or getattr(media, "media_url", None)
-                                    if url:
-                                        media_urls.append(url)
-                                elif media.type in ("video", "animated_gif") and hasattr(media, "streams"):
-                                    streams = media.streams or []
-                                    if streams:
-                                        best = streams[-1]
-                                        if best.url:
-                                            media_urls.append(best.url)
-                        
-                        profile_image_url = getattr(user, "profile_image_url_https", None) or getattr(user, "profile_image_url", None)
-                        cleaned_text = re.sub(r"https://t\.co/\w+", "", tweet.full_text).strip()
-                        
-                        tweet_data.append({
-                            "username": tweet.user.screen_name,
-                            "name": tweet.user.name,
-                            "verified": tweet.user.is_blue_verified,
-                            "profile_image_url": profile_image_url,
-                            "text": cleaned_text,
-                            "tweet_id": getattr(tweet, "id", None),
-                            "created_at": str(tweet.created_at),
-                            "url": f"https://twitter.com/{tweet.user.screen_name}/status/{tweet.id}",
-                            "media": media_urls,
-                            "like_count": getattr(tweet, "favorite_count", 0),
-                            "retweet_count": getattr(tweet, "retweet_count", 0),
-                            "reply_count": getattr(tweet, "reply_count", 0),
-                            "views": getattr(tweet, "view_count", 0)
-                        })
-                        
-                        if len(tweet_data) >= 100:
-                            break
+                    # Normalize the page as one batch, separate from pagination
+                    page = list(islice(tweets, 100 - len(tweet_data)))
+                    tweet_data.extend(tweet.as_dict() for tweet in normalize_tweets(page))
+                    progress.cursor = tweets.next_cursor
                     
                     if len(tweet_data) >= 100:
                         break
@@ -119,15 +345,11 @@ class TweetFetcher:
 # Global tweet fetcher instance
 tweet_fetcher = TweetFetcher()
 
-# Database connection pool
-db_pool = None
-db_lock = threading.Lock()
-
-def init_database_pool():
-    """Initialize PostgreSQL connection pool using psycopg3 with enhanced error handling"""
-    global db_pool
+# Database connection pools, one per workload class
+db_pools = {}
 
-    # Get database URL from environment variable
+def get_database_url():
+    """Read DATABASE_URL from the environment, normalizing the postgres:// scheme"""
     database_url = os.environ.get('DATABASE_URL')
 
     if not database_url:
@@ -137,23 +359,40 @@ def init_database_pool():
     # Parse the database URL to handle different formats
     if database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    return database_url
+
+def configure_connection(conn):
+    """Pool configure callback for new connections"""
+    if not DB_PREPARED_STATEMENTS:
+        # psycopg prepares any query run 5 times by default, which breaks behind
+        # transaction-pooling proxies just like the explicit prepares do
+        conn.prepare_threshold = None
+
+def init_database_pool():
+    """Initialize one PostgreSQL connection pool per workload class with enhanced error handling"""
+    # Get database URL from environment variable
+    database_url = get_database_url()
 
     try:
-        # Create connection pool using psycopg3 with timeout and retry settings
-        db_pool = ConnectionPool(
-            conninfo=database_url,
-            min_size=1,
-            max_size=20,
-            open=True,  # Open pool immediately
-            timeout=30,  # Connection timeout
-            max_idle=300,  # Maximum idle time
-            max_lifetime=3600,  # Maximum connection lifetime
-            reconnect_timeout=10  # Reconnection timeout
-        )
+        for workload, (min_size, max_size, timeout) in DB_POOL_CLASSES.items():
+            # Create connection pool using psycopg3 with timeout and retry settings
+            pool = ConnectionPool(
+                conninfo=database_url,
+                name=workload,
+                min_size=min_size,  # Kept warm so the class never pays for a cold connect
+                max_size=max_size,
+                configure=configure_connection,
+                open=True,  # Open pool immediately
+                timeout=timeout,  # Checkout timeout for this class
+                max_idle=300,  # Maximum idle time
+                max_lifetime=3600,  # Maximum connection lifetime
+                reconnect_timeout=10  # Reconnection timeout
+            )
 
-        # Wait for pool to be ready with timeout
-        db_pool.wait(timeout=30)
-        logger.info("Database connection pool created successfully")
+            # Wait for pool to be ready with timeout
+            pool.wait(timeout=30)
+            db_pools[workload] = pool
+        logger.info(f"Database connection pools created successfully: {', '.join(db_pools)}")
         
     except (psycopg.Error, PoolTimeout) as e:
         logger.error(f"Error creating database connection pool: {e}")
@@ -162,89 +401,231 @@ def init_database_pool():
         logger.error(f"Unexpected error during database pool initialization: {e}")
         raise DatabaseError(f"Unexpected database initialization error: {e}")
 
+def get_pool_stats():
+    """Per-class pool occupancy; saturation near 1 with waiting requests means the class needs more slots"""
+    stats = {}
+    for workload, pool in db_pools.items():
+        counters = pool.get_stats()
+        in_use = counters.get('pool_size', 0) - counters.get('pool_available', 0)
+        stats[workload] = {
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+            'checkout_timeout': pool.timeout,
+            'size': counters.get('pool_size', 0),
+            'in_use': in_use,
+            'saturation': round(in_use / pool.max_size, 3),
+            'waiting': counters.get('requests_waiting', 0),
+            'requests': counters.get('requests_num', 0),
+            'queued': counters.get('requests_queued', 0),
+            'wait_ms': counters.get('requests_wait_ms', 0),
+            'timeouts': counters.get('requests_errors', 0),
+        }
+    return stats
+
 def init_database():
     """Initialize the PostgreSQL database with users table and enhanced error handling"""
-    if not db_pool:
+    if not db_pools:
         raise DatabaseError("Database pool not initialized")
     
-    with db_lock:
-        try:
-            with db_pool.connection() as conn:
-                with conn.cursor() as cursor:
-                    try:
-                        # Create users table if it doesn't exist (PostgreSQL syntax)
-                        cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS users (
-                                id SERIAL PRIMARY KEY,
-                                username VARCHAR(50) UNIQUE NOT NULL,
-                                password_hash TEXT NOT NULL,
-                                email VARCHAR(255) UNIQUE NOT NULL,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                last_login TIMESTAMP,
-                                is_active BOOLEAN DEFAULT TRUE
-                            )
-                        """)
-                        
-                        # Create indexes for better performance
-                        cursor.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-                        """)
-                        cursor.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
-                        """)
-
-                        cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS feed_shares (
-                                owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                                shared_with_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                PRIMARY KEY (owner_id, shared_with_id)
-                            )
-                        """)
-                        
-                        # Create index for shared_with lookups
-                        cursor.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_feed_shares_shared ON feed_shares(shared_with_id);
-                        """)
-
-                        # Inside init_database() after creating feed_shares table
-                        cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS feed_fetches (
-                                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                                fetch_from_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                PRIMARY KEY (user_id, fetch_from_id)
-                            )
-                        """)
-                        cursor.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_feed_fetches_user ON feed_fetches(user_id)
-                        """)
-
-                        # Add this to your init_database() function
-                        cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS user_tweets (
-                                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                                fetched_from_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                                tweets_data JSONB NOT NULL,
-                                fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                expires_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP + INTERVAL '1 hour'),
-                                PRIMARY KEY (user_id, fetched_from_id)
-                            )
-                        """)
-
-                        cursor.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_user_tweets_expires ON user_tweets(expires_at);
-                        """)
-
-                        logger.info("Database tables and indexes created successfully")
-
-                    except psycopg.Error as e:
-                        logger.error(f"Error creating database tables: {e}")
-                        raise DatabaseError(f"Failed to create database tables: {e}")
-                        
-        except (psycopg.Error, PoolTimeout) as e:
-            logger.error(f"Error initializing database: {e}")
-            raise DatabaseError(f"Database initialization failed: {e}")
+    try:
+        with db_pools['maintenance'].connection() as conn:
+            with conn.cursor() as cursor:
+                try:
+                    # Create users table if it doesn't exist (PostgreSQL syntax)
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS users (
+                            id SERIAL PRIMARY KEY,
+                            username VARCHAR(50) UNIQUE NOT NULL,
+                            password_hash TEXT NOT NULL,
+                            email VARCHAR(255) UNIQUE NOT NULL,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            last_login TIMESTAMP,
+                            is_active BOOLEAN DEFAULT TRUE
+                        )
+                    """)
+                    
+                    # Create indexes for better performance
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+                    """)
+
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS feed_shares (
+                            owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                            shared_with_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            PRIMARY KEY (owner_id, shared_with_id)
+                        )
+                    """)
+                    
+                    # Create index for shared_with lookups
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_feed_shares_shared ON feed_shares(shared_with_id);
+                    """)
+
+                    # Inside init_database() after creating feed_shares table
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS feed_fetches (
+                            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                            fetch_from_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            PRIMARY KEY (user_id, fetch_from_id)
+                        )
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_feed_fetches_user ON feed_fetches(user_id)
+                    """)
+
+                    # Add this to your init_database() function
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS user_tweets (
+                            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                            fetched_from_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                            tweets_data JSONB NOT NULL,
+                            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            expires_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP + INTERVAL '1 hour'),
+                            PRIMARY KEY (user_id, fetched_from_id)
+                        )
+                    """)
+
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_user_tweets_expires ON user_tweets(expires_at);
+                    """)
+
+                    # Normalized timeline storage: header rows stay in user_tweets
+                    # with a NULL blob, tweets are stored once and referenced by position
+                    cursor.execute("""
+                        ALTER TABLE user_tweets ALTER COLUMN tweets_data DROP NOT NULL
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE user_tweets ADD COLUMN IF NOT EXISTS tweets_blob BYTEA
+                    """)
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS tweets (
+                            tweet_id TEXT PRIMARY KEY,
+                            tweet_data JSONB NOT NULL,
+                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS timeline_tweets (
+                            user_id INTEGER NOT NULL,
+                            fetched_from_id INTEGER NOT NULL,
+                            position INTEGER NOT NULL,
+                            tweet_id TEXT NOT NULL REFERENCES tweets(tweet_id) ON DELETE CASCADE,
+                            PRIMARY KEY (user_id, fetched_from_id, position),
+                            FOREIGN KEY (user_id, fetched_from_id)
+                                REFERENCES user_tweets(user_id, fetched_from_id) ON DELETE CASCADE
+                        )
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_timeline_tweets_tweet ON timeline_tweets(tweet_id);
+                    """)
+
+                    # Full-text search over normalized tweets, maintained by PostgreSQL at ingest
+                    cursor.execute("""
+                        ALTER TABLE tweets ADD COLUMN IF NOT EXISTS search_vector tsvector
+                        GENERATED ALWAYS AS (
+                            to_tsvector('simple',
+                                coalesce(tweet_data->>'text', '') || ' ' ||
+                                coalesce(tweet_data->>'username', '') || ' ' ||
+                                coalesce(tweet_data->>'name', ''))
+                        ) STORED
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_tweets_search ON tweets USING GIN (search_vector);
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_timeline_tweets_owner ON timeline_tweets(fetched_from_id);
+                    """)
+
+                    # Shared rate limit counters, used when RATE_LIMIT_STORE=postgres
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS rate_limit_counters (
+                            bucket_key TEXT NOT NULL,
+                            window_start BIGINT NOT NULL,
+                            hits INTEGER NOT NULL DEFAULT 0,
+                            expires_at TIMESTAMP NOT NULL,
+                            PRIMARY KEY (bucket_key, window_start)
+                        )
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_expires ON rate_limit_counters(expires_at);
+                    """)
+
+                    # Timeline versions for delta sync, drawn from one sequence so a
+                    # timeline recreated after expiry never reuses an old version
+                    cursor.execute("""
+                        CREATE SEQUENCE IF NOT EXISTS timeline_version_seq
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE user_tweets ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE user_tweets ADD COLUMN IF NOT EXISTS tweet_versions JSONB
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE timeline_tweets ADD COLUMN IF NOT EXISTS first_version BIGINT NOT NULL DEFAULT 0
+                    """)
+                    # Version the timeline row was created at, older watermarks get a full replace
+                    cursor.execute("""
+                        ALTER TABLE user_tweets ADD COLUMN IF NOT EXISTS base_version BIGINT NOT NULL DEFAULT 0
+                    """)
+
+                    # Fetch job queue shared by every web and fetch-worker process
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS fetch_jobs (
+                            id BIGSERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                            fetch_from_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                            status VARCHAR(16) NOT NULL DEFAULT 'queued',
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            worker_id TEXT,
+                            error TEXT,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            started_at TIMESTAMP,
+                            heartbeat_at TIMESTAMP,
+                            finished_at TIMESTAMP
+                        )
+                    """)
+                    cursor.execute("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS idx_fetch_jobs_active
+                        ON fetch_jobs(user_id, fetch_from_id) WHERE status IN ('queued', 'running');
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_fetch_jobs_queued
+                        ON fetch_jobs(created_at) WHERE status = 'queued';
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE fetch_jobs ADD COLUMN IF NOT EXISTS priority SMALLINT NOT NULL DEFAULT 0
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE fetch_jobs ADD COLUMN IF NOT EXISTS deadline_at TIMESTAMP
+                    """)
+                    cursor.execute("""
+                        ALTER TABLE fetch_jobs ADD COLUMN IF NOT EXISTS resume_cursor TEXT
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_fetch_jobs_requester_started
+                        ON fetch_jobs(user_id, started_at);
+                    """)
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_fetch_jobs_running
+                        ON fetch_jobs(user_id, fetch_from_id) WHERE status = 'running';
+                    """)
+
+                    logger.info("Database tables and indexes created successfully")
+
+                except psycopg.Error as e:
+                    logger.error(f"Error creating database tables: {e}")
+                    raise DatabaseError(f"Failed to create database tables: {e}")
+                    
+    except (psycopg.Error, PoolTimeout) as e:
+        logger.error(f"Error initializing database: {e}")
+        raise DatabaseError(f"Database initialization failed: {e}")
 
 # Configure comprehensive logging
 logging.basicConfig(
@@ -282,6 +663,10 @@ class AuthenticationError(Exception):
     """Custom exception for authentication-related errors"""
     pass
 
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its time budget"""
+    pass
+
 def validate_email(email):
     """Enhanced email validation"""
     if not email or len(email) > 255:
@@ -323,6 +708,7 @@ def sanitize_input(data):
 
 def hash_password(password):
     """Hash a password using bcrypt with enhanced security"""
+    started = time.perf_counter()
     try:
         # Use a higher cost factor for better security
         salt = bcrypt.gensalt(rounds=12)
@@ -331,14 +717,19 @@ def hash_password(password):
     except Exception as e:
         logger.error(f"Error hashing password: {e}")
         raise AuthenticationError("Password hashing failed")
+    finally:
+        record_timing('auth', time.perf_counter() - started)
 
 def verify_password(password, hashed):
     """Verify a password against its hash with error handling"""
+    started = time.perf_counter()
     try:
         return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
     except Exception as e:
         logger.error(f"Error verifying password: {e}")
         return False
+    finally:
+        record_timing('auth', time.perf_counter() - started)
 
 def generate_jwt_token(username):
     """Generate a JWT token for a user with enhanced security"""
@@ -354,101 +745,2325 @@ def generate_jwt_token(username):
         logger.error(f"Error generating JWT token: {e}")
         raise AuthenticationError("Token generation failed")
 
-def verify_jwt_token(token):
-    """Verify and decode a JWT token with comprehensive error handling"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload['username']
-    except jwt.ExpiredSignatureError:
-        logger.warning("JWT token has expired")
-        return None
-    except jwt.InvalidTokenError as e:
-        logger.warning(f"Invalid JWT token: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"Error verifying JWT token: {e}")
-        return None
+def verify_jwt_token(token):
+    """Verify and decode a JWT token with comprehensive error handling"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return payload['username']
+    except jwt.ExpiredSignatureError:
+        logger.warning("JWT token has expired")
+        return None
+    except jwt.InvalidTokenError as e:
+        logger.warning(f"Invalid JWT token: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error verifying JWT token: {e}")
+        return None
+
+def require_auth(f):
+    """Decorator to require authentication for protected routes"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'Missing or invalid authorization header'}), 401
+
+        try:
+            started = time.perf_counter()
+            token = auth_header.split(' ')[1]
+            username = verify_jwt_token(token)
+            record_timing('auth', time.perf_counter() - started)
+            
+            if not username:
+                return jsonify({'error': 'Invalid or expired token'}), 401
+                
+        except Exception as e:
+            logger.error(f"Authentication error: {e}")
+            return jsonify({'error': 'Authentication failed'}), 500
+
+        # Add username to request context for use in the route. The route runs
+        # outside the try so its errors reach their own handlers
+        request.current_user = username
+        return f(*args, **kwargs)
+            
+    return decorated_function
+
+def require_admin(f):
+    """Decorator to restrict maintenance routes to holders of ADMIN_TOKEN"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled'}), 403
+
+        provided = request.headers.get('X-Admin-Token', '')
+        if not secrets.compare_digest(provided, ADMIN_TOKEN):
+            logger.warning(f"Rejected admin request to {request.path} from {request.remote_addr}")
+            return jsonify({'error': 'Invalid admin token'}), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+@app.before_request
+def start_request_deadline():
+    """Give the request its endpoint's budget, clients may ask for a shorter one"""
+    budget = REQUEST_DEADLINES.get(request.endpoint, REQUEST_DEADLINE)
+    try:
+        requested = float(request.headers.get('X-Request-Timeout', budget))
+    except ValueError:
+        requested = budget
+    g.deadline = time.monotonic() + max(min(requested, budget), 0)
+
+def remaining_budget():
+    """Seconds left before the current request's deadline, None outside a request"""
+    if has_request_context() and 'deadline' in g:
+        return g.deadline - time.monotonic()
+    return None
+
+def check_deadline(what):
+    """Raise DeadlineExceeded if the request has no time left, else return the remaining seconds"""
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {what}")
+    return remaining
+
+def current_workload():
+    """Pool class for the current request's endpoint, 'maintenance' for background threads"""
+    if has_request_context():
+        return ENDPOINT_WORKLOADS.get(request.endpoint, 'list')
+    return 'maintenance'
+
+def handle_database_operation(operation, read_only=False, workload=None):
+    """Wrapper for database operations with comprehensive error handling
+
+    Set read_only for operations that may be served by the read replica.
+    workload picks the primary pool, by default from current_workload().
+    Inside a request the pool checkout and retry backoff are bounded by the
+    request deadline.
+    """
+    max_retries = 3
+    retry_delay = 1
+    pool = replica_router.choose_pool(current_request_user()) if read_only else None
+    workload = workload or current_workload()
+    
+    for attempt in range(max_retries):
+        if workload not in db_pools:
+            logger.error("Database connection pool not initialized")
+            raise DatabaseError("Database connection pool not initialized")
+        remaining = check_deadline('database checkout')
+        try:
+            waiting = time.perf_counter()
+            target = pool or db_pools[workload]
+            # The class's own checkout timeout, shortened to what is left of the request
+            checkout_timeout = target.timeout if remaining is None else min(target.timeout, remaining)
+            with target.connection(timeout=checkout_timeout) as conn:
+                with conn.cursor() as cursor:
+                    started = time.perf_counter()
+                    record_timing('db-wait', started - waiting)
+                    try:
+                        return operation(cursor)
+                    finally:
+                        record_timing('db', time.perf_counter() - started)
+                        
+        except (psycopg.OperationalError, PoolTimeout) as e:
+            remaining = remaining_budget()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded during database operation: {e}")
+            if pool is not None:
+                # Replica failed, retry straight away on the primary
+                replica_router.mark_down(e)
+                pool = None
+                continue
+            logger.warning(f"Database operation failed (attempt {attempt + 1}): {e}")
+            if attempt < max_retries - 1:
+                backoff = retry_delay * (2 ** attempt)  # Exponential backoff
+                if remaining is not None and remaining <= backoff:
+                    raise DeadlineExceeded("Deadline exceeded before the next database retry")
+                time.sleep(backoff)
+                continue
+            logger.error(f"Database operation failed after {max_retries} attempts")
+            raise DatabaseError("Database operation failed after multiple retries")
+            
+        except psycopg.IntegrityError as e:
+            logger.warning(f"Database integrity error: {e}")
+            raise  # Re-raise integrity errors immediately
+
+        except (DeadlineExceeded, ValidationError, AuthenticationError):
+            # Raised by the operation itself, let the handler map them
+            raise
+            
+        except Exception as e:
+            logger.error(f"Unexpected database error: {e}")
+            raise DatabaseError(f"Unexpected database error: {e}")
+
+class ReplicaRouter:
+    """Routes read-only operations to an optional replica pool
+
+    Reads go to the replica while it is reachable and its replay lag is under
+    REPLICA_MAX_LAG. A user who just wrote is pinned to the primary for long
+    enough to cover the current lag, so share changes and fresh cache rows
+    are visible to their next read.
+    """
+
+    def __init__(self, replica_url, max_lag, pin_seconds, check_interval):
+        self.replica_url = replica_url
+        self.max_lag = max_lag
+        self.pin_seconds = pin_seconds
+        self.check_interval = check_interval
+        self.pool = None
+        self.healthy = False
+        self.lag_seconds = None
+        self.pinned_until = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {'replica_reads': 0, 'primary_reads': 0, 'fallbacks': 0}
+
+    def open(self):
+        if not self.replica_url:
+            return
+        if self.replica_url.startswith('postgres://'):
+            self.replica_url = self.replica_url.replace('postgres://', 'postgresql://', 1)
+        self.pool = ConnectionPool(
+            conninfo=self.replica_url,
+            min_size=1,
+            max_size=20,
+            configure=configure_connection,
+            open=True,
+            timeout=5,  # Fail over to the primary quickly
+            max_idle=300,
+            max_lifetime=3600,
+            reconnect_timeout=10
+        )
+        self.check_lag()
+        self.thread = threading.Thread(target=self.run, name='replica-monitor', daemon=True)
+        self.thread.start()
+        logger.info("Read replica pool created")
+
+    def run(self):
+        while not self.stop_event.wait(self.check_interval):
+            self.check_lag()
+
+    def check_lag(self):
+        """Measure replay lag, treating a fully caught-up replica as zero lag"""
+        try:
+            with self.pool.connection(timeout=5) as conn:
+                row = conn.execute("""
+                    SELECT CASE
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END
+                """).fetchone()
+            with self.lock:
+                self.lag_seconds = float(row[0])
+                self.healthy = True
+        except Exception as e:
+            self.mark_down(e)
+
+    def mark_down(self, error):
+        with self.lock:
+            if self.healthy:
+                logger.warning(f"Read replica unavailable, routing reads to primary: {error}")
+            self.healthy = False
+            self.stats['fallbacks'] += 1
+
+    def mark_write(self, *usernames):
+        """Pin users to the primary until their write has replicated"""
+        if not self.pool:
+            return
+        with self.lock:
+            now = time.monotonic()
+            until = now + max(self.pin_seconds, (self.lag_seconds or 0) + 1)
+            if len(self.pinned_until) > 10000:
+                self.pinned_until = {u: t for u, t in self.pinned_until.items() if t > now}
+            for username in usernames:
+                if username:
+                    self.pinned_until[username] = until
+
+    def choose_pool(self, username):
+        """Replica pool for this read, or None when it must go to the primary"""
+        if not self.pool:
+            return None
+        with self.lock:
+            use_replica = (self.healthy and self.lag_seconds is not None
+                           and self.lag_seconds <= self.max_lag
+                           and self.pinned_until.get(username, 0) <= time.monotonic())
+            self.stats['replica_reads' if use_replica else 'primary_reads'] += 1
+        return self.pool if use_replica else None
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, enabled=bool(self.pool), healthy=self.healthy,
+                        lag_seconds=self.lag_seconds, pinned_users=len(self.pinned_until))
+
+def current_request_user():
+    if has_request_context():
+        return getattr(request, 'current_user', None)
+    return None
+
+# Global replica router, inactive unless DATABASE_REPLICA_URL is set
+replica_router = ReplicaRouter(DATABASE_REPLICA_URL, REPLICA_MAX_LAG, REPLICA_PIN_SECONDS, REPLICA_CHECK_INTERVAL)
+try:
+    replica_router.open()
+except Exception as e:
+    logger.error(f"Failed to create read replica pool, using primary only: {e}")
+    replica_router.pool = None
+
+# Request phases reported in Server-Timing on traced requests. Untraced
+# requests only add their database time to the totals in /api/admin/stats.
+TIMING_PHASES = ('auth', 'db-wait', 'db', 'fetch', 'serialize')
+timing_stats_lock = threading.Lock()
+timing_stats = {'requests': 0, 'db_seconds': 0.0, 'db_wait_seconds': 0.0}
+
+def record_timing(phase, seconds):
+    """Accumulate time spent in a request phase"""
+    if has_request_context():
+        timings = g.setdefault('timings', {})
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Full phase breakdown is an admin tool, it reveals server internals
+    g.trace_request = (request.headers.get('X-Trace-Request') == '1' and bool(ADMIN_TOKEN)
+                       and secrets.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN))
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get('timings', {})
+    if g.get('trace_request'):
+        total = time.perf_counter() - g.request_started
+        entries = [f"{phase};dur={timings.get(phase, 0.0) * 1000:.2f}" for phase in TIMING_PHASES]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        response.headers['Server-Timing'] = ', '.join(entries)
+        logger.info(f"Trace {request.method} {request.path}: {', '.join(entries)}")
+    with timing_stats_lock:
+        timing_stats['requests'] += 1
+        timing_stats['db_seconds'] += timings.get('db', 0.0)
+        timing_stats['db_wait_seconds'] += timings.get('db-wait', 0.0)
+    return response
+
+def get_timing_stats():
+    with timing_stats_lock:
+        stats = dict(timing_stats)
+    requests = stats['requests'] or 1
+    return dict(stats, db_ms_mean=round(stats['db_seconds'] / requests * 1000, 3),
+                db_wait_ms_mean=round(stats['db_wait_seconds'] / requests * 1000, 3))
+
+def json_encode(obj):
+    """Serialize to compact UTF-8 JSON bytes, with orjson when installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers beyond 64 bits and other types orjson rejects
+            pass
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+# A number token of 19 or more digits may not fit in 64 bits; orjson parses
+# those as floats, so such payloads go to json.loads, which keeps them exact.
+# Digits inside strings can match too and only cost the faster parser.
+WIDE_INT_TEXT = re.compile(r'[:,\[]\s*-?\d{19}')
+WIDE_INT_BYTES = re.compile(rb'[:,\[]\s*-?\d{19}')
+
+def json_decode(data):
+    """Parse JSON text or bytes, with orjson when installed
+
+    Integers out of orjson's range decode exactly, as json_encode writes them.
+    """
+    if orjson is not None:
+        wide_int = WIDE_INT_BYTES if isinstance(data, (bytes, bytearray, memoryview)) else WIDE_INT_TEXT
+        if not wide_int.search(data):
+            return orjson.loads(data)
+    return json.loads(data)
+
+# JSONB parameters wrapped in Jsonb and every JSON/JSONB column read go through these
+set_json_dumps(json_encode)
+set_json_loads(json_decode)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when installed, recording serialization time
+
+    Dates, dataclasses and other non-native values still go through Flask's
+    default hook so responses look the same with either encoder.
+    """
+
+    sort_keys = False
+    # orjson always writes UTF-8, keep the stdlib fallback byte-compatible
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        option = self.orjson_option(**kwargs) if orjson is not None else None
+        if option is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    @staticmethod
+    def orjson_option(separators=(',', ':'), indent=None, **other):
+        """orjson options equivalent to these json.dumps arguments, None if there are none
+
+        response() passes compact separators, or indent=2 in debug mode.
+        """
+        if other or indent not in (None, 2) or (indent is None and tuple(separators) != (',', ':')):
+            return None
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        return option | orjson.OPT_INDENT_2 if indent else option
+
+    def loads(self, s, **kwargs):
+        if not kwargs:
+            return json_decode(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            record_timing('serialize', time.perf_counter() - started)
+
+app.json = FastJSONProvider(app)
+
+# Hot queries executed on every request, prepared server-side per connection
+HOT_QUERIES = {
+    'user_id_active': 'SELECT id FROM users WHERE username = %s AND is_active = TRUE',
+    'user_id_any': 'SELECT id, is_active FROM users WHERE username = %s',
+    'login_user': 'SELECT username, password_hash, is_active FROM users WHERE username = %s',
+    'touch_last_login': 'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = %s',
+    'user_profile': 'SELECT username, email, created_at, last_login FROM users WHERE username = %s',
+    'access_check': """
+        SELECT ff.fetch_from_id, u1.username, u2.id as current_user_id
+        FROM feed_fetches ff
+        JOIN users u1 ON ff.fetch_from_id = u1.id
+        JOIN users u2 ON ff.user_id = u2.id
+        WHERE u2.username = %s AND u1.username = %s
+    """,
+    'user_cookies': 'SELECT cookies FROM user_cookies WHERE user_id = %s',
+    'shared_users': """
+        SELECT u.username
+        FROM feed_shares fs
+        JOIN users u ON fs.shared_with_id = u.id
+        WHERE fs.owner_id = (SELECT id FROM users WHERE username = %s)
+    """,
+    'fetch_users': """
+        SELECT u.username
+        FROM feed_fetches ff
+        JOIN users u ON ff.fetch_from_id = u.id
+        WHERE ff.user_id = (SELECT id FROM users WHERE username = %s)
+    """,
+    'timeline_blob': """
+        SELECT fetched_at, tweets_data, tweets_blob, version, tweet_versions, base_version
+        FROM user_tweets
+        WHERE user_id = %s AND fetched_from_id = %s
+        AND expires_at > CURRENT_TIMESTAMP
+        AND (tweets_data IS NOT NULL OR tweets_blob IS NOT NULL)
+    """,
+    'timeline_normalized': """
+        SELECT ut.fetched_at, ut.tweets_data, ut.tweets_blob, ut.version, ut.tweet_versions, ut.base_version,
+               t.tweet_data
+        FROM user_tweets ut
+        LEFT JOIN timeline_tweets tt
+            ON tt.user_id = ut.user_id AND tt.fetched_from_id = ut.fetched_from_id
+            AND (tt.first_version > %s OR %s < GREATEST(ut.base_version, 1))
+        LEFT JOIN tweets t ON t.tweet_id = tt.tweet_id
+        WHERE ut.user_id = %s AND ut.fetched_from_id = %s
+        AND ut.expires_at > CURRENT_TIMESTAMP
+        ORDER BY tt.position
+    """,
+    'health_check': 'SELECT 1',
+}
+
+def execute_hot(cursor, name, params=()):
+    """Execute a registered hot query, prepared on first use on each connection"""
+    cursor.execute(HOT_QUERIES[name], params, prepare=DB_PREPARED_STATEMENTS)
+    return cursor
+
+def execute_pipelined(cursor, statements):
+    """Send several statements that need no intermediate results in one round trip"""
+    with cursor.connection.pipeline():
+        for query, params in statements:
+            cursor.execute(query, params)
+
+def save_user_cookies(cursor, username, cookies_json):
+    # Convert the dictionary to a JSON string
+    cookies_json_str = json.dumps(cookies_json)
+    # Create table if not exists
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_cookies (
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            cookies JSONB NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id)
+        )
+    """)
+    # Upsert cookies
+    cursor.execute("""
+        INSERT INTO user_cookies (user_id, cookies, updated_at)
+        VALUES (
+            (SELECT id FROM users WHERE username = %s),
+            %s,
+            CURRENT_TIMESTAMP
+        )
+        ON CONFLICT (user_id) DO UPDATE
+        SET cookies = EXCLUDED.cookies,
+            updated_at = EXCLUDED.updated_at
+    """, (username, cookies_json_str))
+
+
+class TimelineCodec:
+    """Compact bytea encoding for cached timelines
+
+    Tweets are stored column-wise so repeated keys are written once per
+    timeline, then serialized with msgpack and zstd when available or with
+    JSON and zlib otherwise. The first byte records the format so rows stay
+    readable after the optional dependencies change.
+    """
+
+    FORMAT_ZSTD_MSGPACK = 1
+    FORMAT_ZLIB_JSON = 2
+
+    def __init__(self, level=3):
+        self.level = level
+        # zstd contexts must not be shared between threads, each thread gets its own pair
+        self.local = threading.local()
+        if zstandard is not None and msgpack is not None:
+            self.format = self.FORMAT_ZSTD_MSGPACK
+        else:
+            self.format = self.FORMAT_ZLIB_JSON
+
+    def zstd_contexts(self):
+        """This thread's (compressor, decompressor)"""
+        local = self.local
+        if not hasattr(local, 'compressor'):
+            local.compressor = zstandard.ZstdCompressor(level=self.level)
+            local.decompressor = zstandard.ZstdDecompressor()
+        return local.compressor, local.decompressor
+
+    @staticmethod
+    def to_columns(tweets):
+        """Pivot tweets to {'k': keys, 'c': columns}, or keep rows if keys differ"""
+        if not tweets:
+            return {'k': [], 'c': []}
+        keys = list(tweets[0])
+        if any(list(tweet) != keys for tweet in tweets):
+            return {'r': tweets}
+        return {'k': keys, 'c': [[tweet[key] for tweet in tweets] for key in keys]}
+
+    @staticmethod
+    def from_columns(payload):
+        if 'r' in payload:
+            return payload['r']
+        keys = payload['k']
+        return [dict(zip(keys, values)) for values in zip(*payload['c'])]
+
+    def encode(self, tweets):
+        payload = self.to_columns(tweets)
+        if self.format == self.FORMAT_ZSTD_MSGPACK:
+            body = self.zstd_contexts()[0].compress(msgpack.packb(payload, use_bin_type=True))
+        else:
+            body = zlib.compress(json_encode(payload), 6)
+        return bytes([self.format]) + body
+
+    def decode(self, data):
+        data = bytes(data)
+        fmt, body = data[0], data[1:]
+        if fmt == self.FORMAT_ZSTD_MSGPACK:
+            if zstandard is None or msgpack is None:
+                raise DatabaseError("Cached timeline requires zstandard and msgpack to decode")
+            payload = msgpack.unpackb(self.zstd_contexts()[1].decompress(body), raw=False)
+        elif fmt == self.FORMAT_ZLIB_JSON:
+            payload = json_decode(zlib.decompress(body))
+        else:
+            raise DatabaseError(f"Unknown cached timeline format: {fmt}")
+        return self.from_columns(payload)
+
+class TweetStore:
+    """Timeline cache storage for user_tweets in blob, compact or normalized layout"""
+
+    LAYOUTS = ('normalized', 'jsonb', 'compact')
+
+    def __init__(self, layout):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown tweet storage layout: {layout}")
+        self.layout = layout
+        self.codec = TimelineCodec()
+
+    @staticmethod
+    def tweet_key(tweet):
+        """Stable key for a tweet, falling back to its URL when the id is missing"""
+        return str(tweet.get('tweet_id') or tweet.get('url'))
+
+    def store_timeline(self, cursor, user_id, fetched_from_id, tweets_data):
+        """Upsert a fetched timeline, bump its version and reset its one hour expiry
+
+        Versions come from a global sequence so they keep increasing even when
+        an expired timeline is deleted and fetched again. Every tweet records
+        the version in which it first appeared, which makes delta reads a filter.
+        base_version is set when the row is created and kept across refetches.
+        """
+        keys = [self.tweet_key(tweet) for tweet in tweets_data]
+
+        if self.layout in ('jsonb', 'compact'):
+            if self.layout == 'jsonb':
+                blob, compact = Jsonb(tweets_data), None
+            else:
+                blob, compact = None, self.codec.encode(tweets_data)
+            cursor.execute("""
+                INSERT INTO user_tweets
+                    (user_id, fetched_from_id, tweets_data, tweets_blob, version, base_version,
+                     tweet_versions, expires_at)
+                SELECT %s, %s, %s, %s, v.version, v.version,
+                       COALESCE((SELECT jsonb_object_agg(k, v.version) FROM unnest(%s::text[]) AS k), '{}'),
+                       CURRENT_TIMESTAMP + INTERVAL '1 hour'
+                FROM (SELECT nextval('timeline_version_seq') AS version) v
+                ON CONFLICT (user_id, fetched_from_id)
+                DO UPDATE SET
+                    tweets_data = EXCLUDED.tweets_data,
+                    tweets_blob = EXCLUDED.tweets_blob,
+                    version = EXCLUDED.version,
+                    tweet_versions = COALESCE((
+                        SELECT jsonb_object_agg(
+                            k, COALESCE((user_tweets.tweet_versions->>k)::bigint, EXCLUDED.version))
+                        FROM unnest(%s::text[]) AS k
+                    ), '{}'),
+                    fetched_at = CURRENT_TIMESTAMP,
+                    expires_at = EXCLUDED.expires_at
+            """, (user_id, fetched_from_id, blob, compact, keys, keys))
+            return
+
+        unique_tweets = dict(zip(keys, tweets_data))
+        # Sorted keys give concurrent ingests the same lock order on shared tweets
+        unique_keys = sorted(unique_tweets)
+
+        execute_pipelined(cursor, [
+            # Timeline header row, both blob columns stay NULL in this layout
+            ("""
+                INSERT INTO user_tweets
+                    (user_id, fetched_from_id, tweets_data, tweets_blob, version, base_version,
+                     tweet_versions, expires_at)
+                SELECT %s, %s, NULL, NULL, v.version, v.version, NULL, CURRENT_TIMESTAMP + INTERVAL '1 hour'
+                FROM (SELECT nextval('timeline_version_seq') AS version) v
+                ON CONFLICT (user_id, fetched_from_id)
+                DO UPDATE SET
+                    tweets_data = NULL,
+                    tweets_blob = NULL,
+                    version = EXCLUDED.version,
+                    tweet_versions = NULL,
+                    fetched_at = CURRENT_TIMESTAMP,
+                    expires_at = EXCLUDED.expires_at
+            """, (user_id, fetched_from_id)),
+            # One set-based upsert for every tweet in the batch. Unchanged tweets
+            # are skipped, rewriting them would only leave dead tuples and GIN churn
+            ("""
+                INSERT INTO tweets (tweet_id, tweet_data, updated_at)
+                SELECT k.tweet_id, k.tweet_data, CURRENT_TIMESTAMP
+                FROM unnest(%s::text[], %s::jsonb[]) AS k(tweet_id, tweet_data)
+                ON CONFLICT (tweet_id)
+                DO UPDATE SET
+                    tweet_data = EXCLUDED.tweet_data,
+                    updated_at = EXCLUDED.updated_at
+                WHERE tweets.tweet_data IS DISTINCT FROM EXCLUDED.tweet_data
+            """, (unique_keys, [Jsonb(unique_tweets[key]) for key in unique_keys])),
+            # Replace membership, carrying over first_version for tweets already in the timeline
+            ("""
+                WITH previous AS (
+                    DELETE FROM timeline_tweets
+                    WHERE user_id = %s AND fetched_from_id = %s
+                    RETURNING tweet_id, first_version
+                ), header AS (
+                    SELECT version FROM user_tweets WHERE user_id = %s AND fetched_from_id = %s
+                )
+                INSERT INTO timeline_tweets (user_id, fetched_from_id, position, tweet_id, first_version)
+                SELECT %s, %s, k.position, k.tweet_id,
+                       COALESCE((SELECT MIN(p.first_version) FROM previous p WHERE p.tweet_id = k.tweet_id),
+                                (SELECT version FROM header))
+                FROM unnest(%s::text[]) WITH ORDINALITY AS k(tweet_id, position)
+            """, (user_id, fetched_from_id, user_id, fetched_from_id, user_id, fetched_from_id, keys)),
+        ])
+
+    def load_timeline(self, cursor, user_id, fetched_from_id, since_version=0):
+        """Return (tweets, fetched_at, version, delta) for an unexpired timeline, or None
+
+        With since_version only tweets that first appeared after that version
+        are returned and delta is True. A watermark older than the timeline's
+        base_version belongs to an earlier, expired copy of it, so the full
+        timeline is returned with delta False for the client to replace.
+        """
+        if self.layout in ('jsonb', 'compact'):
+            row = execute_hot(cursor, 'timeline_blob', (user_id, fetched_from_id)).fetchone()
+            if not row:
+                return None
+            return self.filter_blob(row, since_version)
+
+        execute_hot(cursor, 'timeline_normalized', (since_version, since_version, user_id, fetched_from_id))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+
+        fetched_at, blob, compact, version, tweet_versions, base_version = rows[0][:6]
+        if blob is not None or compact is not None:
+            # Row written under a different layout
+            return self.filter_blob(rows[0][:6], since_version)
+        delta = since_version >= max(base_version, 1)
+        return [row[6] for row in rows if row[6] is not None], fetched_at, version, delta
+
+    def filter_blob(self, row, since_version):
+        """load_timeline result for a per-timeline JSONB or compact row"""
+        fetched_at, blob, compact, version, tweet_versions, base_version = row
+        tweets = self.decode_blob(blob, compact)
+        delta = since_version >= max(base_version, 1)
+        if delta:
+            tweet_versions = tweet_versions or {}
+            tweets = [tweet for tweet in tweets
+                      if tweet_versions.get(self.tweet_key(tweet), version) > since_version]
+        return tweets, fetched_at, version, delta
+
+    def search(self, cursor, query, owner_ids, limit):
+        """Rank cached tweets matching a web-style query within the given owners' timelines
+
+        The GIN index finds the matching tweets first and each is then checked
+        against the caller's unexpired timelines, so a selective query never
+        touches every tweet the caller can see. Never prepared: how selective
+        a query is decides the plan, and a generic plan suits none of them.
+        """
+        cursor.execute("""
+            WITH owners AS (SELECT unnest(%s::int[]) AS id)
+            SELECT t.tweet_data, owner.username, matches.rank
+            FROM (
+                SELECT t.tweet_id, ts_rank(t.search_vector, q) AS rank
+                FROM tweets t, websearch_to_tsquery('simple', %s) q
+                WHERE t.search_vector @@ q
+                AND EXISTS (
+                    SELECT 1
+                    FROM timeline_tweets tt
+                    JOIN user_tweets ut
+                        ON ut.user_id = tt.user_id AND ut.fetched_from_id = tt.fetched_from_id
+                    WHERE tt.tweet_id = t.tweet_id
+                    AND tt.fetched_from_id IN (SELECT id FROM owners)
+                    AND ut.expires_at > CURRENT_TIMESTAMP
+                )
+                ORDER BY rank DESC
+                LIMIT %s
+            ) matches
+            JOIN tweets t ON t.tweet_id = matches.tweet_id
+            CROSS JOIN LATERAL (
+                SELECT MIN(tt.fetched_from_id) AS id
+                FROM timeline_tweets tt
+                WHERE tt.tweet_id = matches.tweet_id AND tt.fetched_from_id IN (SELECT id FROM owners)
+            ) source
+            JOIN users owner ON owner.id = source.id
+            ORDER BY matches.rank DESC
+        """, (list(owner_ids), query, limit), prepare=False)
+        return cursor.fetchall()
+
+    def decode_blob(self, blob, compact):
+        """Decode a per-timeline row from either the JSONB or the compact column"""
+        if compact is not None:
+            return self.codec.decode(compact)
+        return blob
+
+    def delete_expired(self, cursor, limit):
+        """Delete at most `limit` expired timelines, skipping rows locked by writers"""
+        cursor.execute("""
+            DELETE FROM user_tweets ut
+            USING (
+                SELECT user_id, fetched_from_id
+                FROM user_tweets
+                WHERE expires_at < CURRENT_TIMESTAMP
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ) expired
+            WHERE ut.user_id = expired.user_id AND ut.fetched_from_id = expired.fetched_from_id
+        """, (limit,))
+        return cursor.rowcount
+
+    def purge_orphans(self, cursor, limit):
+        """Delete at most `limit` tweets no longer referenced by any cached timeline"""
+        cursor.execute("""
+            DELETE FROM tweets
+            WHERE tweet_id IN (
+                SELECT t.tweet_id
+                FROM tweets t
+                WHERE NOT EXISTS (SELECT 1 FROM timeline_tweets tt WHERE tt.tweet_id = t.tweet_id)
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+        """, (limit,))
+        return cursor.rowcount
+
+# Global timeline store instance
+tweet_store = TweetStore(TWEET_STORAGE)
+
+
+class ExpiredTweetReaper:
+    """Background thread that removes expired cache rows in small bounded batches
+
+    Each batch is its own short transaction on a maintenance pool connection,
+    so row locks are released between batches instead of being held for one
+    unbounded DELETE.
+    """
+
+    def __init__(self, batch_size, batch_pause, interval):
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.pass_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.thread = None
+        self.stats = {
+            'passes': 0,
+            'batches': 0,
+            'rows_reaped': 0,
+            'orphans_reaped': 0,
+            'jobs_reaped': 0,
+            'rate_limit_counters_reaped': 0,
+            'seconds_spent': 0.0,
+            'last_pass_at': None,
+            'last_error': None
+        }
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='tweet-reaper', daemon=True)
+        self.thread.start()
+        logger.info(f"Expired tweet reaper started (batch={self.batch_size}, interval={self.interval}s)")
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.reap_once()
+            except Exception as e:
+                logger.error(f"Expired tweet reaper pass failed: {e}")
+                with self.stats_lock:
+                    self.stats['last_error'] = str(e)
+
+    def reap_batches(self, delete_batch):
+        """Run delete_batch until it returns a short batch, pausing in between"""
+        total = batches = 0
+        while not self.stop_event.is_set():
+            deleted = handle_database_operation(lambda cursor: delete_batch(cursor, self.batch_size))
+            total += deleted
+            batches += 1
+            if deleted < self.batch_size:
+                break
+            time.sleep(self.batch_pause)
+        return total, batches
+
+    def reap_once(self):
+        """Run a single reaping pass and return its counts"""
+        with self.pass_lock:
+            started = time.monotonic()
+            rows, row_batches = self.reap_batches(tweet_store.delete_expired)
+            orphans, orphan_batches = self.reap_batches(tweet_store.purge_orphans)
+            jobs, job_batches = self.reap_batches(FetchQueue.delete_finished)
+            counters, counter_batches = self.reap_batches(PostgresRateLimitStore.delete_expired)
+            elapsed = time.monotonic() - started
+
+            with self.stats_lock:
+                self.stats['passes'] += 1
+                self.stats['batches'] += row_batches + orphan_batches + job_batches + counter_batches
+                self.stats['rows_reaped'] += rows
+                self.stats['orphans_reaped'] += orphans
+                self.stats['jobs_reaped'] += jobs
+                self.stats['rate_limit_counters_reaped'] += counters
+                self.stats['seconds_spent'] += elapsed
+                self.stats['last_pass_at'] = datetime.utcnow().isoformat()
+                self.stats['last_error'] = None
+
+            if rows or orphans:
+                logger.info(f"Reaped {rows} expired timelines and {orphans} orphaned tweets in {elapsed:.2f}s")
+            return {'rows_reaped': rows, 'orphans_reaped': orphans, 'seconds': round(elapsed, 3)}
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+# Global reaper instance
+tweet_reaper = ExpiredTweetReaper(REAPER_BATCH_SIZE, REAPER_BATCH_PAUSE, REAPER_INTERVAL)
+if REAPER_ENABLED:
+    tweet_reaper.start()
+
+
+class ShareGraph:
+    """In-process index of active users and feed shares
+
+    Mirrors users, feed_shares and feed_fetches so access checks and share
+    lists are dictionary lookups. The database stays authoritative: the
+    index is loaded at startup, updated by the handlers that change shares
+    or accounts, and lookups that miss fall back to SQL. Share lists and
+    access checks only use it while the invalidation bus is listening;
+    otherwise a reloader thread refreshes the whole index so unshares made
+    by other workers are picked up.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.ids_by_username = {}
+        self.usernames_by_id = {}
+        self.viewers_by_owner = {}  # feed_shares: owner_id -> {shared_with_id}
+        self.owners_by_viewer = {}  # feed_fetches: user_id -> {fetch_from_id}
+        self.loaded = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start_reloader(self, interval):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.reload_loop, args=(interval,),
+                                       name='share-graph-reloader', daemon=True)
+        self.thread.start()
+        logger.info(f"Share graph reloader started (interval={interval}s)")
+
+    def stop_reloader(self, timeout=None):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def reload_loop(self, interval):
+        while not self.stop_event.wait(interval):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Share graph reload failed: {e}")
+
+    @staticmethod
+    def read_snapshot(cursor):
+        # Separate cursors let the three reads share one pipelined round trip
+        conn = cursor.connection
+        with conn.pipeline(), conn.cursor() as shares_cursor, conn.cursor() as fetches_cursor:
+            cursor.execute('SELECT id, username FROM users WHERE is_active = TRUE')
+            shares_cursor.execute('SELECT owner_id, shared_with_id FROM feed_shares')
+            fetches_cursor.execute('SELECT user_id, fetch_from_id FROM feed_fetches')
+            return cursor.fetchall(), shares_cursor.fetchall(), fetches_cursor.fetchall()
+
+    def load(self):
+        """Replace the index with a fresh snapshot of the share tables"""
+        users, shares, fetches = handle_database_operation(self.read_snapshot)
+
+        viewers_by_owner = {}
+        for owner_id, shared_with_id in shares:
+            viewers_by_owner.setdefault(owner_id, set()).add(shared_with_id)
+        owners_by_viewer = {}
+        for user_id, fetch_from_id in fetches:
+            owners_by_viewer.setdefault(user_id, set()).add(fetch_from_id)
+
+        with self.lock:
+            self.ids_by_username = {username: user_id for user_id, username in users}
+            self.usernames_by_id = {user_id: username for user_id, username in users}
+            self.viewers_by_owner = viewers_by_owner
+            self.owners_by_viewer = owners_by_viewer
+            self.loaded = True
+        logger.info(f"Share graph loaded: {len(users)} users, {len(shares)} shares")
+
+    def user_id(self, username):
+        with self.lock:
+            return self.ids_by_username.get(username)
+
+    def username(self, user_id):
+        with self.lock:
+            return self.usernames_by_id.get(user_id)
+
+    def add_user(self, user_id, username):
+        with self.lock:
+            self.ids_by_username[username] = user_id
+            self.usernames_by_id[user_id] = username
+
+    def remove_user(self, user_id):
+        """Drop a deleted account and every share edge it took part in"""
+        with self.lock:
+            username = self.usernames_by_id.pop(user_id, None)
+            if username is not None:
+                self.ids_by_username.pop(username, None)
+            for viewer_id in self.viewers_by_owner.pop(user_id, set()):
+                self.owners_by_viewer.get(viewer_id, set()).discard(user_id)
+            for owner_id in self.owners_by_viewer.pop(user_id, set()):
+                self.viewers_by_owner.get(owner_id, set()).discard(user_id)
+
+    def add_share(self, owner_id, viewer_id):
+        with self.lock:
+            self.viewers_by_owner.setdefault(owner_id, set()).add(viewer_id)
+            self.owners_by_viewer.setdefault(viewer_id, set()).add(owner_id)
+
+    def remove_share(self, owner_id, viewer_id):
+        with self.lock:
+            self.viewers_by_owner.get(owner_id, set()).discard(viewer_id)
+            self.owners_by_viewer.get(viewer_id, set()).discard(owner_id)
+
+    def can_fetch(self, viewer_id, owner_id):
+        with self.lock:
+            return owner_id in self.owners_by_viewer.get(viewer_id, ())
+
+    def owner_ids(self, viewer_id):
+        with self.lock:
+            return set(self.owners_by_viewer.get(viewer_id, ()))
+
+    def viewer_usernames(self, owner_id):
+        """Usernames the owner has shared their feed with"""
+        with self.lock:
+            return sorted(self.usernames_by_id[i] for i in self.viewers_by_owner.get(owner_id, ())
+                          if i in self.usernames_by_id)
+
+    def owner_usernames(self, viewer_id):
+        """Usernames whose feeds the viewer can fetch"""
+        with self.lock:
+            return sorted(self.usernames_by_id[i] for i in self.owners_by_viewer.get(viewer_id, ())
+                          if i in self.usernames_by_id)
+
+    def verify(self):
+        """Compare the index against the database and return any differences"""
+        users, shares, fetches = handle_database_operation(self.read_snapshot)
+        with self.lock:
+            indexed_users = set(self.usernames_by_id.items())
+            indexed_shares = {(o, v) for o, viewers in self.viewers_by_owner.items() for v in viewers}
+            indexed_fetches = {(v, o) for v, owners in self.owners_by_viewer.items() for o in owners}
+
+        differences = {}
+        for name, indexed, actual in (('users', indexed_users, set(users)),
+                                      ('feed_shares', indexed_shares, set(shares)),
+                                      ('feed_fetches', indexed_fetches, set(fetches))):
+            missing, extra = actual - indexed, indexed - actual
+            if missing or extra:
+                differences[name] = {'missing': sorted(missing), 'extra': sorted(extra)}
+        return differences
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'users': len(self.usernames_by_id),
+                'shares': sum(len(viewers) for viewers in self.viewers_by_owner.values()),
+                'loaded': self.loaded
+            }
+
+# Global share graph instance
+share_graph = ShareGraph()
+try:
+    share_graph.load()
+except Exception as e:
+    # Handlers fall back to SQL until the next successful load
+    logger.error(f"Failed to load share graph: {e}")
+if not INVALIDATION_BUS_ENABLED and SHARE_GRAPH_RELOAD_INTERVAL > 0:
+    share_graph.start_reloader(SHARE_GRAPH_RELOAD_INTERVAL)
+
+
+def resolve_user_id(username, active_only=True):
+    """User id for a username from the share graph, falling back to SQL"""
+    user_id = share_graph.user_id(username)
+    if user_id is not None:
+        return user_id
+
+    def get_user_id(cursor):
+        return execute_hot(cursor, 'user_id_active' if active_only else 'user_id_any', (username,)).fetchone()
+
+    row = handle_database_operation(get_user_id)
+    if not row:
+        return None
+    # The graph only indexes active users
+    if active_only or row[1]:
+        share_graph.add_user(row[0], username)
+    return row[0]
+
+
+class InvalidationBus:
+    """Cross-worker cache invalidation over PostgreSQL LISTEN/NOTIFY
+
+    Handlers publish typed events with pg_notify inside the transaction that
+    made the change, so events are only delivered once it commits. Every
+    worker runs a listener thread that applies events from other workers to
+    its in-process caches, and resyncs them whenever the listener
+    (re)connects since notifications sent while disconnected are lost.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.handlers = {}
+        self.resync_handlers = []
+        self.failure_handlers = []
+        self.failed = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.stats = {'published': 0, 'applied': 0, 'errors': 0, 'resyncs': 0}
+
+    def subscribe(self, event_type, handler):
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    def on_resync(self, handler):
+        self.resync_handlers.append(handler)
+
+    def on_failure(self, handler):
+        """Run handler if the listener stops for good, so caches fall back to reloading"""
+        self.failure_handlers.append(handler)
+
+    def is_listening(self):
+        """Whether other workers' events reach this process, so in-process caches can be trusted"""
+        return not self.failed and bool(self.thread and self.thread.is_alive())
+
+    def publish(self, cursor, event_type, **fields):
+        """Queue an event on the caller's transaction"""
+        event = dict(fields, type=event_type, origin=self.worker_id)
+        cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, json.dumps(event)))
+        with self.stats_lock:
+            self.stats['published'] += 1
+
+    def dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed invalidation event: {payload[:200]}")
+            return
+        if event.get('origin') == self.worker_id:
+            return  # Already applied locally by the publishing handler
+
+        for handler in self.handlers.get(event.get('type'), []):
+            try:
+                handler(event)
+                with self.stats_lock:
+                    self.stats['applied'] += 1
+            except Exception as e:
+                logger.error(f"Invalidation handler for {event.get('type')} failed: {e}")
+                with self.stats_lock:
+                    self.stats['errors'] += 1
+
+    def resync(self):
+        for handler in self.resync_handlers:
+            handler()
+        with self.stats_lock:
+            self.stats['resyncs'] += 1
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='invalidation-bus', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                with psycopg.connect(get_database_url(), autocommit=True) as conn:
+                    conn.execute(f'LISTEN {self.channel}')
+                    logger.info(f"Invalidation bus listening on {self.channel} as {self.worker_id}")
+                    self.resync()
+                    while not self.stop_event.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self.dispatch(notify.payload)
+            except TypeError as e:
+                # An API mismatch such as psycopg older than 3.2, retrying cannot help
+                logger.critical(f"Invalidation bus disabled, the listener cannot run: {e}")
+                self.failed = True
+                for handler in self.failure_handlers:
+                    handler()
+                return
+            except Exception as e:
+                logger.error(f"Invalidation bus listener error: {e}")
+                with self.stats_lock:
+                    self.stats['errors'] += 1
+                self.stop_event.wait(5)
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats, worker_id=self.worker_id, listening=self.is_listening(), failed=self.failed)
+
+# Global invalidation bus instance
+invalidation_bus = InvalidationBus(INVALIDATION_CHANNEL)
+invalidation_bus.subscribe('user_added', lambda e: share_graph.add_user(e['user_id'], e['username']))
+invalidation_bus.subscribe('user_deleted', lambda e: share_graph.remove_user(e['user_id']))
+invalidation_bus.subscribe('share_added', lambda e: share_graph.add_share(e['owner_id'], e['viewer_id']))
+invalidation_bus.subscribe('share_removed', lambda e: share_graph.remove_share(e['owner_id'], e['viewer_id']))
+invalidation_bus.on_resync(share_graph.load)
+if SHARE_GRAPH_RELOAD_INTERVAL > 0:
+    invalidation_bus.on_failure(lambda: share_graph.start_reloader(SHARE_GRAPH_RELOAD_INTERVAL))
+
+def pin_share_users(event):
+    """Extend read-your-writes pins to share changes made on other workers"""
+    replica_router.mark_write(share_graph.username(event['owner_id']), share_graph.username(event['viewer_id']))
+
+invalidation_bus.subscribe('share_added', pin_share_users)
+invalidation_bus.subscribe('share_removed', pin_share_users)
+
+def apply_batch_shares(event):
+    """Apply a batch share or unshare from another worker to the share graph and replica pins"""
+    change = share_graph.add_share if event['type'] == 'shares_added' else share_graph.remove_share
+    for viewer_id in event['viewer_ids']:
+        change(event['owner_id'], viewer_id)
+    replica_router.mark_write(share_graph.username(event['owner_id']),
+                              *(share_graph.username(viewer_id) for viewer_id in event['viewer_ids']))
+
+invalidation_bus.subscribe('shares_added', apply_batch_shares)
+invalidation_bus.subscribe('shares_removed', apply_batch_shares)
+invalidation_bus.subscribe('cookies_saved', lambda e: replica_router.mark_write(e['username']))
+if INVALIDATION_BUS_ENABLED:
+    invalidation_bus.start()
+
+def share_index_trusted():
+    """Whether share graph answers are current enough to serve without SQL
+
+    Only a listening bus delivers other workers' unshares as they happen;
+    without it they wait for the next reload, so share lists and access
+    checks read SQL instead.
+    """
+    return share_graph.loaded and invalidation_bus.is_listening()
+
+
+class FetchQueue:
+    """PostgreSQL-backed queue of timeline fetch jobs
+
+    Jobs are claimed with FOR UPDATE SKIP LOCKED so any number of worker
+    threads, processes or hosts can drain the same queue. A partial unique
+    index allows one queued or running job per (user_id, fetch_from_id),
+    which deduplicates concurrent requests across every web worker.
+
+    Claims are fair rather than FIFO: interactive jobs go before background
+    refreshes, then requesters with fewer running and recently started jobs
+    per unit of weight go first, and per-requester and per-owner caps keep
+    one user from occupying every worker.
+    """
+
+    # Serializes claims across processes so the concurrency caps are exact
+    CLAIM_LOCK_KEY = 7240315
+
+    def __init__(self, stale_after, max_attempts, max_per_requester, max_per_owner, fairness_window,
+                 requester_weights=None):
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.max_per_requester = max_per_requester
+        self.max_per_owner = max_per_owner
+        self.fairness_window = fairness_window
+        self.requester_weights = requester_weights or {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.waiters_lock = threading.Lock()
+        self.waiters = {}  # job_id -> Event set when the job may have finished
+
+    @staticmethod
+    def enqueue(cursor, user_id, fetch_from_id, priority=FETCH_PRIORITY_INTERACTIVE, budget=FETCH_JOB_DEADLINE):
+        """Return (job_id, created); created is False when a job is already active
+
+        The job must finish within `budget` seconds or it is failed, and a
+        crawl still running at that point is cancelled. A queued job already
+        past its deadline is failed here rather than joined, since no worker
+        may claim it before the maintenance pass does.
+        """
+        cursor.execute("""
+            UPDATE fetch_jobs
+            SET status = 'failed', error = 'Deadline exceeded', finished_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s AND fetch_from_id = %s
+            AND status = 'queued' AND deadline_at < CURRENT_TIMESTAMP
+            RETURNING id
+        """, (user_id, fetch_from_id))
+        if INVALIDATION_BUS_ENABLED:
+            for expired_id, in cursor.fetchall():
+                invalidation_bus.publish(cursor, 'fetch_job_finished', job_id=expired_id)
+        cursor.execute("""
+            INSERT INTO fetch_jobs (user_id, fetch_from_id, priority, deadline_at)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            ON CONFLICT (user_id, fetch_from_id) WHERE status IN ('queued', 'running')
+            DO NOTHING
+            RETURNING id
+        """, (user_id, fetch_from_id, priority, budget))
+        row = cursor.fetchone()
+        if row:
+            return row[0], True
+        cursor.execute("""
+            SELECT id FROM fetch_jobs
+            WHERE user_id = %s AND fetch_from_id = %s AND status IN ('queued', 'running')
+        """, (user_id, fetch_from_id))
+        row = cursor.fetchone()
+        return (row[0] if row else None), False
+
+    def claim(self, cursor):
+        """Claim the next job in fair order for this process
+
+        Returns (job_id, user_id, fetch_from_id, budget_seconds, resume_cursor)
+        or None, with a None budget for jobs queued before deadlines existed
+        and a resume cursor for jobs handed off by a shutting down worker.
+        """
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (self.CLAIM_LOCK_KEY,))
+        cursor.execute("""
+            WITH requester_running AS (
+                SELECT user_id, COUNT(*) AS n FROM fetch_jobs
+                WHERE status = 'running' GROUP BY user_id
+            ), owner_running AS (
+                SELECT fetch_from_id, COUNT(*) AS n FROM fetch_jobs
+                WHERE status = 'running' GROUP BY fetch_from_id
+            ), requester_recent AS (
+                -- Only requesters with queued jobs, each one a range scan of
+                -- idx_fetch_jobs_requester_started, so the cost does not grow
+                -- with finished jobs waiting for the reaper
+                SELECT j.user_id, COUNT(*) AS n
+                FROM (SELECT DISTINCT user_id FROM fetch_jobs WHERE status = 'queued') waiting
+                JOIN fetch_jobs j ON j.user_id = waiting.user_id
+                AND j.started_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+                GROUP BY j.user_id
+            ), requester_weight AS (
+                SELECT u.id AS user_id, w.weight
+                FROM unnest(%s::text[], %s::float8[]) AS w(username, weight)
+                JOIN users u ON u.username = w.username
+            ), next_job AS (
+                SELECT q.id FROM fetch_jobs q
+                LEFT JOIN requester_running rr ON rr.user_id = q.user_id
+                LEFT JOIN owner_running orr ON orr.fetch_from_id = q.fetch_from_id
+                LEFT JOIN requester_recent rc ON rc.user_id = q.user_id
+                LEFT JOIN requester_weight rw ON rw.user_id = q.user_id
+                WHERE q.status = 'queued'
+                AND (q.deadline_at IS NULL OR q.deadline_at > CURRENT_TIMESTAMP)
+                AND COALESCE(rr.n, 0) < GREATEST(1, ROUND(%s * COALESCE(rw.weight, 1)))
+                AND COALESCE(orr.n, 0) < %s
+                ORDER BY q.priority,
+                         COALESCE(rr.n, 0) / COALESCE(rw.weight, 1),
+                         COALESCE(rc.n, 0) / COALESCE(rw.weight, 1),
+                         COALESCE(orr.n, 0), q.created_at
+                LIMIT 1
+                FOR UPDATE OF q SKIP LOCKED
+            )
+            UPDATE fetch_jobs
+            SET status = 'running',
+                worker_id = %s,
+                attempts = attempts + 1,
+                started_at = CURRENT_TIMESTAMP,
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = (SELECT id FROM next_job)
+            RETURNING id, user_id, fetch_from_id,
+                      EXTRACT(EPOCH FROM deadline_at - CURRENT_TIMESTAMP)::float8, resume_cursor
+        """, (self.fairness_window, list(self.requester_weights), list(self.requester_weights.values()),
+              self.max_per_requester, self.max_per_owner, self.worker_id))
+        return cursor.fetchone()
+
+    @staticmethod
+    def finish(cursor, job_id, error=None):
+        """Mark a job done or failed; waiters in other processes hear it on commit
+
+        The caller wakes this process's waiters with job_finished() once the
+        transaction has committed.
+        """
+        cursor.execute("""
+            UPDATE fetch_jobs
+            SET status = %s, error = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, ('failed' if error else 'done', error, job_id))
+        if INVALIDATION_BUS_ENABLED:
+            invalidation_bus.publish(cursor, 'fetch_job_finished', job_id=job_id)
+
+    @staticmethod
+    def hand_off(cursor, job_id, resume_cursor):
+        """Requeue a job interrupted by shutdown without spending one of its attempts"""
+        cursor.execute("""
+            UPDATE fetch_jobs
+            SET status = 'queued',
+                worker_id = NULL,
+                attempts = GREATEST(attempts - 1, 0),
+                resume_cursor = %s
+            WHERE id = %s AND status = 'running'
+        """, (resume_cursor, job_id))
+
+    @staticmethod
+    def get_status(cursor, job_id):
+        """Return (status, error, queue_wait_seconds) for a job"""
+        cursor.execute("""
+            SELECT status, error,
+                   EXTRACT(EPOCH FROM COALESCE(started_at, CURRENT_TIMESTAMP) - created_at)
+            FROM fetch_jobs WHERE id = %s
+        """, (job_id,))
+        return cursor.fetchone()
+
+    def heartbeat(self, cursor):
+        """Mark this process's running jobs as alive"""
+        cursor.execute("""
+            UPDATE fetch_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND worker_id = %s
+        """, (self.worker_id,))
+
+    def requeue_stale(self, cursor):
+        """Return jobs whose worker stopped heartbeating to the queue, or fail them"""
+        cursor.execute("""
+            UPDATE fetch_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= %s THEN 'Worker lost' ELSE error END,
+                worker_id = NULL,
+                finished_at = CASE WHEN attempts >= %s THEN CURRENT_TIMESTAMP ELSE NULL END
+            WHERE status = 'running'
+            AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (self.max_attempts, self.max_attempts, self.max_attempts, self.stale_after))
+        return cursor.rowcount
+
+    @staticmethod
+    def expire_overdue(cursor):
+        """Fail queued jobs whose deadline passed before any worker claimed them"""
+        cursor.execute("""
+            UPDATE fetch_jobs
+            SET status = 'failed', error = 'Deadline exceeded', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'queued' AND deadline_at < CURRENT_TIMESTAMP
+        """)
+        return cursor.rowcount
+
+    @staticmethod
+    def delete_finished(cursor, limit):
+        """Delete at most `limit` jobs that finished over a day ago"""
+        cursor.execute("""
+            DELETE FROM fetch_jobs
+            WHERE id IN (
+                SELECT id FROM fetch_jobs
+                WHERE status IN ('done', 'failed')
+                AND finished_at < CURRENT_TIMESTAMP - INTERVAL '1 day'
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+        """, (limit,))
+        return cursor.rowcount
+
+    def job_finished(self, job_id):
+        """Wake requests in this process waiting on a job"""
+        with self.waiters_lock:
+            woken = self.waiters.get(job_id)
+        if woken:
+            woken.set()
+
+    def wake_waiters(self):
+        """Make every waiter re-check its job, after lost notifications or on shutdown"""
+        with self.waiters_lock:
+            for woken in self.waiters.values():
+                woken.set()
+
+    def wait(self, job_id, timeout, stop_event, poll_interval=1.0):
+        """Wait for a job to finish; returns get_status() or None on timeout or stop_event
+
+        With the invalidation bus on, the job's finish event wakes the waiter
+        and the status is polled with backoff only to catch jobs failed by
+        recovery or expiry, which publish no event. Without the bus every
+        poll_interval. Whoever sets stop_event must call wake_waiters().
+        """
+        deadline = time.monotonic() + timeout
+        woken = threading.Event()
+        with self.waiters_lock:
+            self.waiters[job_id] = woken
+        interval = poll_interval
+        try:
+            while True:
+                woken.clear()
+                row = handle_database_operation(lambda cursor: self.get_status(cursor, job_id))
+                if not row or row[0] in ('done', 'failed'):
+                    return row
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                woken.wait(min(interval, remaining))
+                if stop_event.is_set():
+                    return None
+                if INVALIDATION_BUS_ENABLED:
+                    interval = min(interval * 2, FETCH_WAIT_MAX_POLL)
+        finally:
+            with self.waiters_lock:
+                if self.waiters.get(job_id) is woken:
+                    del self.waiters[job_id]
+
+# Global fetch queue instance
+fetch_queue = FetchQueue(FETCH_JOB_STALE_AFTER, FETCH_JOB_MAX_ATTEMPTS, FETCH_MAX_PER_REQUESTER,
+                         FETCH_MAX_PER_OWNER, FETCH_FAIRNESS_WINDOW, FETCH_REQUESTER_WEIGHTS)
+invalidation_bus.subscribe('fetch_job_finished', lambda e: fetch_queue.job_finished(e['job_id']))
+invalidation_bus.on_resync(fetch_queue.wake_waiters)
+
+
+class FetchWorkerPool:
+    """Threads that claim fetch jobs, crawl with twikit and write the timeline cache
+
+    Runs embedded in each web process (FETCH_WORKER_THREADS threads) and in
+    standalone `python server.py fetch-worker` processes.
+    """
+
+    def __init__(self, queue, threads, poll_interval):
+        self.queue = queue
+        self.thread_count = threads
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.draining = threading.Event()
+        self.threads = []
+        self.workers = []
+        # job_id -> (event loop, crawl task) for cancelling crawls from drain()
+        self.active_lock = threading.Lock()
+        self.active = {}
+        self.stats_lock = threading.Lock()
+        self.stats = {'claimed': 0, 'succeeded': 0, 'failed': 0, 'requeued_stale': 0,
+                      'expired': 0, 'cancelled': 0, 'handed_off': 0, 'last_drain_seconds': None}
+
+    def start(self):
+        if self.thread_count <= 0:
+            return
+        self.stop_event.clear()
+        for i in range(self.thread_count):
+            thread = threading.Thread(target=self.run, name=f'fetch-worker-{i}', daemon=True)
+            thread.start()
+            self.workers.append(thread)
+        maintenance = threading.Thread(target=self.run_maintenance, name='fetch-maintenance', daemon=True)
+        maintenance.start()
+        self.threads = self.workers + [maintenance]
+        logger.info(f"Started {self.thread_count} fetch worker threads as {self.queue.worker_id}")
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.queue.wake_waiters()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def drain(self, timeout, handoff_timeout):
+        """Stop claiming jobs and give in-flight crawls `timeout` seconds to finish
+
+        Crawls still running after that are cancelled; each saves the tweets
+        it has to the timeline cache and goes back to the queue with its
+        cursor so the next worker continues where it stopped. The maintenance
+        thread keeps heartbeating until then so the jobs are not recovered
+        as stale in the meantime. Returns the drain time in seconds.
+        """
+        started = time.monotonic()
+        self.draining.set()
+        with self.active_lock:
+            in_flight = len(self.active)
+        logger.info(f"Draining fetch workers: {in_flight} crawls in flight, waiting up to {timeout}s")
+
+        deadline = started + timeout
+        for thread in self.workers:
+            thread.join(max(deadline - time.monotonic(), 0))
+        with self.active_lock:
+            for loop, task in self.active.values():
+                loop.call_soon_threadsafe(task.cancel)
+        deadline = time.monotonic() + handoff_timeout
+        for thread in self.workers:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self.stop(timeout=1)
+
+        elapsed = time.monotonic() - started
+        with self.stats_lock:
+            self.stats['last_drain_seconds'] = round(elapsed, 3)
+            handed_off = self.stats['handed_off']
+        logger.info(f"Fetch workers drained in {elapsed:.2f}s, {handed_off} jobs handed off")
+        return elapsed
+
+    def run(self):
+        while not self.stop_event.is_set() and not self.draining.is_set():
+            try:
+                job = handle_database_operation(self.queue.claim, workload='cache_write')
+            except Exception as e:
+                logger.error(f"Failed to claim fetch job: {e}")
+                job = None
+            if not job:
+                self.stop_event.wait(self.poll_interval)
+                continue
+            with self.stats_lock:
+                self.stats['claimed'] += 1
+            self.process(*job)
+
+    def run_maintenance(self):
+        """Heartbeat owned jobs and recover jobs from dead workers"""
+        interval = max(self.queue.stale_after / 4, 1)
+        while not self.stop_event.wait(interval):
+            try:
+                handle_database_operation(self.queue.heartbeat)
+                requeued = handle_database_operation(self.queue.requeue_stale)
+                if requeued:
+                    logger.warning(f"Recovered {requeued} fetch jobs from unresponsive workers")
+                    with self.stats_lock:
+                        self.stats['requeued_stale'] += requeued
+                expired = handle_database_operation(self.queue.expire_overdue)
+                if expired:
+                    logger.warning(f"Expired {expired} fetch jobs that were never claimed before their deadline")
+                    with self.stats_lock:
+                        self.stats['expired'] += expired
+            except Exception as e:
+                logger.error(f"Fetch job maintenance failed: {e}")
+
+    async def crawl(self, job_id, cookies, user_id, fetch_from_id, progress, budget):
+        """Run one crawl as a task drain() can cancel from another thread"""
+        with self.active_lock:
+            self.active[job_id] = (asyncio.get_running_loop(), asyncio.current_task())
+        try:
+            # wait_for cancels the crawl coroutine once the job's budget runs out
+            return await asyncio.wait_for(
+                tweet_fetcher.fetch_tweets_for_user(cookies, user_id, fetch_from_id, progress),
+                timeout=budget
+            )
+        finally:
+            with self.active_lock:
+                self.active.pop(job_id, None)
+
+    def hand_off(self, job_id, user_id, fetch_from_id, progress):
+        """Save a cancelled crawl's tweets and requeue its job at the cursor it reached"""
+        def persist(cursor):
+            if progress.tweets:
+                tweet_store.store_timeline(cursor, user_id, fetch_from_id, progress.tweets)
+            self.queue.hand_off(cursor, job_id, progress.cursor if progress.tweets else None)
+
+        handle_database_operation(persist, workload='cache_write')
+        logger.info(f"Fetch job {job_id} handed off with {len(progress.tweets)} tweets saved")
+        with self.stats_lock:
+            self.stats['handed_off'] += 1
+
+    def process(self, job_id, user_id, fetch_from_id, budget=None, resume_cursor=None):
+        progress = CrawlProgress()
+        try:
+            started = time.monotonic()
+            cookies_row = handle_database_operation(
+                lambda cursor: execute_hot(cursor, 'user_cookies', (fetch_from_id,)).fetchone(),
+                workload='cache_write'
+            )
+            if not cookies_row:
+                raise ValidationError('Target user has not saved their cookies yet')
+
+            if resume_cursor:
+                # Continue a handed off crawl while its partial timeline is still cached
+                cached = handle_database_operation(
+                    lambda cursor: tweet_store.load_timeline(cursor, user_id, fetch_from_id),
+                    workload='cache_write'
+                )
+                if cached:
+                    progress = CrawlProgress(list(cached[0]), resume_cursor)
+                    logger.info(f"Fetch job {job_id} resuming after {len(progress.tweets)} tweets")
+
+            if budget is not None:
+                budget -= time.monotonic() - started
+                if budget <= 0:
+                    raise DeadlineExceeded('Deadline exceeded before the crawl started')
+            try:
+                tweets_data = asyncio.run(
+                    self.crawl(job_id, cookies_row[0], user_id, fetch_from_id, progress, budget)
+                )
+            except asyncio.TimeoutError:
+                with self.stats_lock:
+                    self.stats['cancelled'] += 1
+                raise DeadlineExceeded('Deadline exceeded, crawl cancelled')
+            except asyncio.CancelledError:
+                # Cancelled by drain() during shutdown
+                self.hand_off(job_id, user_id, fetch_from_id, progress)
+                return
+
+            def store_and_finish(cursor):
+                tweet_store.store_timeline(cursor, user_id, fetch_from_id, tweets_data)
+                self.queue.finish(cursor, job_id)
+
+            handle_database_operation(store_and_finish, workload='cache_write')
+            self.queue.job_finished(job_id)
+            logger.info(f"Fetch job {job_id} stored {len(tweets_data)} tweets for {user_id} from {fetch_from_id}")
+            with self.stats_lock:
+                self.stats['succeeded'] += 1
+
+        except Exception as e:
+            logger.error(f"Fetch job {job_id} failed: {e}")
+            with self.stats_lock:
+                self.stats['failed'] += 1
+            error = str(e)[:500]
+            try:
+                handle_database_operation(lambda cursor: self.queue.finish(cursor, job_id, error),
+                                          workload='cache_write')
+                self.queue.job_finished(job_id)
+            except Exception as finish_error:
+                logger.error(f"Failed to record failure of fetch job {job_id}: {finish_error}")
+
+    def get_stats(self):
+        with self.active_lock:
+            in_flight = len(self.active)
+        with self.stats_lock:
+            return dict(self.stats, threads=self.thread_count, worker_id=self.queue.worker_id,
+                        in_flight=in_flight, draining=self.draining.is_set())
+
+# Embedded fetch workers, set FETCH_WORKER_THREADS=0 to run web-only processes
+fetch_workers = FetchWorkerPool(fetch_queue, FETCH_WORKER_THREADS, FETCH_POLL_INTERVAL)
+fetch_workers.start()
+
+shutdown_lock = threading.Lock()
+shutdown_thread = None
+
+def begin_graceful_shutdown():
+    """Start draining fetch workers in a background thread, once per process"""
+    global shutdown_thread
+    with shutdown_lock:
+        if shutdown_thread is None:
+            shutdown_thread = threading.Thread(target=fetch_workers.drain,
+                                               args=(SHUTDOWN_DRAIN_TIMEOUT, SHUTDOWN_HANDOFF_TIMEOUT),
+                                               name='shutdown-drain', daemon=True)
+            shutdown_thread.start()
+        return shutdown_thread
+
+def graceful_shutdown():
+    """Drain fetch workers and wait for the drain, registered with atexit"""
+    begin_graceful_shutdown().join(SHUTDOWN_DRAIN_TIMEOUT + SHUTDOWN_HANDOFF_TIMEOUT + 5)
+
+def install_shutdown_handler():
+    """Start the drain as soon as SIGTERM arrives, then run the previous handler
+
+    atexit alone is too late under gunicorn: a worker only exits once its
+    in-flight requests finish, and a fetch-feed waiting on a crawl can
+    outlast graceful_timeout. gunicorn.conf.py calls this from
+    post_worker_init, `python server.py` from its entry point. Must run in
+    the main thread.
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        begin_graceful_shutdown()
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+atexit.register(graceful_shutdown)
+
+
+class MemoryRateLimitStore:
+    """Per-process sliding-window counters
+
+    Each key keeps the hit counts of the current and previous fixed window;
+    the sliding estimate weights the previous window by how much of it still
+    overlaps the sliding window, so memory is O(1) per key. At most max_keys
+    keys are kept; the least recently hit key is evicted to make room.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> [window_start, current_hits, previous_hits], least recent first
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        """Count a hit; return (allowed, retry_after_seconds)"""
+        return self.hit_all([(key, limit, window)])
+
+    def hit_all(self, rules, count=True):
+        """Check (key, limit, window) rules together, counting a hit on every key only if all allow
+
+        Returns (allowed, retry_after_seconds) with the longest wait of the
+        rejecting rules. With count=False nothing is counted.
+        """
+        now = time.time()
+        with self.lock:
+            entries = []
+            waits = []
+            for key, limit, window in rules:
+                start = now - now % window
+                entry = self.bucket(key, start, window)
+                entries.append(entry)
+                allowed, retry_after = sliding_window_check(entry[1], entry[2], limit, window, now - start)
+                if not allowed:
+                    waits.append(retry_after)
+            if waits:
+                return False, max(waits)
+            if count:
+                for entry in entries:
+                    entry[1] += 1
+            return True, 0
+
+    def bucket(self, key, start, window):
+        """The key's counters rolled forward to the window at start, caller holds the lock"""
+        entry = self.buckets.get(key)
+        if entry is None:
+            while len(self.buckets) >= self.max_keys:
+                self.buckets.popitem(last=False)
+            entry = self.buckets[key] = [start, 0, 0]
+        else:
+            self.buckets.move_to_end(key)
+            if entry[0] < start - window:
+                entry[:] = [start, 0, 0]
+            elif entry[0] < start:
+                entry[:] = [start, 0, entry[1]]
+        return entry
+
+
+class PostgresRateLimitStore:
+    """Sliding-window counters shared by every worker through PostgreSQL
+
+    Like the memory store only allowed requests are counted, on every rule at
+    once, so clients that keep retrying while limited do not push their own
+    Retry-After further out.
+    """
+
+    @staticmethod
+    def hit(key, limit, window):
+        return PostgresRateLimitStore.hit_all([(key, limit, window)])
+
+    @staticmethod
+    def hit_all(rules, count=True):
+        """Same contract as MemoryRateLimitStore.hit_all, atomic across workers"""
+        now = time.time()
+        starts = [int(now - now % window) for _, _, window in rules]
+        keys = [key for key, _, _ in rules]
+        pair_keys = keys + keys
+        pair_starts = starts + [start - window for start, (_, _, window) in zip(starts, rules)]
+
+        def count_hits(cursor):
+            conn = cursor.connection
+            with conn.pipeline():
+                if count:
+                    cursor.executemany("""
+                        INSERT INTO rate_limit_counters (bucket_key, window_start, hits, expires_at)
+                        VALUES (%s, %s, 0, CURRENT_TIMESTAMP + make_interval(secs => %s))
+                        ON CONFLICT (bucket_key, window_start) DO NOTHING
+                    """, [(key, start, 2 * window) for (key, _, window), start in zip(rules, starts)])
+                # Locking every rule's rows in key order makes the check and the
+                # increments atomic without deadlocking concurrent multi-rule checks
+                cursor.execute(f"""
+                    SELECT bucket_key, window_start, hits FROM rate_limit_counters
+                    WHERE (bucket_key, window_start) IN (SELECT * FROM unnest(%s::text[], %s::bigint[]))
+                    ORDER BY bucket_key, window_start
+                    {'FOR UPDATE' if count else ''}
+                """, (pair_keys, pair_starts))
+                hits = {(key, start): value for key, start, value in cursor.fetchall()}
+
+            waits = []
+            for (key, limit, window), start in zip(rules, starts):
+                allowed, retry_after = sliding_window_check(
+                    hits.get((key, start), 0), hits.get((key, start - window), 0), limit, window, now - start)
+                if not allowed:
+                    waits.append(retry_after)
+            if waits:
+                return False, max(waits)
+            if count:
+                cursor.execute("""
+                    UPDATE rate_limit_counters c SET hits = c.hits + 1
+                    FROM unnest(%s::text[], %s::bigint[]) AS r(bucket_key, window_start)
+                    WHERE c.bucket_key = r.bucket_key AND c.window_start = r.window_start
+                """, (keys, starts))
+            return True, 0
+
+        return handle_database_operation(count_hits)
+
+    @staticmethod
+    def delete_expired(cursor, limit):
+        """Delete at most `limit` counters whose windows have passed"""
+        cursor.execute("""
+            DELETE FROM rate_limit_counters
+            WHERE (bucket_key, window_start) IN (
+                SELECT bucket_key, window_start FROM rate_limit_counters
+                WHERE expires_at < CURRENT_TIMESTAMP
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+        """, (limit,))
+        return cursor.rowcount
+
+def sliding_window_check(current, previous, limit, window, elapsed):
+    """Return (allowed, retry_after) for the sliding estimate of a window"""
+    overlap = 1 - elapsed / window
+    if previous * overlap + current < limit:
+        return True, 0
+    if current >= limit or not previous:
+        wait = window - elapsed
+    else:
+        # Time until the previous window's weight drops the estimate under the limit
+        wait = window * (1 - (limit - current) / previous) - elapsed
+    return False, max(1, math.ceil(wait))
+
+# Per-route policies: (max requests, window seconds, key) where key is 'ip',
+# 'user' (authenticated username) or 'login' (username in the request body
+# together with the client address). 'login_failure' is not a route: login
+# counts it only for failed password checks, and keys it on the address too
+# so nobody can lock another user out of their account.
+RATE_LIMIT_POLICIES = {
+    'register': [(5, 3600, 'ip')],
+    'login': [(10, 60, 'ip')],
+    'login_failure': [(5, 300, 'login')],
+    'delete_account': [(5, 3600, 'user')],
+    'save_cookies': [(20, 3600, 'user')],
+    'share_feed': [(60, 60, 'user')],
+    'share_batch': [(10, 60, 'user')],
+    'unshare_batch': [(10, 60, 'user')],
+    'fetch_feed': [(30, 60, 'user'), (120, 60, 'ip')],
+    'search': [(60, 60, 'user')],
+    'media': [(600, 60, 'ip')],
+}
+
+def client_ip():
+    """Client address, taking the first X-Forwarded-For hop when behind a trusted proxy"""
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def rate_limit_subject(key_type):
+    if key_type == 'user':
+        user = getattr(request, 'current_user', None)
+        return f"user:{user}" if user else f"ip:{client_ip()}"
+    if key_type == 'login':
+        data = request.get_json(silent=True) or {}
+        username = data.get('username') if isinstance(data, dict) else None
+        return f"login:{str(username).lower()[:50]}:{client_ip()}" if username else None
+    return f"ip:{client_ip()}"
+
+class RateLimiter:
+    """Applies RATE_LIMIT_POLICIES using the memory or the shared PostgreSQL store"""
+
+    def __init__(self, store_name):
+        self.memory = MemoryRateLimitStore()
+        self.shared = PostgresRateLimitStore() if store_name == 'postgres' else None
+        self.stats_lock = threading.Lock()
+        self.stats = {'allowed': 0, 'limited': 0, 'store_errors': 0}
+
+    def hit_all(self, rules, count=True):
+        if self.shared:
+            try:
+                return self.shared.hit_all(rules, count)
+            except Exception as e:
+                # Fail over to per-process limits rather than rejecting traffic
+                logger.error(f"Shared rate limit store failed: {e}")
+                with self.stats_lock:
+                    self.stats['store_errors'] += 1
+        return self.memory.hit_all(rules, count)
+
+    def check(self, policy, count=True):
+        """Return None if the request may proceed, else seconds to wait
+
+        A hit is counted on every rule of the policy only if all of them allow
+        the request. With count=False the policy is checked without a hit.
+        """
+        rules = []
+        for limit, window, key_type in RATE_LIMIT_POLICIES[policy]:
+            subject = rate_limit_subject(key_type)
+            if subject is not None:
+                rules.append((f"{policy}:{window}:{subject}", limit, window))
+        if not rules:
+            return None
+        allowed, retry_after = self.hit_all(rules, count)
+        if not allowed:
+            with self.stats_lock:
+                self.stats['limited'] += 1
+            logger.warning(f"Rate limit {policy} exceeded by {', '.join(key for key, _, _ in rules)}")
+            return retry_after
+        if count:
+            with self.stats_lock:
+                self.stats['allowed'] += 1
+        return None
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats, store='postgres' if self.shared else 'memory')
+
+# Global rate limiter instance
+rate_limiter = RateLimiter(RATE_LIMIT_STORE)
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock sampler producing collapsed stacks
+
+    A daemon thread snapshots every other thread's stack with
+    sys._current_frames() at a fixed interval and counts identical stacks.
+    Output is in the collapsed format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.started_at = None
+        self.interval = None
+
+    @property
+    def running(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def start(self, interval, max_seconds):
+        with self.lock:
+            if self.running:
+                return False
+            self.counts = Counter()
+            self.samples = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, args=(max_seconds,), name='sampling-profiler', daemon=True)
+            self.thread.start()
+        logger.info(f"Sampling profiler started (interval={interval * 1000:.1f}ms, max={max_seconds}s)")
+        return True
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+        return self.collapsed()
+
+    def run(self, max_seconds):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stacks.append(';'.join(reversed(frames)))
+            with self.lock:
+                self.counts.update(stacks)
+                self.samples += 1
+
+    def collapsed(self):
+        with self.lock:
+            return '\n'.join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'running': self.running,
+                'samples': self.samples,
+                'interval_ms': self.interval * 1000 if self.interval else None,
+                'started_at': datetime.utcfromtimestamp(self.started_at).isoformat() if self.started_at else None
+            }
+
+# Global profiler instance, idle until started through the admin endpoint
+sampling_profiler = SamplingProfiler()
+
+
+class MediaTooLarge(Exception):
+    """Raised when an origin response exceeds MEDIA_MAX_OBJECT_BYTES"""
+    pass
+
+class MediaRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow origin redirects only to hosts the media cache accepts"""
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not self.cache.is_allowed(newurl):
+            raise urllib.error.HTTPError(newurl, code, 'Redirect to a disallowed host', headers, fp)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+class MediaCache:
+    """Bounded on-disk LRU of proxied tweet media, stored by content hash
+
+    objects/<sha256> holds each distinct body once and urls/<sha256 of url>
+    maps a source URL to its body and content type, so the same image
+    reached through different URLs is stored once. Serving a body touches
+    its mtime, which orders eviction. The directory is the only shared
+    state: every process using it (one per gunicorn worker) rescans it
+    under a file lock, so max_bytes bounds the whole cache rather than each
+    worker's view of it. URL entries are removed with their bodies.
+    """
+
+    def __init__(self, directory, max_bytes, max_object_bytes, allowed_hosts, secret):
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.urls_dir = os.path.join(directory, 'urls')
+        self.lock_path = os.path.join(directory, 'evict.lock')
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.allowed_hosts = allowed_hosts
+        self.secret = secret.encode('utf-8')
+        self.opener = urllib.request.build_opener(MediaRedirectHandler(self))
+        self.lock = threading.Lock()
+        self.fetch_locks = {}  # url key -> lock, one origin fetch per URL at a time
+        self.oversized = set()
+        # Rescan after this process has written this many bytes; other
+        # workers rescan after their own writes, so N workers can each add
+        # up to this much before a scan and overshoot max_bytes by N times it
+        self.scan_bytes = max(1, int(max_bytes * MEDIA_CACHE_SCAN_FRACTION))
+        self.bytes_since_scan = 0
+        self.disk_objects = 0  # as of the last scan
+        self.disk_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'origin_errors': 0, 'bytes_fetched': 0}
+
+    def open(self):
+        """Create the cache directories, trim them to max_bytes and drop orphaned URL entries"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.urls_dir, exist_ok=True)
+        self.evict(sweep_urls=True)
+        logger.info(f"Media cache opened with {self.disk_objects} objects ({self.disk_bytes} bytes)")
+
+    def is_allowed(self, url):
+        parsed = urlparse(url)
+        return parsed.scheme in ('http', 'https') and parsed.netloc in self.allowed_hosts
+
+    def sign(self, url):
+        return hmac.new(self.secret, url.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    @staticmethod
+    def url_key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash)
 
-def require_auth(f):
-    """Decorator to require authentication for protected routes"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Missing or invalid authorization header'}), 401
+    def url_path(self, url):
+        return os.path.join(self.urls_dir, self.url_key(url))
 
+    def lookup(self, url):
+        """Return (content_hash, content_type) for a cached URL, or None"""
         try:
-            token = auth_header.split(' ')[1]
-            username = verify_jwt_token(token)
-            
-            if not username:
-                return jsonify({'error': 'Invalid or expired token'}), 401
-                
-            # Add username to request context for use in the route
-            request.current_user = username
-            return f(*args, **kwargs)
-            
-        except Exception as e:
-            logger.error(f"Authentication error: {e}")
-            return jsonify({'error': 'Authentication failed'}), 500
-            
-    return decorated_function
+            with open(self.url_path(url), encoding='utf-8') as f:
+                content_hash, content_type = f.read().split('\n', 1)
+        except (OSError, ValueError):
+            return None
+        return content_hash, content_type
 
-def handle_database_operation(operation):
-    """Wrapper for database operations with comprehensive error handling"""
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
-        if db_pool is None:
-            logger.error("Database connection pool not initialized")
-            raise DatabaseError("Database connection pool not initialized")
+    def open_object(self, url, timeout):
+        """Return (file, content_type, content_hash) for a URL, fetching it from the origin on a miss"""
+        if url in self.oversized:
+            raise MediaTooLarge(url)
+        for _ in range(2):
+            entry = self.lookup(url)
+            if entry is None:
+                entry = self.fetch_once(url, timeout)
+            else:
+                with self.lock:
+                    self.stats['hits'] += 1
+            content_hash, content_type = entry
+            try:
+                media_file = open(self.object_path(content_hash), 'rb')
+            except FileNotFoundError:
+                # Evicted, possibly by another worker, since the URL entry
+                # was read. Drop the entry and fetch the body again
+                self.remove(self.url_path(url))
+                continue
+            # mtime orders eviction, in every process sharing the directory
+            os.utime(media_file.fileno())
+            return media_file, content_type, content_hash
+        raise FileNotFoundError(url)
+
+    def fetch_once(self, url, timeout):
+        """Fetch a URL unless a concurrent request for it already did"""
+        key = self.url_key(url)
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(key, threading.Lock())
         try:
-            with db_lock:
-                with db_pool.connection() as conn:
-                    with conn.cursor() as cursor:
-                        return operation(cursor)
-                        
-        except (psycopg.OperationalError, PoolTimeout) as e:
-            logger.warning(f"Database operation failed (attempt {attempt + 1}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
+            with fetch_lock:
+                entry = self.lookup(url)
+                if entry is not None and os.path.exists(self.object_path(entry[0])):
+                    with self.lock:
+                        self.stats['hits'] += 1
+                    return entry
+                with self.lock:
+                    self.stats['misses'] += 1
+                return self.fetch(url, timeout)
+        finally:
+            with self.lock:
+                self.fetch_locks.pop(key, None)
+
+    def fetch(self, url, timeout):
+        """Stream a URL into the cache while hashing it, return (content_hash, content_type)"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, self.opener.open(url, timeout=timeout) as response:
+                content_type = response.headers.get_content_type()
+                while True:
+                    chunk = response.read(MEDIA_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_object_bytes:
+                        if len(self.oversized) < 10000:
+                            self.oversized.add(url)
+                        raise MediaTooLarge(url)
+                    digest.update(chunk)
+                    out.write(chunk)
+            content_hash = digest.hexdigest()
+            # Same bytes under another URL land on the same name, so they
+            # are still stored once, and replacing is atomic for readers
+            os.replace(tmp_path, self.object_path(content_hash))
+            fd, url_tmp_path = tempfile.mkstemp(dir=self.urls_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(f"{content_hash}\n{content_type}")
+            os.replace(url_tmp_path, self.url_path(url))
+        except BaseException:
+            with self.lock:
+                self.stats['origin_errors'] += 1
+            self.remove(tmp_path)
+            raise
+        with self.lock:
+            self.stats['bytes_fetched'] += size
+            self.bytes_since_scan += size
+            scan_due = self.bytes_since_scan >= self.scan_bytes
+        if scan_due:
+            self.evict()
+        return content_hash, content_type
+
+    def evict(self, sweep_urls=False):
+        """Delete least recently served bodies until the directory is under its low watermark
+
+        Sizes and recency are read from disk, so bodies other workers fetched
+        count too. One process scans at a time; a worker that finds the lock
+        taken skips, since the holder is already trimming the same directory.
+        """
+        with self.lock:
+            self.bytes_since_scan = 0
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+            now = time.time()
+            entries = []
+            total = 0
+            for entry in os.scandir(self.objects_dir):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.tmp'):
+                    # Left by a fetch interrupted by a crash
+                    if now - stat.st_mtime > MEDIA_TMP_MAX_AGE:
+                        self.remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+                total += stat.st_size
+            evicted = 0
+            if total > self.max_bytes:
+                target = self.max_bytes * MEDIA_CACHE_LOW_WATERMARK
+                entries.sort()
+                # Keep the most recent body even if it alone exceeds the cap
+                for _, name, size in entries[:-1]:
+                    if total <= target:
+                        break
+                    # Open readers and mmaps keep their data until they close
+                    self.remove(self.object_path(name))
+                    total -= size
+                    evicted += 1
+            if evicted or sweep_urls:
+                self.sweep_urls(now)
+        with self.lock:
+            self.stats['evictions'] += evicted
+            self.disk_objects = len(entries) - evicted
+            self.disk_bytes = total
+
+    def sweep_urls(self, now):
+        """Remove URL entries whose body is gone, and temp files of crashed fetches"""
+        for entry in os.scandir(self.urls_dir):
+            try:
+                if entry.name.endswith('.tmp'):
+                    if now - entry.stat().st_mtime > MEDIA_TMP_MAX_AGE:
+                        self.remove(entry.path)
+                    continue
+                with open(entry.path, encoding='utf-8') as f:
+                    content_hash = f.read().split('\n', 1)[0]
+                if not os.path.exists(self.object_path(content_hash)):
+                    self.remove(entry.path)
+            except FileNotFoundError:
                 continue
-            logger.error(f"Database operation failed after {max_retries} attempts")
-            raise DatabaseError("Database operation failed after multiple retries")
-            
-        except psycopg.IntegrityError as e:
-            logger.warning(f"Database integrity error: {e}")
-            raise  # Re-raise integrity errors immediately
-            
-        except Exception as e:
-            logger.error(f"Unexpected database error: {e}")
-            raise DatabaseError(f"Unexpected database error: {e}")
 
-def save_user_cookies(cursor, username, cookies_json):
-    # Convert the dictionary to a JSON string
-    cookies_json_str = json.dumps(cookies_json)
-    # Create table if not exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_cookies (
-            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-            cookies JSONB NOT NULL,
-            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (user_id)
-        )
-    """)
-    # Upsert cookies
-    cursor.execute("""
-        INSERT INTO user_cookies (user_id, cookies, updated_at)
-        VALUES (
-            (SELECT id FROM users WHERE username = %s),
-            %s,
-            CURRENT_TIMESTAMP
-        )
-        ON CONFLICT (user_id) DO UPDATE
-        SET cookies = EXCLUDED.cookies,
-            updated_at = EXCLUDED.updated_at
-    """, (username, cookies_json_str))
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, objects=self.disk_objects, bytes=self.disk_bytes, max_bytes=self.max_bytes)
+
+def serve_media(media_file, content_type, content_hash):
+    """Stream a cached body from a memory map, honouring single byte-range requests"""
+    with media_file:
+        size = os.fstat(media_file.fileno()).st_size
+        headers = {
+            'ETag': f'"{content_hash}"',
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'public, max-age=86400'
+        }
+        if content_hash in request.if_none_match:
+            return Response(status=304, headers=headers)
+
+        start, end, status = 0, size, 200
+        if request.range and len(request.range.ranges) == 1:
+            byte_range = request.range.range_for_length(size)
+            if byte_range is None:
+                headers['Content-Range'] = f'bytes */{size}'
+                return Response(status=416, headers=headers)
+            start, end = byte_range
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        headers['Content-Length'] = str(end - start)
+        if size == 0:
+            return Response(b'', status=status, headers=headers, content_type=content_type)
+        # The map stays valid after the file closes, and after eviction unlinks it
+        view = mmap.mmap(media_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def body():
+        try:
+            for offset in range(start, end, MEDIA_CHUNK_SIZE):
+                yield view[offset:min(offset + MEDIA_CHUNK_SIZE, end)]
+        finally:
+            view.close()
+
+    return Response(body(), status=status, headers=headers, content_type=content_type)
+
+def proxy_media_url(url):
+    """Rewrite an allowed media URL to the proxy, keeping its file name so clients can tell videos apart"""
+    if not url or not media_cache.is_allowed(url):
+        return url
+    token = base64.urlsafe_b64encode(url.encode('utf-8')).rstrip(b'=').decode('ascii')
+    filename = os.path.basename(urlparse(url).path) or 'media'
+    return url_for('media_proxy', signature=media_cache.sign(url), token=token,
+                   filename=filename, _external=True)
+
+def rewrite_media_urls(tweets):
+    """Copies of tweets with profile images and media served by the proxy, when enabled"""
+    if media_cache is None:
+        return tweets
+    return [dict(tweet,
+                 profile_image_url=proxy_media_url(tweet.get('profile_image_url')),
+                 media=[proxy_media_url(url) for url in tweet.get('media') or []])
+            for tweet in tweets]
+
+# Global media cache, None unless MEDIA_PROXY_ENABLED
+media_cache = None
+if MEDIA_PROXY_ENABLED:
+    media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_MAX_OBJECT_BYTES,
+                             MEDIA_ALLOWED_HOSTS, SECRET_KEY)
+    media_cache.open()
+
+def rate_limited_response(retry_after):
+    response = jsonify({'error': 'Too many requests, please retry later',
+                        'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def rate_limit(policy):
+    """Decorator enforcing a RATE_LIMIT_POLICIES entry, place below require_auth"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if RATE_LIMIT_ENABLED:
+                retry_after = rate_limiter.check(policy)
+                if retry_after is not None:
+                    return rate_limited_response(retry_after)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def run_fetch_worker():
+    """Standalone fetch worker: drain the job queue without serving HTTP"""
+    if fetch_workers.thread_count <= 0:
+        raise ValueError("FETCH_WORKER_THREADS must be positive for a fetch worker")
+    logger.info(f"Fetch worker {fetch_queue.worker_id} running, press Ctrl+C to stop")
+    try:
+        while not fetch_workers.stop_event.wait(1):
+            pass
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Fetch worker stopping")
+        graceful_shutdown()
 
 
 # Error handlers
@@ -462,6 +3077,11 @@ def handle_auth_error(e):
     logger.warning(f"Authentication error: {e}")
     return jsonify({'error': 'Authentication failed'}), 401
 
+@app.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(e):
+    logger.warning(f"Deadline exceeded for {request.method} {request.path}: {e}")
+    return jsonify({'error': 'Request timed out'}), 504
+
 @app.errorhandler(DatabaseError)
 def handle_database_error(e):
     logger.error(f"Database error: {e}")
@@ -481,6 +3101,7 @@ def handle_internal_server_error(e):
     return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/register', methods=['POST'])
+@rate_limit('register')
 def register():
     """Register a new user with comprehensive validation and error handling"""
     try:
@@ -518,12 +3139,15 @@ def register():
         # Database operation
         def register_user(cursor):
             cursor.execute(
-                'INSERT INTO users (username, password_hash, email) VALUES (%s, %s, %s)',
+                'INSERT INTO users (username, password_hash, email) VALUES (%s, %s, %s) RETURNING id',
                 (username, password_hash, email)
             )
-            return True
+            user_id = cursor.fetchone()[0]
+            invalidation_bus.publish(cursor, 'user_added', user_id=user_id, username=username)
+            return user_id
 
-        handle_database_operation(register_user)
+        user_id = handle_database_operation(register_user)
+        share_graph.add_user(user_id, username)
 
         # Generate JWT token
         token = generate_jwt_token(username)
@@ -545,11 +3169,14 @@ def register():
     except DatabaseError as e:
         return handle_database_error(e)
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Unexpected registration error: {e}")
         return jsonify({'error': 'Registration failed due to unexpected error'}), 500
 
 @app.route('/api/login', methods=['POST'])
+@rate_limit('login')
 def login():
     """Login a user with enhanced security and error handling"""
     try:
@@ -571,18 +3198,22 @@ def login():
         if not username or not password:
             raise ValidationError('Username and password cannot be empty')
 
+        # Failed password checks are limited per username and client address
+        if RATE_LIMIT_ENABLED:
+            retry_after = rate_limiter.check('login_failure', count=False)
+            if retry_after is not None:
+                return rate_limited_response(retry_after)
+
         # Database operation to get user
         def get_user(cursor):
-            cursor.execute(
-                'SELECT username, password_hash, is_active FROM users WHERE username = %s',
-                (username,)
-            )
-            return cursor.fetchone()
+            return execute_hot(cursor, 'login_user', (username,)).fetchone()
 
         user = handle_database_operation(get_user)
 
         if not user:
             logger.warning(f"Login attempt with non-existent username: {username}")
+            if RATE_LIMIT_ENABLED:
+                rate_limiter.check('login_failure')
             return jsonify({'error': 'Invalid username or password'}), 401
 
         if not user[2]:  # is_active check
@@ -591,14 +3222,13 @@ def login():
 
         if not verify_password(password, user[1]):
             logger.warning(f"Login attempt with incorrect password: {username}")
+            if RATE_LIMIT_ENABLED:
+                rate_limiter.check('login_failure')
             return jsonify({'error': 'Invalid username or password'}), 401
 
         # Update last login timestamp
         def update_last_login(cursor):
-            cursor.execute(
-                'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = %s',
-                (username,)
-            )
+            execute_hot(cursor, 'touch_last_login', (username,))
 
         handle_database_operation(update_last_login)
 
@@ -618,6 +3248,8 @@ def login():
     except DatabaseError as e:
         return handle_database_error(e)
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Unexpected login error: {e}")
         return jsonify({'error': 'Login failed due to unexpected error'}), 500
@@ -650,13 +3282,9 @@ def get_profile():
 
         # Database operation to get user profile
         def get_user_profile(cursor):
-            cursor.execute(
-                'SELECT username, email, created_at, last_login FROM users WHERE username = %s',
-                (username,)
-            )
-            return cursor.fetchone()
+            return execute_hot(cursor, 'user_profile', (username,)).fetchone()
 
-        user = handle_database_operation(get_user_profile)
+        user = handle_database_operation(get_user_profile, read_only=True)
 
         if not user:
             logger.warning(f"Profile requested for non-existent user: {username}")
@@ -673,6 +3301,8 @@ def get_profile():
     except DatabaseError as e:
         return handle_database_error(e)
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Profile retrieval error: {e}")
         return jsonify({'error': 'Profile retrieval failed'}), 500
@@ -683,8 +3313,7 @@ def health_check():
     try:
         # Check database connectivity
         def check_db(cursor):
-            cursor.execute('SELECT 1')
-            return cursor.fetchone()
+            return execute_hot(cursor, 'health_check').fetchone()
 
         handle_database_operation(check_db)
         
@@ -729,6 +3358,7 @@ def root():
 
 @app.route('/api/user/delete', methods=['DELETE'])
 @require_auth
+@rate_limit('delete_account')
 def delete_account():
     """Delete user account (protected route)"""
     try:
@@ -748,7 +3378,7 @@ def delete_account():
         def verify_and_delete(cursor):
             # Get user's password hash
             cursor.execute(
-                'SELECT password_hash FROM users WHERE username = %s',
+                'SELECT id, password_hash FROM users WHERE username = %s',
                 (username,)
             )
             user = cursor.fetchone()
@@ -756,7 +3386,7 @@ def delete_account():
             if not user:
                 raise AuthenticationError('User not found')
                 
-            if not verify_password(password, user[0]):
+            if not verify_password(password, user[1]):
                 raise AuthenticationError('Invalid password')
                 
             # Delete the user account
@@ -764,9 +3394,11 @@ def delete_account():
                 'DELETE FROM users WHERE username = %s',
                 (username,)
             )
-            return True
+            invalidation_bus.publish(cursor, 'user_deleted', user_id=user[0])
+            return user[0]
 
-        handle_database_operation(verify_and_delete)
+        user_id = handle_database_operation(verify_and_delete)
+        share_graph.remove_user(user_id)
 
         logger.info(f"Account deleted successfully: {username}")
         return jsonify({
@@ -782,6 +3414,8 @@ def delete_account():
         logger.error(f"Database error during account deletion for {username}: {str(e)}")
         return jsonify({'error': 'Account deletion failed'}), 500
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during account deletion for {username}: {str(e)}")
         return jsonify({'error': 'Account deletion failed due to unexpected error'}), 500
@@ -789,6 +3423,7 @@ def delete_account():
 
 @app.route('/api/save-cookies', methods=['POST'])
 @require_auth
+@rate_limit('save_cookies')
 def save_cookies():
     """Save X.com cookies for the authenticated user."""
     try:
@@ -804,7 +3439,9 @@ def save_cookies():
         # Persist cookies in DB
         def operation(cursor):
             save_user_cookies(cursor, username, cookies_json)
+            invalidation_bus.publish(cursor, 'cookies_saved', username=username)
         handle_database_operation(operation)
+        replica_router.mark_write(username)
 
         logger.info(f"Cookies saved successfully for user: {username}")
         return jsonify({'message': 'Cookies saved successfully'}), 200
@@ -817,6 +3454,8 @@ def save_cookies():
         logger.error(f"Database error saving cookies for {request.current_user}: {e}")
         return jsonify({'error': 'Failed to save cookies'}), 500
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error saving cookies for {request.current_user}: {e}")
         return jsonify({'error': 'Unexpected error saving cookies'}), 500
@@ -824,6 +3463,7 @@ def save_cookies():
 
 @app.route('/api/share-feed', methods=['POST'])
 @require_auth
+@rate_limit('share_feed')
 def share_feed():
     try:
         if not request.is_json:
@@ -839,35 +3479,33 @@ def share_feed():
             raise ValidationError('Cannot share feed with yourself')
 
         # Validate target user exists and is active
-        def get_user_ids(cursor):
-            cursor.execute('SELECT id FROM users WHERE username = %s AND is_active = TRUE', (owner_username,))
-            owner = cursor.fetchone()
-            cursor.execute('SELECT id FROM users WHERE username = %s AND is_active = TRUE', (share_with_username,))
-            shared_with = cursor.fetchone()
-            return owner, shared_with
-
-        owner, shared_with = handle_database_operation(get_user_ids)
-        if not shared_with:
+        owner_id = resolve_user_id(owner_username)
+        shared_with_id = resolve_user_id(share_with_username)
+        if not shared_with_id:
             raise ValidationError('Target user does not exist or is inactive')
-        if not owner:
+        if not owner_id:
             raise AuthenticationError('Owner user not found')
 
         def insert_share(cursor):
-            # Insert into share list
-            cursor.execute("""
-                INSERT INTO feed_shares (owner_id, shared_with_id)
-                VALUES (%s, %s)
-                ON CONFLICT DO NOTHING
-            """, (owner[0], shared_with[0]))
-            
-            # Insert reciprocal into fetch list
-            cursor.execute("""
-                INSERT INTO feed_fetches (user_id, fetch_from_id)
-                VALUES (%s, %s)
-                ON CONFLICT DO NOTHING
-            """, (shared_with[0], owner[0]))
+            with cursor.connection.pipeline():
+                # Insert into share list
+                cursor.execute("""
+                    INSERT INTO feed_shares (owner_id, shared_with_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT DO NOTHING
+                """, (owner_id, shared_with_id))
+                
+                # Insert reciprocal into fetch list
+                cursor.execute("""
+                    INSERT INTO feed_fetches (user_id, fetch_from_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT DO NOTHING
+                """, (shared_with_id, owner_id))
+                invalidation_bus.publish(cursor, 'share_added', owner_id=owner_id, viewer_id=shared_with_id)
 
         handle_database_operation(insert_share)
+        share_graph.add_share(owner_id, shared_with_id)
+        replica_router.mark_write(owner_username, share_with_username)
         logger.info(f"Feed shared: {owner_username} -> {share_with_username}")
         return jsonify({'message': f'Feed shared with {share_with_username}!'}), 200
 
@@ -875,6 +3513,8 @@ def share_feed():
         return handle_validation_error(e)
     except psycopg.IntegrityError:
         return jsonify({'error': 'Feed already shared with this user'}), 409
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Share feed error: {e}")
         return jsonify({'error': 'Sharing failed'}), 500
@@ -886,18 +3526,19 @@ def shared_users():
     try:
         owner_username = request.current_user
 
+        if share_index_trusted():
+            owner_id = resolve_user_id(owner_username)
+            return jsonify([{'username': name} for name in share_graph.viewer_usernames(owner_id)]), 200
+
         def get_shared_users(cursor):
-            cursor.execute("""
-                SELECT u.username
-                FROM feed_shares fs
-                JOIN users u ON fs.shared_with_id = u.id
-                WHERE fs.owner_id = (SELECT id FROM users WHERE username = %s)
-            """, (owner_username,))
+            execute_hot(cursor, 'shared_users', (owner_username,))
             return [{'username': row[0]} for row in cursor.fetchall()]
 
-        users = handle_database_operation(get_shared_users)
+        users = handle_database_operation(get_shared_users, read_only=True)
         return jsonify(users), 200
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Failed to load shared users: {e}")
         return jsonify({'error': 'Failed to load shared users'}), 500
@@ -908,18 +3549,19 @@ def fetch_users():
     try:
         current_username = request.current_user
 
+        if share_index_trusted():
+            current_user_id = resolve_user_id(current_username)
+            return jsonify([{'username': name} for name in share_graph.owner_usernames(current_user_id)]), 200
+
         def get_fetch_users(cursor):
-            cursor.execute("""
-                SELECT u.username
-                FROM feed_fetches ff
-                JOIN users u ON ff.fetch_from_id = u.id
-                WHERE ff.user_id = (SELECT id FROM users WHERE username = %s)
-            """, (current_username,))
+            execute_hot(cursor, 'fetch_users', (current_username,))
             return [{'username': row[0]} for row in cursor.fetchall()]
 
-        users = handle_database_operation(get_fetch_users)
+        users = handle_database_operation(get_fetch_users, read_only=True)
         return jsonify(users), 200
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Failed to load fetch users: {e}")
         return jsonify({'error': 'Failed to load fetch users'}), 500
@@ -932,42 +3574,198 @@ def unshare_feed(username):
         owner_username = request.current_user
         target_username = sanitize_input(username)
 
-        def get_user_ids(cursor):
-            cursor.execute('SELECT id FROM users WHERE username = %s', (owner_username,))
-            owner = cursor.fetchone()
-            cursor.execute('SELECT id FROM users WHERE username = %s', (target_username,))
-            shared_with = cursor.fetchone()
-            return owner, shared_with
-
-        owner, shared_with = handle_database_operation(get_user_ids)
-        if not owner or not shared_with:
+        owner_id = resolve_user_id(owner_username, active_only=False)
+        shared_with_id = resolve_user_id(target_username, active_only=False)
+        if not owner_id or not shared_with_id:
             raise ValidationError('User not found')
 
         def delete_share(cursor):
-            # Remove from share list
-            cursor.execute("""
-                DELETE FROM feed_shares
-                WHERE owner_id = %s AND shared_with_id = %s
-            """, (owner[0], shared_with[0]))
-            
-            # Remove reciprocal from fetch list
-            cursor.execute("""
-                DELETE FROM feed_fetches
-                WHERE user_id = %s AND fetch_from_id = %s
-            """, (shared_with[0], owner[0]))
+            with cursor.connection.pipeline():
+                # Remove from share list
+                cursor.execute("""
+                    DELETE FROM feed_shares
+                    WHERE owner_id = %s AND shared_with_id = %s
+                """, (owner_id, shared_with_id))
+                
+                # Remove reciprocal from fetch list
+                cursor.execute("""
+                    DELETE FROM feed_fetches
+                    WHERE user_id = %s AND fetch_from_id = %s
+                """, (shared_with_id, owner_id))
+                invalidation_bus.publish(cursor, 'share_removed', owner_id=owner_id, viewer_id=shared_with_id)
 
         handle_database_operation(delete_share)
+        share_graph.remove_share(owner_id, shared_with_id)
+        replica_router.mark_write(owner_username, target_username)
         logger.info(f"Feed access revoked: {owner_username} -> {target_username}")
         return jsonify({'message': f'Access revoked from {target_username}'}), 200
 
     except (ValidationError, AuthenticationError) as e:
         return handle_validation_error(e)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Unshare feed error: {e}")
         return jsonify({'error': 'Revocation failed'}), 500
 
+def parse_username_batch(data):
+    """Validate a batch share/unshare body and return its distinct usernames in order"""
+    if not isinstance(data, dict) or not isinstance(data.get('usernames'), list):
+        raise ValidationError('Request must contain a "usernames" list')
+    if not all(isinstance(username, str) for username in data['usernames']):
+        raise ValidationError('Usernames must be strings')
+    usernames = list(dict.fromkeys(filter(None, map(sanitize_input, data['usernames']))))
+    if not usernames:
+        raise ValidationError('No usernames given')
+    if len(usernames) > SHARE_BATCH_MAX:
+        raise ValidationError(f'At most {SHARE_BATCH_MAX} usernames per request')
+    return usernames
+
+@app.route('/api/share-feed/batch', methods=['POST'])
+@require_auth
+@rate_limit('share_batch')
+def share_feed_batch():
+    """Share the current user's feed with many users in one set-based statement"""
+    try:
+        if not request.is_json:
+            raise ValidationError('Request must contain JSON data')
+        usernames = parse_username_batch(request.get_json())
+
+        owner_username = request.current_user
+        owner_id = resolve_user_id(owner_username)
+        if not owner_id:
+            raise AuthenticationError('Owner user not found')
+
+        def insert_shares(cursor):
+            # Resolve every target and write both tables in one statement
+            cursor.execute("""
+                WITH targets AS (
+                    SELECT r.username, u.id, COALESCE(u.is_active, FALSE) AS is_active
+                    FROM unnest(%s::text[]) AS r(username)
+                    LEFT JOIN users u ON u.username = r.username
+                ), shareable AS (
+                    SELECT id FROM targets WHERE is_active AND id <> %s
+                ), added AS (
+                    INSERT INTO feed_shares (owner_id, shared_with_id)
+                    SELECT %s, id FROM shareable
+                    ON CONFLICT DO NOTHING
+                    RETURNING shared_with_id
+                ), fetches AS (
+                    INSERT INTO feed_fetches (user_id, fetch_from_id)
+                    SELECT id, %s FROM shareable
+                    ON CONFLICT DO NOTHING
+                )
+                SELECT t.username, t.id, t.is_active, a.shared_with_id IS NOT NULL
+                FROM targets t
+                LEFT JOIN added a ON a.shared_with_id = t.id
+            """, (usernames, owner_id, owner_id, owner_id))
+            rows = cursor.fetchall()
+            added_ids = [row[1] for row in rows if row[3]]
+            if added_ids:
+                invalidation_bus.publish(cursor, 'shares_added', owner_id=owner_id, viewer_ids=added_ids)
+            return rows
+
+        rows = handle_database_operation(insert_shares)
+
+        results = {}
+        changed = []
+        for username, user_id, is_active, added in rows:
+            if user_id == owner_id:
+                results[username] = 'self'
+            elif not is_active:
+                results[username] = 'not_found'
+            elif added:
+                results[username] = 'shared'
+                share_graph.add_user(user_id, username)
+                share_graph.add_share(owner_id, user_id)
+                changed.append(username)
+            else:
+                results[username] = 'already_shared'
+        replica_router.mark_write(owner_username, *changed)
+        logger.info(f"Feed shared in batch: {owner_username} -> {len(changed)} of {len(usernames)} users")
+        return jsonify({
+            'results': [{'username': username, 'status': results[username]} for username in usernames],
+            'shared': len(changed)
+        }), 200
+
+    except (ValidationError, AuthenticationError) as e:
+        return handle_validation_error(e)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Batch share error: {e}")
+        return jsonify({'error': 'Sharing failed'}), 500
+
+@app.route('/api/unshare-feed/batch', methods=['POST'])
+@require_auth
+@rate_limit('unshare_batch')
+def unshare_feed_batch():
+    """Revoke feed access from many users in one set-based statement"""
+    try:
+        if not request.is_json:
+            raise ValidationError('Request must contain JSON data')
+        usernames = parse_username_batch(request.get_json())
+
+        owner_username = request.current_user
+        owner_id = resolve_user_id(owner_username, active_only=False)
+        if not owner_id:
+            raise ValidationError('User not found')
+
+        def delete_shares(cursor):
+            cursor.execute("""
+                WITH targets AS (
+                    SELECT r.username, u.id
+                    FROM unnest(%s::text[]) AS r(username)
+                    LEFT JOIN users u ON u.username = r.username
+                ), removed AS (
+                    DELETE FROM feed_shares
+                    WHERE owner_id = %s AND shared_with_id IN (SELECT id FROM targets)
+                    RETURNING shared_with_id
+                ), fetches AS (
+                    DELETE FROM feed_fetches
+                    WHERE fetch_from_id = %s AND user_id IN (SELECT id FROM targets)
+                )
+                SELECT t.username, t.id, r.shared_with_id IS NOT NULL
+                FROM targets t
+                LEFT JOIN removed r ON r.shared_with_id = t.id
+            """, (usernames, owner_id, owner_id))
+            rows = cursor.fetchall()
+            removed_ids = [row[1] for row in rows if row[2]]
+            if removed_ids:
+                invalidation_bus.publish(cursor, 'shares_removed', owner_id=owner_id, viewer_ids=removed_ids)
+            return rows
+
+        rows = handle_database_operation(delete_shares)
+
+        results = {}
+        changed = []
+        for username, user_id, removed in rows:
+            if user_id is None:
+                results[username] = 'not_found'
+            elif removed:
+                results[username] = 'revoked'
+                share_graph.remove_share(owner_id, user_id)
+                changed.append(username)
+            else:
+                results[username] = 'not_shared'
+        replica_router.mark_write(owner_username, *changed)
+        logger.info(f"Feed access revoked in batch: {owner_username} -> {len(changed)} of {len(usernames)} users")
+        return jsonify({
+            'results': [{'username': username, 'status': results[username]} for username in usernames],
+            'revoked': len(changed)
+        }), 200
+
+    except (ValidationError, AuthenticationError) as e:
+        return handle_validation_error(e)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Batch unshare error: {e}")
+        return jsonify({'error': 'Revocation failed'}), 500
+
 @app.route('/api/fetch-feed/<username>', methods=['POST'])
 @require_auth
+@rate_limit('fetch_feed')
 def fetch_user_feed(username):
     """Fetch tweets from a user's feed that has been shared with current user"""
     try:
@@ -977,151 +3775,318 @@ def fetch_user_feed(username):
         if current_username == target_username:
             raise ValidationError('Cannot fetch your own feed through this endpoint')
         
-        # Verify access permissions and get user data
-        def verify_access_and_get_data(cursor):
+        # Delta sync watermark: the timeline version the client already holds
+        try:
+            since_version = int(request.args.get('since_version', 0))
+        except ValueError:
+            raise ValidationError('since_version must be an integer')
+        
+        # Access check against the share graph, SQL below stays authoritative on a miss.
+        # Without a listening invalidation bus an unshare on another worker may not be
+        # indexed yet, so positive hits are confirmed in SQL too.
+        current_user_id = resolve_user_id(current_username)
+        target_user_id = resolve_user_id(target_username)
+        indexed_access = (share_index_trusted()
+                          and current_user_id is not None and target_user_id is not None
+                          and share_graph.can_fetch(current_user_id, target_user_id))
+
+        def check_access_sql(cursor):
             # Check if current user has access to target user's feed
-            cursor.execute("""
-                SELECT ff.fetch_from_id, u1.username, u2.id as current_user_id
-                FROM feed_fetches ff
-                JOIN users u1 ON ff.fetch_from_id = u1.id
-                JOIN users u2 ON ff.user_id = u2.id
-                WHERE u2.username = %s AND u1.username = %s
-            """, (current_username, target_username))
-            
-            access_check = cursor.fetchone()
+            access_check = execute_hot(cursor, 'access_check', (current_username, target_username)).fetchone()
             if not access_check:
                 raise ValidationError('You do not have access to this user\'s feed')
-            
-            fetch_from_id, target_user, current_user_id = access_check
+            # Not written back to the share graph: this may be a lagging replica
+            # read of a share that was just revoked, and the bus or the reload
+            # already brings in shares made by other workers
+            return access_check
+
+        # Verify access permissions and get user data
+        def verify_access_and_get_data(cursor):
+            if indexed_access:
+                fetch_from_id, target_user, viewer_id = target_user_id, target_username, current_user_id
+            else:
+                fetch_from_id, target_user, viewer_id = check_access_sql(cursor)
             
             # Get target user's cookies
-            cursor.execute("""
-                SELECT cookies FROM user_cookies WHERE user_id = %s
-            """, (fetch_from_id,))
-            
-            cookies_row = cursor.fetchone()
+            cookies_row = execute_hot(cursor, 'user_cookies', (fetch_from_id,)).fetchone()
             if not cookies_row:
                 raise ValidationError('Target user has not saved their cookies yet')
             
             return {
                 'fetch_from_id': fetch_from_id,
-                'current_user_id': current_user_id,
+                'current_user_id': viewer_id,
                 'cookies': cookies_row[0],
                 'target_username': target_user
             }
         
-        user_data = handle_database_operation(verify_access_and_get_data)
+        user_data = handle_database_operation(verify_access_and_get_data, read_only=True)
         
         # Check if we have recent cached data
         def check_cached_tweets(cursor):
-            cursor.execute("""
-                SELECT tweets_data, fetched_at 
-                FROM user_tweets 
-                WHERE user_id = %s AND fetched_from_id = %s 
-                AND expires_at > CURRENT_TIMESTAMP
-            """, (user_data['current_user_id'], user_data['fetch_from_id']))
-            return cursor.fetchone()
+            return tweet_store.load_timeline(
+                cursor, user_data['current_user_id'], user_data['fetch_from_id'], since_version
+            )
         
-        cached_data = handle_database_operation(check_cached_tweets)
+        cached_data = handle_database_operation(check_cached_tweets, read_only=True)
         
         if cached_data:
             logger.info(f"Returning cached tweets for {current_username} from {target_username}")
             return jsonify({
-                'tweets': cached_data[0],
+                'tweets': rewrite_media_urls(cached_data[0]),
                 'fetched_at': cached_data[1].isoformat(),
                 'cached': True,
-                'source_user': target_username
+                'source_user': target_username,
+                'count': len(cached_data[0]),
+                'version': cached_data[2],
+                'delta': cached_data[3]
             }), 200
         
-        # Create unique fetch identifier
-        fetch_key = f"{user_data['current_user_id']}_{user_data['fetch_from_id']}"
+        if fetch_workers.draining.is_set():
+            # Shutting down, the client retries against a fresh process
+            return jsonify({'error': 'Server is restarting, try again shortly'}), 503, {'Retry-After': '5'}
         
-        # Check if fetch is already in progress
-        with tweet_fetcher.fetch_lock:
-            if fetch_key in tweet_fetcher.active_fetches:
-                return jsonify({
-                    'message': 'Feed fetch already in progress',
-                    'status': 'processing'
-                }), 202
-            
-            tweet_fetcher.active_fetches[fetch_key] = True
+        # Queue the fetch, the partial unique index rejects duplicates from any worker
+        background = request.args.get('background') == 'true'
+        if background:
+            priority, job_budget = FETCH_PRIORITY_BACKGROUND, FETCH_JOB_DEADLINE
+        else:
+            # The crawl must finish in time for this request to store and return it
+            priority = FETCH_PRIORITY_INTERACTIVE
+            job_budget = check_deadline('queueing the fetch') - FETCH_DEADLINE_MARGIN
+            if job_budget <= 0:
+                raise DeadlineExceeded('Not enough time left to fetch the feed')
+        job_id, created = handle_database_operation(
+            lambda cursor: fetch_queue.enqueue(
+                cursor, user_data['current_user_id'], user_data['fetch_from_id'], priority, job_budget
+            )
+        )
+        if not created or background:
+            return jsonify({
+                'message': 'Feed fetch already in progress' if not created else 'Feed fetch queued',
+                'status': 'processing',
+                'job_id': job_id
+            }), 202
         
-        try:
-            # Fetch tweets asynchronously
-            def run_async_fetch():
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    return loop.run_until_complete(
-                        tweet_fetcher.fetch_tweets_for_user(
-                            user_data['cookies'], 
-                            user_data['current_user_id'],
-                            user_data['fetch_from_id']
-                        )
-                    )
-                finally:
-                    loop.close()
-            
-            # Run in thread pool to avoid blocking
-            future = tweet_executor.submit(run_async_fetch)
-            tweets_data = future.result(timeout=300)  # 5 minute timeout
-            
-            # Store in database
-            def store_tweets(cursor):
-                cursor.execute("""
-                    INSERT INTO user_tweets (user_id, fetched_from_id, tweets_data, expires_at)
-                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP + INTERVAL '1 hour')
-                    ON CONFLICT (user_id, fetched_from_id) 
-                    DO UPDATE SET 
-                        tweets_data = EXCLUDED.tweets_data,
-                        fetched_at = CURRENT_TIMESTAMP,
-                        expires_at = EXCLUDED.expires_at
-                """, (user_data['current_user_id'], user_data['fetch_from_id'], json.dumps(tweets_data)))
-            
-            handle_database_operation(store_tweets)
-            
-            logger.info(f"Successfully fetched {len(tweets_data)} tweets for {current_username} from {target_username}")
-            
+        started = time.perf_counter()
+        # Stop waiting once a drain has handed this process's crawls off, before
+        # the process manager's kill timeout
+        job = fetch_queue.wait(job_id, max(remaining_budget() - FETCH_READBACK_MARGIN, 0),
+                               fetch_workers.stop_event)
+        record_timing('fetch', time.perf_counter() - started)
+        if job is None:
             return jsonify({
-                'tweets': tweets_data,
-                'fetched_at': datetime.utcnow().isoformat(),
-                'cached': False,
-                'source_user': target_username,
-                'count': len(tweets_data)
-            }), 200
-            
-        finally:
-            # Remove from active fetches
-            with tweet_fetcher.fetch_lock:
-                tweet_fetcher.active_fetches.pop(fetch_key, None)
+                'message': 'Feed fetch is still running',
+                'status': 'processing',
+                'job_id': job_id
+            }), 202
+        queue_wait_ms = round(float(job[2] or 0) * 1000)
+        logger.info(f"Fetch job {job_id} for {current_username} waited {queue_wait_ms}ms in queue")
+        if job[0] == 'failed':
+            if (job[1] or '').startswith('Deadline exceeded'):
+                raise DeadlineExceeded(f"Fetch job {job_id}: {job[1]}")
+            raise DatabaseError(f"Fetch job {job_id} failed: {job[1]}")
+        
+        # The worker wrote the cache on the primary
+        replica_router.mark_write(current_username)
+        stored = handle_database_operation(check_cached_tweets)
+        tweets_data, fetched_at, version, delta = stored if stored else ([], datetime.utcnow(), None, False)
+        
+        logger.info(f"Successfully fetched {len(tweets_data)} tweets for {current_username} from {target_username}")
+        
+        return jsonify({
+            'tweets': rewrite_media_urls(tweets_data),
+            'fetched_at': fetched_at.isoformat(),
+            'cached': False,
+            'source_user': target_username,
+            'count': len(tweets_data),
+            'version': version,
+            'delta': delta,
+            'queue_wait_ms': queue_wait_ms
+        }), 200
     
     except ValidationError as e:
         return handle_validation_error(e)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Feed fetch error for {current_username} from {target_username}: {e}")
         return jsonify({'error': 'Feed fetch failed'}), 500
 
+@app.route('/api/media/<signature>/<token>/<path:filename>', methods=['GET'])
+@rate_limit('media')
+def media_proxy(signature, token, filename):
+    """Serve tweet media from the local cache, fetching it from the origin once
+
+    No auth header, since the URLs are loaded by <img> and <video> tags; the
+    signature limits the proxy to URLs this server handed out.
+    """
+    if media_cache is None:
+        return jsonify({'error': 'Media proxy is disabled'}), 404
+    try:
+        url = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+    except ValueError:
+        return jsonify({'error': 'Invalid media URL'}), 400
+    if not secrets.compare_digest(signature, media_cache.sign(url)) or not media_cache.is_allowed(url):
+        return jsonify({'error': 'Invalid media URL'}), 403
+
+    try:
+        media = media_cache.open_object(url, min(MEDIA_FETCH_TIMEOUT, check_deadline('fetching media')))
+    except (MediaTooLarge, OSError) as e:
+        # Too large to cache or origin trouble, let the browser load it directly
+        logger.warning(f"Media proxy falling back to origin for {url}: {e!r}")
+        return redirect(url, 302)
+    return serve_media(*media)
+
+@app.route('/api/search', methods=['GET'])
+@require_auth
+@rate_limit('search')
+def search_tweets():
+    """Search tweets cached from every feed shared with the current user"""
+    try:
+        current_username = request.current_user
+        query = sanitize_input(request.args.get('q', ''))
+        if not query or len(query) > 200:
+            raise ValidationError('Search query must be 1-200 characters long')
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        except ValueError:
+            raise ValidationError('limit must be an integer')
+
+        if tweet_store.layout != 'normalized':
+            return jsonify({'error': 'Search requires the normalized tweet storage layout'}), 501
+
+        current_user_id = resolve_user_id(current_username)
+        if current_user_id is None:
+            raise AuthenticationError('User not found')
+
+        def run_search(cursor):
+            if share_index_trusted():
+                owner_ids = share_graph.owner_ids(current_user_id)
+            else:
+                cursor.execute('SELECT fetch_from_id FROM feed_fetches WHERE user_id = %s', (current_user_id,))
+                owner_ids = {row[0] for row in cursor.fetchall()}
+            if not owner_ids:
+                return []
+            return tweet_store.search(cursor, query, owner_ids, limit)
+
+        started = time.perf_counter()
+        rows = handle_database_operation(run_search, read_only=True)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        logger.info(f"Search by {current_username} returned {len(rows)} tweets in {elapsed_ms}ms")
+        return jsonify({
+            'query': query,
+            'results': [{'tweet': tweet, 'source_user': source, 'rank': rank} for tweet, source, rank in rows],
+            'count': len(rows),
+            'took_ms': elapsed_ms
+        }), 200
+
+    except (ValidationError, AuthenticationError) as e:
+        return handle_validation_error(e)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        return jsonify({'error': 'Search failed'}), 500
+
 @app.route('/api/cleanup-expired-tweets', methods=['POST'])
+@require_admin
 def cleanup_expired_tweets():
-    """Clean up expired tweet data - can be called by a cron job"""
+    """Run one bounded reaper pass now - the reaper thread does this periodically"""
     try:
-        def cleanup_operation(cursor):
-            cursor.execute("DELETE FROM user_tweets WHERE expires_at < CURRENT_TIMESTAMP")
-            return cursor.rowcount
-        
-        deleted_count = handle_database_operation(cleanup_operation)
-        
-        logger.info(f"Cleaned up {deleted_count} expired tweet records")
+        result = tweet_reaper.reap_once()
+
+        logger.info(f"Cleaned up {result['rows_reaped']} expired tweet records")
         return jsonify({
-            'message': f'Cleaned up {deleted_count} expired records',
+            'message': f"Cleaned up {result['rows_reaped']} expired records",
+            'orphans_reaped': result['orphans_reaped'],
+            'seconds': result['seconds'],
             'timestamp': datetime.utcnow().isoformat()
         }), 200
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
         return jsonify({'error': 'Cleanup failed'}), 500
 
+@app.route('/api/admin/stats', methods=['GET'])
+@require_admin
+def admin_stats():
+    """Operational counters for background maintenance"""
+    return jsonify({
+        'reaper': tweet_reaper.get_stats(),
+        'share_graph': share_graph.get_stats(),
+        'invalidation_bus': invalidation_bus.get_stats(),
+        'replica': replica_router.get_stats(),
+        'fetch_workers': fetch_workers.get_stats(),
+        'rate_limiter': rate_limiter.get_stats(),
+        'db_pools': get_pool_stats(),
+        'media_cache': media_cache.get_stats() if media_cache else None,
+        'profiler': sampling_profiler.get_status(),
+        'request_timing': get_timing_stats(),
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
+@app.route('/api/admin/profiler', methods=['GET'])
+@require_admin
+def profiler_status():
+    """Sampling profiler state and sample count"""
+    return jsonify(sampling_profiler.get_status()), 200
+
+@app.route('/api/admin/profiler/start', methods=['POST'])
+@require_admin
+def start_profiler():
+    """Start sampling all threads; stops on its own after max_seconds"""
+    try:
+        interval_ms = float(request.args.get('interval_ms', 10))
+        max_seconds = float(request.args.get('max_seconds', 300))
+        if not 1 <= interval_ms <= 1000 or not 1 <= max_seconds <= 3600:
+            raise ValidationError('interval_ms must be 1-1000 and max_seconds 1-3600')
+    except ValueError:
+        return handle_validation_error(ValidationError('interval_ms and max_seconds must be numbers'))
+    except ValidationError as e:
+        return handle_validation_error(e)
+
+    if not sampling_profiler.start(interval_ms / 1000, max_seconds):
+        return jsonify({'error': 'Profiler is already running'}), 409
+    return jsonify({'message': 'Profiler started', **sampling_profiler.get_status()}), 200
+
+@app.route('/api/admin/profiler/stop', methods=['POST'])
+@require_admin
+def stop_profiler():
+    """Stop the profiler and return collapsed stacks for flamegraph tools"""
+    collapsed = sampling_profiler.stop()
+    return collapsed, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/api/admin/share-graph/verify', methods=['POST'])
+@require_admin
+def verify_share_graph():
+    """Compare the in-process share graph with the database, optionally reloading it"""
+    try:
+        differences = share_graph.verify()
+        if differences and request.args.get('reload') == 'true':
+            share_graph.load()
+        return jsonify({
+            'consistent': not differences,
+            'differences': differences,
+            'reloaded': bool(differences) and request.args.get('reload') == 'true'
+        }), 200
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Share graph verification error: {e}")
+        return jsonify({'error': 'Share graph verification failed'}), 500
+
 if __name__ == '__main__':
+    # Drain on SIGTERM and exit through sys.exit so atexit waits for the drain
+    install_shutdown_handler()
+
+    if sys.argv[1:2] == ['fetch-worker']:
+        run_fetch_worker()
+        sys.exit(0)
+
     try:
         # Get port from environment variable (Render.com sets this)
         port = int(os.environ.get('PORT', 5000))
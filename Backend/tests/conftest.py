@@ -0,0 +1,89 @@
+"""Test setup: the suite runs server.py against DATABASE_URL
+
+Tests need a scratch PostgreSQL database and are skipped without one.
+Background threads are turned off so tests only see their own requests.
+"""
+
+import os
+import secrets
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKGROUND_DEFAULTS = {
+    'FETCH_WORKER_THREADS': '0',
+    'REAPER_ENABLED': 'false',
+    'RATE_LIMIT_ENABLED': 'false',
+    'INVALIDATION_BUS_ENABLED': 'false',
+    'SHARE_GRAPH_RELOAD_INTERVAL': '0',
+}
+
+
+@pytest.fixture(scope='session')
+def server():
+    if not os.environ.get('DATABASE_URL'):
+        pytest.skip('Set DATABASE_URL to a scratch PostgreSQL database to run the server tests')
+    for key, value in BACKGROUND_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+    return server
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def make_users(server):
+    """Create active users with a per-test prefix, return {username: (user_id, auth_headers)}"""
+    created = []
+
+    def make(count):
+        prefix = f't{secrets.token_hex(3)}_'
+        names = [f'{prefix}{i}' for i in range(count)]
+
+        def insert(cursor):
+            cursor.execute("""
+                INSERT INTO users (username, password_hash, email)
+                SELECT n, 'x', n || '@test.invalid' FROM unnest(%s::text[]) AS n
+                RETURNING id, username
+            """, (names,))
+            return cursor.fetchall()
+
+        rows = server.handle_database_operation(insert)
+        created.extend(user_id for user_id, _ in rows)
+        return {username: (user_id, {'Authorization': f'Bearer {server.generate_jwt_token(username)}'})
+                for user_id, username in rows}
+
+    yield make
+
+    if created:
+        server.handle_database_operation(
+            lambda cursor: cursor.execute('DELETE FROM users WHERE id = ANY(%s)', (created,))
+        )
+        for user_id in created:
+            server.share_graph.remove_user(user_id)
+
+
+@pytest.fixture
+def queue(server):
+    """A FetchQueue over a job table with no active jobs left by other tests"""
+    server.handle_database_operation(
+        lambda cursor: cursor.execute("DELETE FROM fetch_jobs WHERE status IN ('queued', 'running')")
+    )
+    return server.FetchQueue(stale_after=60, max_attempts=2, max_per_requester=2, max_per_owner=1,
+                             fairness_window=600)
+
+
+@pytest.fixture
+def crawl(server, monkeypatch):
+    """Replace the twikit crawl with a coroutine function taking (progress)"""
+    def install(fake):
+        async def fetch_tweets_for_user(cookies_dict, user_id, fetch_from_id, progress=None):
+            return await fake(progress)
+        monkeypatch.setattr(server.tweet_fetcher, 'fetch_tweets_for_user', fetch_tweets_for_user)
+    return install
@@ -0,0 +1,33 @@
+"""Requests out of time answer 504, whichever handler they run in"""
+
+import pytest
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('get', '/api/user/profile', None),
+    ('post', '/api/share-feed', {'share_with': 'nobody_here'}),
+    ('post', '/api/unshare-feed/batch', {'usernames': ['nobody_here']}),
+    ('get', '/api/search?q=anything', None),
+])
+def test_exhausted_budget_returns_504(server, client, make_users, method, path, body):
+    (_, (_, headers)), = make_users(1).items()
+    server.share_graph.load()
+    response = getattr(client, method)(path, json=body, headers=dict(headers, **{'X-Request-Timeout': '0'}))
+    assert response.status_code == 504
+    assert response.get_json() == {'error': 'Request timed out'}
+
+
+def test_enqueue_replaces_a_queued_job_past_its_deadline(server, queue, make_users):
+    (viewer_id, _), (owner_id, _) = make_users(2).values()
+
+    def enqueue(cursor):
+        return queue.enqueue(cursor, viewer_id, owner_id)
+
+    old_id, _ = server.handle_database_operation(enqueue)
+    server.handle_database_operation(lambda cursor: cursor.execute(
+        "UPDATE fetch_jobs SET deadline_at = CURRENT_TIMESTAMP - INTERVAL '1 second' WHERE id = %s", (old_id,)))
+
+    new_id, created = server.handle_database_operation(enqueue)
+    assert created and new_id != old_id
+    status = server.handle_database_operation(lambda cursor: queue.get_status(cursor, old_id))
+    assert status[:2] == ('failed', 'Deadline exceeded')
@@ -0,0 +1,75 @@
+"""Delta reads of cached timelines across refetches, expiry and legacy rows"""
+
+import pytest
+
+
+def tweets(*ids):
+    return [{'tweet_id': str(i), 'text': f'tweet {i}', 'username': 'owner'} for i in ids]
+
+
+def ids(loaded):
+    return [tweet['tweet_id'] for tweet in loaded[0]]
+
+
+@pytest.fixture(params=['normalized', 'jsonb', 'compact'])
+def store(request, server):
+    return server.TweetStore(request.param)
+
+
+@pytest.fixture
+def timeline(server, make_users, store):
+    (owner_id, _), (viewer_id, _) = make_users(2).values()
+
+    def write(tweets_data):
+        server.handle_database_operation(lambda cursor: store.store_timeline(cursor, viewer_id, owner_id, tweets_data))
+
+    def read(since_version=0):
+        return server.handle_database_operation(
+            lambda cursor: store.load_timeline(cursor, viewer_id, owner_id, since_version))
+
+    def expire():
+        server.handle_database_operation(lambda cursor: cursor.execute(
+            'DELETE FROM user_tweets WHERE user_id = %s AND fetched_from_id = %s', (viewer_id, owner_id)))
+
+    def unversion():
+        # What rows written before delta sync look like after the column defaults
+        def reset(cursor):
+            cursor.execute('UPDATE user_tweets SET version = 0, base_version = 0, tweet_versions = NULL '
+                           'WHERE user_id = %s AND fetched_from_id = %s', (viewer_id, owner_id))
+            cursor.execute('UPDATE timeline_tweets SET first_version = 0 '
+                           'WHERE user_id = %s AND fetched_from_id = %s', (viewer_id, owner_id))
+        server.handle_database_operation(reset)
+
+    return write, read, expire, unversion
+
+
+def test_refetch_returns_only_new_tweets(timeline):
+    write, read, *_ = timeline
+    write(tweets(1, 2))
+    first = read()
+    assert ids(first) == ['1', '2'] and first[3] is False
+
+    write(tweets(3, 1, 2))
+    delta = read(first[2])
+    assert ids(delta) == ['3'] and delta[3] is True
+    assert delta[2] > first[2]
+
+
+def test_watermark_from_expired_timeline_gets_full_replace(timeline):
+    write, read, expire, _ = timeline
+    write(tweets(1, 2))
+    old_version = read()[2]
+
+    expire()
+    write(tweets(1, 2, 3))
+    loaded = read(old_version)
+    assert ids(loaded) == ['1', '2', '3']
+    assert loaded[3] is False
+
+
+def test_rows_from_before_versioning_are_read_in_full(timeline):
+    write, read, _, unversion = timeline
+    write(tweets(1, 2))
+    unversion()
+    loaded = read()
+    assert ids(loaded) == ['1', '2'] and loaded[3] is False
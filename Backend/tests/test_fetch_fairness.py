@@ -0,0 +1,76 @@
+"""Claim order of the fetch queue: priority tiers, running caps and requester weights"""
+
+
+def enqueue_all(server, queue, pairs, priority=None):
+    def insert(cursor):
+        ids = []
+        for viewer_id, owner_id in pairs:
+            args = (cursor, viewer_id, owner_id) if priority is None else (cursor, viewer_id, owner_id, priority)
+            ids.append(queue.enqueue(*args)[0])
+        return ids
+    return server.handle_database_operation(insert)
+
+
+def claim(server, queue):
+    """Claim the next job, returning (job_id, requester_id, owner_id) or None"""
+    job = server.handle_database_operation(queue.claim)
+    return job and job[:3]
+
+
+def test_interactive_jobs_are_claimed_before_older_background_jobs(server, queue, make_users):
+    (viewer_id, _), *owners = make_users(5).values()
+    owner_ids = [owner_id for owner_id, _ in owners]
+    queue.max_per_requester = 10
+    background = enqueue_all(server, queue, [(viewer_id, owner_id) for owner_id in owner_ids[:2]],
+                             server.FETCH_PRIORITY_BACKGROUND)
+    interactive = enqueue_all(server, queue, [(viewer_id, owner_id) for owner_id in owner_ids[2:]])
+
+    claimed = [claim(server, queue)[0] for _ in range(4)]
+    assert sorted(claimed[:2]) == sorted(interactive)
+    assert sorted(claimed[2:]) == sorted(background)
+
+
+def test_running_caps_per_requester_and_owner(server, queue, make_users):
+    (busy_id, _), (other_id, _), *owners = make_users(6).values()
+    owner_ids = [owner_id for owner_id, _ in owners]
+    enqueue_all(server, queue, [(busy_id, owner_id) for owner_id in owner_ids])
+
+    # max_per_requester=2: the third of busy's jobs waits for one to finish
+    first, second = claim(server, queue), claim(server, queue)
+    assert first[1] == second[1] == busy_id
+    assert claim(server, queue) is None
+
+    # max_per_owner=1: another requester of a feed being crawled waits too
+    enqueue_all(server, queue, [(other_id, first[2])])
+    assert claim(server, queue) is None
+
+    server.handle_database_operation(lambda cursor: queue.finish(cursor, first[0]))
+    assert claim(server, queue)[1:] == (other_id, first[2])
+
+
+def test_weight_four_requester_gets_four_times_the_claims(server, queue, make_users):
+    users = sorted(make_users(27).items())
+    (heavy, (heavy_id, _)), (_, (light_id, _)) = users[:2]
+    owner_ids = [owner_id for _, (owner_id, _) in users[2:]]
+    queue.requester_weights = {heavy: 4}
+    enqueue_all(server, queue, [(viewer_id, owner_id) for owner_id in owner_ids for viewer_id in (light_id, heavy_id)])
+
+    counts = {heavy_id: 0, light_id: 0}
+    for _ in range(25):
+        job_id, requester_id, _ = claim(server, queue)
+        counts[requester_id] += 1
+        # Finished jobs still count towards recent usage within fairness_window
+        server.handle_database_operation(lambda cursor: queue.finish(cursor, job_id))
+
+    assert counts[heavy_id] + counts[light_id] == 25
+    assert 3 <= counts[heavy_id] / counts[light_id] <= 5, counts
+
+
+def test_weight_scales_the_running_cap(server, queue, make_users):
+    users = sorted(make_users(7).items())
+    heavy, (heavy_id, _) = users[0]
+    owner_ids = [owner_id for _, (owner_id, _) in users[1:]]
+    queue.requester_weights = {heavy: 2}
+    enqueue_all(server, queue, [(heavy_id, owner_id) for owner_id in owner_ids])
+
+    assert [claim(server, queue) is not None for _ in range(5)] == [True] * 4 + [False]
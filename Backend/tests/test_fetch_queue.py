@@ -0,0 +1,107 @@
+"""Fetch jobs: dedup, stale recovery, failures and waiting on a job"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def tweets(*ids):
+    return [{'tweet_id': str(i), 'text': f'tweet {i}', 'username': 'owner'} for i in ids]
+
+
+def job_row(server, job_id):
+    return server.handle_database_operation(lambda cursor: cursor.execute(
+        'SELECT status, attempts, error, resume_cursor FROM fetch_jobs WHERE id = %s', (job_id,)).fetchone())
+
+
+def enqueue_with_cookies(server, queue, users):
+    """Queue a fetch by the first user of the second user's feed, which has saved cookies"""
+    (_, (viewer_id, _)), (owner, (owner_id, _)) = sorted(users.items())
+
+    def setup(cursor):
+        server.save_user_cookies(cursor, owner, {'auth_token': 'x', 'ct0': 'y'})
+        return queue.enqueue(cursor, viewer_id, owner_id)
+
+    job_id, created = server.handle_database_operation(setup)
+    assert created
+    return job_id, viewer_id, owner_id
+
+
+def test_duplicate_enqueue_returns_active_job(server, queue, make_users):
+    (viewer_id, _), (owner_id, _) = make_users(2).values()
+
+    def enqueue(cursor):
+        return queue.enqueue(cursor, viewer_id, owner_id)
+
+    job_id, created = server.handle_database_operation(enqueue)
+    assert created
+    assert server.handle_database_operation(enqueue) == (job_id, False)
+
+    # Once the job finishes a new fetch gets a new job
+    server.handle_database_operation(lambda cursor: queue.finish(cursor, job_id))
+    new_id, created = server.handle_database_operation(enqueue)
+    assert created and new_id != job_id
+
+
+def test_stale_job_is_requeued_then_failed_after_max_attempts(server, queue, make_users):
+    (viewer_id, _), (owner_id, _) = make_users(2).values()
+    job_id, _ = server.handle_database_operation(lambda cursor: queue.enqueue(cursor, viewer_id, owner_id))
+
+    def stop_heartbeat(cursor):
+        cursor.execute("UPDATE fetch_jobs SET heartbeat_at = CURRENT_TIMESTAMP - INTERVAL '1 hour' WHERE id = %s",
+                       (job_id,))
+
+    for attempt in (1, 2):
+        claimed = server.handle_database_operation(queue.claim)
+        assert claimed[0] == job_id
+        assert job_row(server, job_id)[:2] == ('running', attempt)
+
+        # A live worker's heartbeat keeps the job
+        server.handle_database_operation(queue.heartbeat)
+        assert server.handle_database_operation(queue.requeue_stale) == 0
+
+        server.handle_database_operation(stop_heartbeat)
+        assert server.handle_database_operation(queue.requeue_stale) == 1
+
+        if attempt == 1:
+            assert job_row(server, job_id)[:3] == ('queued', 1, None)
+    assert job_row(server, job_id)[:3] == ('failed', 2, 'Worker lost')
+    assert server.handle_database_operation(queue.claim) is None
+
+
+def test_failed_crawl_records_its_error(server, queue, make_users, crawl):
+    job_id, _, _ = enqueue_with_cookies(server, queue, make_users(2))
+
+    async def fail(progress):
+        raise RuntimeError('timeline unavailable')
+    crawl(fail)
+
+    pool = server.FetchWorkerPool(queue, 0, 1)
+    pool.process(*server.handle_database_operation(queue.claim))
+    assert job_row(server, job_id)[:3] == ('failed', 1, 'timeline unavailable')
+    assert pool.get_stats()['failed'] == 1
+
+
+def test_waiter_is_released_when_the_job_finishes(server, queue, make_users, crawl):
+    job_id, viewer_id, owner_id = enqueue_with_cookies(server, queue, make_users(2))
+
+    async def succeed(progress):
+        return tweets(1, 2, 3)
+    crawl(succeed)
+
+    with ThreadPoolExecutor(1) as executor:
+        # A poll interval longer than the test: only the finish wake-up can release it in time
+        waiter = executor.submit(queue.wait, job_id, 60, threading.Event(), 60)
+        while job_id not in queue.waiters:
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        server.FetchWorkerPool(queue, 0, 1).process(*server.handle_database_operation(queue.claim))
+        status = waiter.result(timeout=10)
+        assert time.monotonic() - started < 10
+
+    assert status[:2] == ('done', None)
+    assert job_id not in queue.waiters
+    stored = server.handle_database_operation(
+        lambda cursor: server.tweet_store.load_timeline(cursor, viewer_id, owner_id))
+    assert [tweet['tweet_id'] for tweet in stored[0]] == ['1', '2', '3']
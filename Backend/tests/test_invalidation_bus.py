@@ -0,0 +1,43 @@
+"""Events published by one worker reach another worker's share graph"""
+
+import secrets
+import threading
+import time
+
+
+def test_notify_from_another_connection_updates_share_graph(server, make_users):
+    (owner_id, _), (viewer_id, _) = make_users(2).values()
+    graph = server.ShareGraph()
+    graph.load()
+    bus = server.InvalidationBus(f'test_bus_{secrets.token_hex(4)}')
+    bus.subscribe('share_added', lambda e: graph.add_share(e['owner_id'], e['viewer_id']))
+    bus.subscribe('share_removed', lambda e: graph.remove_share(e['owner_id'], e['viewer_id']))
+    listening = threading.Event()
+    bus.on_resync(listening.set)
+
+    def publish(event_type):
+        # Another worker: its own bus instance and connection
+        with server.psycopg.connect(server.get_database_url()) as conn:
+            server.InvalidationBus(bus.channel).publish(conn.cursor(), event_type,
+                                                        owner_id=owner_id, viewer_id=viewer_id)
+
+    def wait_for(condition):
+        deadline = time.monotonic() + 10
+        while not condition():
+            assert time.monotonic() < deadline, 'event not applied'
+            time.sleep(0.05)
+
+    bus.start()
+    try:
+        assert listening.wait(10)
+        assert bus.is_listening()
+        assert not graph.can_fetch(viewer_id, owner_id)
+
+        publish('share_added')
+        wait_for(lambda: graph.can_fetch(viewer_id, owner_id))
+        publish('share_removed')
+        wait_for(lambda: not graph.can_fetch(viewer_id, owner_id))
+        assert bus.get_stats()['applied'] == 2
+    finally:
+        bus.stop(5)
+    assert not bus.is_listening()
@@ -0,0 +1,24 @@
+"""JSON helpers round-trip values orjson cannot hold in 64 bits"""
+
+import pytest
+
+WIDE = {
+    'big': 2 ** 70,
+    'negative': -2 ** 63 - 1,
+    'nested': [1, 2 ** 64 + 5, {'x': 123456789012345678901234567890}],
+    'tweet_id': '1790000000000000000',
+}
+
+
+@pytest.mark.parametrize('as_text', [False, True])
+def test_wide_integers_round_trip(server, as_text):
+    encoded = server.json_encode(WIDE)
+    assert server.json_decode(encoded.decode('utf-8') if as_text else encoded) == WIDE
+
+
+def test_wide_integers_round_trip_through_jsonb(server):
+    row = server.handle_database_operation(
+        lambda cursor: cursor.execute('SELECT %s::jsonb', (server.Jsonb(WIDE),)).fetchone()
+    )
+    assert row[0] == WIDE
+    assert isinstance(row[0]['big'], int)
@@ -0,0 +1,173 @@
+"""Media cache and proxy against a local stand-in origin
+
+Workers sharing a cache directory must keep it within one max_bytes, and
+the proxy endpoint must honour ranges, conditional requests and signatures.
+"""
+
+import base64
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+
+class OriginHandler(SimpleHTTPRequestHandler):
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """Serve tmp_path/origin over HTTP, return (directory, base_url, host)"""
+    directory = tmp_path / 'origin'
+    directory.mkdir()
+    OriginHandler.paths = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(OriginHandler, directory=str(directory)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host = f'127.0.0.1:{httpd.server_address[1]}'
+    yield directory, f'http://{host}', host
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def write_origin(origin, count, size):
+    directory, base_url, _ = origin
+    urls = []
+    for i in range(count):
+        (directory / f'{i}.jpg').write_bytes(i.to_bytes(4, 'big') * (size // 4))
+        urls.append(f'{base_url}/{i}.jpg')
+    return urls
+
+
+def make_cache(server, tmp_path, origin, max_bytes=10 ** 6, max_object_bytes=10 ** 6):
+    cache = server.MediaCache(str(tmp_path / 'cache'), max_bytes, max_object_bytes, frozenset({origin[2]}), 'secret')
+    cache.open()
+    return cache
+
+
+def disk_bytes(cache):
+    return sum(entry.stat().st_size for entry in os.scandir(cache.objects_dir))
+
+
+def test_shared_directory_stays_bounded(server, tmp_path, origin):
+    urls = write_origin(origin, 60, 4096)
+    max_bytes = 20 * 4096
+    workers = [make_cache(server, tmp_path, origin, max_bytes) for _ in range(2)]
+
+    for i, url in enumerate(urls):
+        media_file, content_type, _ = workers[i % 2].open_object(url, 5)
+        media_file.close()
+        assert content_type == 'image/jpeg'
+        assert disk_bytes(workers[0]) <= max_bytes
+
+    objects = set(os.listdir(workers[0].objects_dir))
+    entries = os.listdir(workers[0].urls_dir)
+    assert len(entries) == len(objects)
+    for name in entries:
+        with open(os.path.join(workers[0].urls_dir, name), encoding='utf-8') as f:
+            assert f.read().split('\n', 1)[0] in objects
+
+    # A body evicted by the other worker is fetched again, not reported missing
+    media_file, _, _ = workers[1].open_object(urls[0], 5)
+    assert media_file.read() == (0).to_bytes(4, 'big') * 1024
+    media_file.close()
+
+
+def test_identical_bodies_stored_once_and_fetched_once(server, tmp_path, origin):
+    directory, base_url, _ = origin
+    (directory / 'a.png').write_bytes(b'same' * 100)
+    (directory / 'b.png').write_bytes(b'same' * 100)
+    cache = make_cache(server, tmp_path, origin)
+    hashes = set()
+    for name in ('a.png', 'b.png', 'a.png'):
+        media_file, content_type, content_hash = cache.open_object(f'{base_url}/{name}', 5)
+        media_file.close()
+        assert content_type == 'image/png'
+        hashes.add(content_hash)
+    assert len(hashes) == 1
+    assert os.listdir(cache.objects_dir) == list(hashes)
+    assert len(os.listdir(cache.urls_dir)) == 2
+    assert OriginHandler.paths == ['/a.png', '/b.png']
+
+
+def test_oversized_and_missing_objects_are_not_cached(server, tmp_path, origin):
+    directory, base_url, _ = origin
+    (directory / 'big.mp4').write_bytes(b'v' * 5000)
+    cache = make_cache(server, tmp_path, origin, max_object_bytes=4096)
+
+    for _ in range(2):
+        with pytest.raises(server.MediaTooLarge):
+            cache.open_object(f'{base_url}/big.mp4', 5)
+    # Known oversized URLs go straight to the fallback without another origin fetch
+    assert OriginHandler.paths == ['/big.mp4']
+
+    with pytest.raises(OSError):
+        cache.open_object(f'{base_url}/missing.jpg', 5)
+    assert [name for name in os.listdir(cache.objects_dir) if not name.endswith('.tmp')] == []
+    assert os.listdir(cache.urls_dir) == []
+    assert cache.get_stats()['origin_errors'] == 2
+
+
+@pytest.fixture
+def proxy(server, tmp_path, origin, monkeypatch):
+    """Point the media endpoint at a cache of the origin, return (proxy path of a photo, its body)"""
+    directory, base_url, _ = origin
+    body = bytes(range(256)) * 4
+    (directory / 'photo.jpg').write_bytes(body)
+    monkeypatch.setattr(server, 'media_cache', make_cache(server, tmp_path, origin))
+
+    with server.app.test_request_context():
+        return urlparse(server.proxy_media_url(f'{base_url}/photo.jpg')).path, body
+
+
+def test_proxy_serves_full_body_and_byte_ranges(client, proxy):
+    path, body = proxy
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.get_data() == body
+    assert response.headers['Content-Type'] == 'image/jpeg'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    response = client.get(path, headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.get_data() == body[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(body)}'
+    assert response.headers['Content-Length'] == '10'
+
+    response = client.get(path, headers={'Range': f'bytes={len(body) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(body)}'
+
+
+def test_proxy_answers_matching_etag_with_304(client, proxy):
+    path, _ = proxy
+    etag = client.get(path).headers['ETag']
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert client.get(path, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_proxy_rejects_bad_signatures_and_other_hosts(server, client, proxy):
+    path, _ = proxy
+    parts = path.split('/')
+    signature = parts[3]
+    parts[3] = ('1' if signature[0] == '0' else '0') + signature[1:]
+    assert client.get('/'.join(parts)).status_code == 403
+
+    # Correctly signed, but not a host the proxy may fetch from
+    other = 'https://example.com/photo.jpg'
+    token = base64.urlsafe_b64encode(other.encode('utf-8')).rstrip(b'=').decode('ascii')
+    response = client.get(f'/api/media/{server.media_cache.sign(other)}/{token}/photo.jpg')
+    assert response.status_code == 403
+    assert OriginHandler.paths == []
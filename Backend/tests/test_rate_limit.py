@@ -0,0 +1,41 @@
+"""Sliding-window rate limit stores"""
+
+import secrets
+
+
+def test_memory_store_is_capped_and_evicts_least_recent(server):
+    store = server.MemoryRateLimitStore(max_keys=3)
+    for key in ('a', 'b', 'c'):
+        assert store.hit(key, 10, 60) == (True, 0)
+    store.hit('a', 10, 60)
+    for key in ('d', 'e'):
+        store.hit(key, 10, 60)
+
+    assert len(store.buckets) == 3
+    assert list(store.buckets) == ['a', 'd', 'e']
+    assert store.buckets['a'][1] == 2
+
+
+def test_rejected_hits_are_not_counted(server):
+    key = f'test:{secrets.token_hex(4)}'
+    for store in (server.MemoryRateLimitStore(), server.PostgresRateLimitStore):
+        results = [store.hit(key, 3, 3600)[0] for _ in range(10)]
+        assert results == [True] * 3 + [False] * 7
+
+    hits = server.handle_database_operation(lambda cursor: cursor.execute(
+        'SELECT hits FROM rate_limit_counters WHERE bucket_key = %s', (key,)).fetchone())
+    assert hits == (3,)
+
+
+def test_rules_only_count_when_all_allow(server):
+    tight, loose = f'test:{secrets.token_hex(4)}', f'test:{secrets.token_hex(4)}'
+    rules = [(loose, 10, 3600), (tight, 2, 3600)]
+    for store in (server.MemoryRateLimitStore(), server.PostgresRateLimitStore):
+        results = [store.hit_all(rules)[0] for _ in range(5)]
+        assert results == [True] * 2 + [False] * 3
+        assert store.hit_all([(loose, 10, 3600)], count=False) == (True, 0)
+
+    hits = server.handle_database_operation(lambda cursor: cursor.execute(
+        'SELECT bucket_key, hits FROM rate_limit_counters WHERE bucket_key = ANY(%s)',
+        ([tight, loose],)).fetchall())
+    assert sorted(hits) == sorted([(tight, 2), (loose, 2)])
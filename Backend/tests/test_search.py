@@ -0,0 +1,32 @@
+"""Search only returns tweets from unexpired timelines the caller can fetch"""
+
+import pytest
+
+
+@pytest.fixture
+def store(server):
+    if server.tweet_store.layout != 'normalized':
+        pytest.skip('search requires the normalized layout')
+    return server.tweet_store
+
+
+def test_search_is_scoped_to_shared_unexpired_timelines(server, client, store, make_users):
+    (shared, (shared_id, _)), (_, (hidden_id, _)), (_, (expired_id, _)), (_, (viewer_id, headers)) = \
+        sorted(make_users(4).items())
+    word = f'needle{viewer_id}'
+
+    def setup(cursor):
+        for owner_id in (shared_id, expired_id):
+            cursor.execute('INSERT INTO feed_fetches (user_id, fetch_from_id) VALUES (%s, %s)', (viewer_id, owner_id))
+        for n, owner_id in enumerate((shared_id, hidden_id, expired_id), 1):
+            tweets = [{'tweet_id': f'{viewer_id}-{n}', 'text': f'a {word} b', 'username': 'x'}]
+            store.store_timeline(cursor, viewer_id, owner_id, tweets)
+        cursor.execute("UPDATE user_tweets SET expires_at = CURRENT_TIMESTAMP - INTERVAL '1 minute' "
+                       'WHERE user_id = %s AND fetched_from_id = %s', (viewer_id, expired_id))
+    server.handle_database_operation(setup)
+    server.share_graph.load()
+
+    response = client.get('/api/search', query_string={'q': word}, headers=headers)
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [(r['tweet']['tweet_id'], r['source_user']) for r in results] == [(f'{viewer_id}-1', shared)]
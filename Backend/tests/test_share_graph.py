@@ -0,0 +1,97 @@
+"""The in-process share graph must answer exactly like the SQL it replaces"""
+
+import random
+
+import pytest
+
+
+def sql_usernames(server, query, username):
+    def run(cursor):
+        return sorted(row[0] for row in server.execute_hot(cursor, query, (username,)).fetchall())
+    return server.handle_database_operation(run)
+
+
+def listed(client, path, headers):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    return sorted(entry['username'] for entry in response.get_json())
+
+
+def assert_matches_sql(server, client, users):
+    assert server.share_graph.loaded
+    for username, (_, headers) in users.items():
+        assert listed(client, '/api/shared-users', headers) == sql_usernames(server, 'shared_users', username)
+        assert listed(client, '/api/fetch-users', headers) == sql_usernames(server, 'fetch_users', username)
+    assert server.share_graph.verify() == {}
+
+
+def test_graph_matches_sql_after_random_changes(server, client, make_users):
+    users = make_users(8)
+    names = sorted(users)
+    rng = random.Random(29)
+
+    for _ in range(60):
+        owner = rng.choice(names)
+        headers = users[owner][1]
+        others = [name for name in names if name != owner]
+        action = rng.choice(('share', 'unshare', 'share_batch', 'unshare_batch'))
+        if action == 'share':
+            response = client.post('/api/share-feed', json={'share_with': rng.choice(others)}, headers=headers)
+        elif action == 'unshare':
+            response = client.delete(f'/api/unshare-feed/{rng.choice(others)}', headers=headers)
+        else:
+            batch = rng.sample(others, rng.randint(1, len(others)))
+            response = client.post(f'/api/{action.replace("_", "-feed/")}', json={'usernames': batch},
+                                   headers=headers)
+        assert response.status_code == 200, response.get_json()
+
+    assert_matches_sql(server, client, users)
+
+
+def test_access_check_confirms_index_hits_without_bus(server, client, make_users):
+    if server.invalidation_bus.is_listening():
+        pytest.skip('indexed access hits are trusted while the invalidation bus is on')
+    owner, viewer = sorted(make_users(2).items())
+    owner_name, (owner_id, owner_headers) = owner
+    viewer_name, (viewer_id, viewer_headers) = viewer
+
+    assert client.post('/api/share-feed', json={'share_with': viewer_name}, headers=owner_headers).status_code == 200
+
+    # Another worker revokes the share; without the bus this worker never hears about it
+    def revoke(cursor):
+        cursor.execute('DELETE FROM feed_shares WHERE owner_id = %s AND shared_with_id = %s', (owner_id, viewer_id))
+        cursor.execute('DELETE FROM feed_fetches WHERE user_id = %s AND fetch_from_id = %s', (viewer_id, owner_id))
+    server.handle_database_operation(revoke)
+    assert server.share_graph.can_fetch(viewer_id, owner_id)
+
+    response = client.post(f'/api/fetch-feed/{owner_name}', headers=viewer_headers)
+    assert response.status_code == 400
+    assert 'access' in response.get_json()['error']
+
+    # The periodic reload brings the index back in line with SQL
+    server.share_graph.load()
+    assert not server.share_graph.can_fetch(viewer_id, owner_id)
+    assert server.share_graph.verify() == {}
+
+
+def test_without_bus_share_lists_read_sql_and_access_checks_leave_the_index_alone(server, client, make_users):
+    if server.invalidation_bus.is_listening():
+        pytest.skip('share lists are served from the index while the invalidation bus is on')
+    owner, viewer = sorted(make_users(2).items())
+    owner_name, (owner_id, owner_headers) = owner
+    viewer_name, (viewer_id, viewer_headers) = viewer
+    assert client.post('/api/share-feed', json={'share_with': viewer_name}, headers=owner_headers).status_code == 200
+
+    # An index that missed a share made elsewhere: lists still come from SQL
+    server.share_graph.remove_share(owner_id, viewer_id)
+    assert listed(client, '/api/fetch-users', viewer_headers) == [owner_name]
+    assert listed(client, '/api/shared-users', owner_headers) == [viewer_name]
+
+    # The SQL access check, possibly on a lagging replica, is not written back
+    response = client.post(f'/api/fetch-feed/{owner_name}', headers=viewer_headers)
+    assert response.status_code == 400
+    assert 'cookies' in response.get_json()['error']
+    assert not server.share_graph.can_fetch(viewer_id, owner_id)
+
+    server.share_graph.load()
+    assert server.share_graph.can_fetch(viewer_id, owner_id)
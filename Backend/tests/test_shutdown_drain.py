@@ -0,0 +1,60 @@
+"""Draining a worker hands its crawl off, and the next claim resumes it"""
+
+import asyncio
+import threading
+
+
+def tweets(*ids):
+    return [{'tweet_id': str(i), 'text': f'tweet {i}', 'username': 'owner'} for i in ids]
+
+
+def test_drain_saves_partial_timeline_and_next_claim_resumes(server, queue, make_users, crawl):
+    (_, (viewer_id, _)), (owner, (owner_id, _)) = sorted(make_users(2).items())
+
+    def setup(cursor):
+        server.save_user_cookies(cursor, owner, {'auth_token': 'x', 'ct0': 'y'})
+        return queue.enqueue(cursor, viewer_id, owner_id)[0]
+    job_id = server.handle_database_operation(setup)
+
+    def job_row():
+        return server.handle_database_operation(lambda cursor: cursor.execute(
+            'SELECT status, attempts, resume_cursor FROM fetch_jobs WHERE id = %s', (job_id,)).fetchone())
+
+    def cached_ids():
+        stored = server.handle_database_operation(
+            lambda cursor: server.tweet_store.load_timeline(cursor, viewer_id, owner_id))
+        return [tweet['tweet_id'] for tweet in stored[0]]
+
+    first_page = threading.Event()
+
+    async def slow_crawl(progress):
+        progress.tweets.extend(tweets(1, 2))
+        progress.cursor = 'page-2'
+        first_page.set()
+        await asyncio.sleep(60)
+    crawl(slow_crawl)
+
+    pool = server.FetchWorkerPool(queue, 1, 0.05)
+    pool.start()
+    assert first_page.wait(10)
+    pool.drain(timeout=0.2, handoff_timeout=5)
+
+    assert job_row() == ('queued', 0, 'page-2')
+    assert cached_ids() == ['1', '2']
+    assert pool.get_stats()['handed_off'] == 1
+
+    resumed_from = []
+
+    async def resume_crawl(progress):
+        resumed_from.append(([tweet['tweet_id'] for tweet in progress.tweets], progress.cursor))
+        progress.tweets.extend(tweets(3))
+        return progress.tweets
+    crawl(resume_crawl)
+
+    job = server.handle_database_operation(queue.claim)
+    assert job[0] == job_id and job[4] == 'page-2'
+    server.FetchWorkerPool(queue, 0, 1).process(*job)
+
+    assert resumed_from == [(['1', '2'], 'page-2')]
+    assert job_row()[:2] == ('done', 1)
+    assert cached_ids() == ['1', '2', '3']
@@ -1,14 +1,31 @@
 // content.js
 
 const tweetsStore = {};
+const feedVersions = {};
+// Tweets already on the page, so a resent tweet is never injected twice
+const injectedTweetIds = new Set();
+const tweetKey = (tweet) => String(tweet.tweet_id || tweet.url);
 
 // Listen for load/restore commands
-chrome.runtime.onMessage.addListener((msg) => {
-  if (msg.type === 'loadFeed') {
-    tweetsStore[msg.source] = msg.tweets;
+chrome.runtime.onMessage.addListener((msg, sender, sendResponse) => {
+  if (msg.type === 'getFeedVersion') {
+    // Delta sync watermark for the tweets this page already shows
+    sendResponse({ version: feedVersions[msg.source] || 0 });
+  }
+  else if (msg.type === 'loadFeed') {
+    const incoming = new Set(msg.tweets.map(tweetKey));
+    tweetsStore[msg.source] = msg.delta
+      ? msg.tweets.concat((tweetsStore[msg.source] || []).filter(tweet => !incoming.has(tweetKey(tweet))))
+      : msg.tweets;
+    if (msg.version) {
+      feedVersions[msg.source] = msg.version;
+    }
     tryInject(msg.tweets);
   }
   else if (msg.type === 'restoreFeed' && msg.disable) {
+    // Injected tweets are gone, so the next load must be a full one
+    Object.keys(feedVersions).forEach(source => delete feedVersions[source]);
+    injectedTweetIds.clear();
     // Remove all injected tweets and stop further injection
     const container = document.getElementById('injected-tweets-container');
     if (container) {
@@ -36,11 +53,15 @@ chrome.runtime.onMessage.addListener((msg) => {
     const tryInject = (tweets) => {
       const feed = document.querySelector('div[data-testid="primaryColumn"] section > div > div');
       if (!feed) {
-        setTimeout(tryInject, 1000);
+        setTimeout(() => tryInject(tweets), 1000);
         return;
       }
 
       tweets.forEach(tweet => {
+        if (injectedTweetIds.has(tweetKey(tweet))) {
+          return;
+        }
+        injectedTweetIds.add(tweetKey(tweet));
         const fakeTweet = document.createElement("div");
         fakeTweet.setAttribute("data-testid", "tweet");
         fakeTweet.className = "fake-tweet";
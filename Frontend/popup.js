@@ -578,10 +578,24 @@ class AuthExtension {
     }
 
     //load friend's feed
+    // Ask the page which timeline version of this feed it already shows
+    getFeedVersion(username) {
+        return new Promise((resolve) => {
+            chrome.tabs.query({active: true, currentWindow: true}, (tabs) => {
+                if (!tabs[0]) return resolve(0);
+                chrome.tabs.sendMessage(tabs[0].id, {type: 'getFeedVersion', source: username}, (reply) => {
+                    resolve(chrome.runtime.lastError || !reply ? 0 : reply.version);
+                });
+            });
+        });
+    }
+
     async handleLoadFeed(username) {
         this.showLoading(true);
         try {
-            const response = await fetch(`${this.apiUrl}/api/fetch-feed/${encodeURIComponent(username)}`, {
+            const sinceVersion = await this.getFeedVersion(username);
+            const query = sinceVersion ? `?since_version=${sinceVersion}` : '';
+            const response = await fetch(`${this.apiUrl}/api/fetch-feed/${encodeURIComponent(username)}${query}`, {
             method: 'POST',
             headers: {
                 'Authorization': `Bearer ${this.token}`,
@@ -596,10 +610,14 @@ class AuthExtension {
             chrome.tabs.sendMessage(tabs[0].id, {
                 type: 'loadFeed',
                 tweets: data.tweets,
-                source: data.source_user
+                source: data.source_user,
+                version: data.version,
+                delta: data.delta
             });
             });
-            this.showSuccess(`Loaded ${data.count} tweets from ${username}`);  
+            this.showSuccess(data.delta
+                ? `Loaded ${data.count} new tweets from ${username}`
+                : `Loaded ${data.count} tweets from ${username}`);  
         } catch (err) {
             this.showError(err.message);
         } finally {